@@ -1,3 +1,21 @@
 from django.contrib import admin
+from django.utils import timezone
+
+from .models import TarefaCalendario
 
 # Register your models here.
+
+@admin.register(TarefaCalendario)
+class TarefaCalendarioAdmin(admin.ModelAdmin):
+    """Fila de sincronização com o Google Agenda"""
+    list_display = ['aula_id', 'acao', 'status', 'tentativas', 'proxima_tentativa', 'data_criacao', 'data_conclusao']
+    list_filter = ['status', 'acao']
+    search_fields = ['aula_id']
+    readonly_fields = ['data_criacao', 'data_conclusao']
+    actions = ['reprocessar']
+
+    def reprocessar(self, request, queryset):
+        """Coloca as tarefas com erro de volta na fila"""
+        count = queryset.filter(status='ERRO').update(status='PENDENTE', tentativas=0, proxima_tentativa=timezone.now())
+        self.message_user(request, f'{count} tarefa(s) colocada(s) na fila novamente.')
+    reprocessar.short_description = 'Reprocessar tarefas com erro'
@@ -0,0 +1,127 @@
+"""
+Credenciais do Google guardadas em memória pelo worker da agenda.
+
+Antes, cada uso fazia Credentials.from_authorized_user_info(get_token()),
+relendo o token_json, e o token renovado durante a chamada se perdia: toda
+chamada seguinte precisava renovar de novo.
+
+O GerenciadorCredenciais mantém as Credentials de cada GoogleCalendarCredential
+enquanto o banco não tiver uma versão mais nova (updated_at). Antes de usar um
+lote de credenciais, o worker renova as que vencem em menos de MARGEM_RENOVACAO
+(renovar_expirando), então nenhuma renovação acontece no meio de uma
+requisição. Tokens renovados, aqui ou pelo AuthorizedHttp durante um batch,
+são gravados de volta em uma única consulta (persistir). A gravação só vale
+para as linhas que não mudaram desde a leitura, para não sobrescrever uma
+reconexão feita pelo aluno nesse meio tempo.
+"""
+import threading
+from collections import OrderedDict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db.models import Case, Q, TextField, Value, When
+from django.utils import timezone
+from google.auth.exceptions import GoogleAuthError
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+
+from .models import GoogleCalendarCredential
+
+MARGEM_RENOVACAO = timedelta(minutes=5)
+MAX_CREDENCIAIS = 256
+
+
+class _Item:
+    __slots__ = ('credentials', 'atualizado_em', 'token_salvo')
+
+    def __init__(self, credentials, atualizado_em):
+        self.credentials = credentials
+        self.atualizado_em = atualizado_em
+        self.token_salvo = credentials.token
+
+
+class GerenciadorCredenciais:
+
+    def __init__(self, margem=MARGEM_RENOVACAO, transporte=Request, relogio=timezone.now, maximo=MAX_CREDENCIAIS):
+        self.margem = margem
+        self.transporte = transporte
+        self.relogio = relogio
+        self.maximo = maximo
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, credencial):
+        """Credentials da credencial; o token_json só é lido de novo se o banco tiver uma versão mais nova"""
+        with self._lock:
+            item = self._itens.get(credencial.pk)
+            if item is not None and item.atualizado_em >= credencial.updated_at:
+                self._itens.move_to_end(credencial.pk)
+                return item.credentials
+
+        credentials = Credentials.from_authorized_user_info(credencial.get_token())
+        with self._lock:
+            self._itens[credencial.pk] = _Item(credentials, credencial.updated_at)
+            self._itens.move_to_end(credencial.pk)
+            while len(self._itens) > self.maximo:
+                self._itens.popitem(last=False)
+        return credentials
+
+    def expirando(self, credentials):
+        if credentials.expiry is None:
+            return False
+        # Credentials.expiry é UTC sem fuso
+        agora = self.relogio().astimezone(dt_timezone.utc).replace(tzinfo=None)
+        return credentials.expiry - self.margem <= agora
+
+    def renovar_expirando(self, credenciais):
+        """
+        Renova os tokens que vencem em menos de `margem`, antes de usá-los.
+        Retorna {credencial.pk: erro} das que não puderam ser renovadas.
+        """
+        erros = {}
+        for credencial in credenciais:
+            credentials = self.obter(credencial)
+            if not credentials.refresh_token or not self.expirando(credentials):
+                continue
+            try:
+                credentials.refresh(self.transporte())
+            except GoogleAuthError as e:
+                erros[credencial.pk] = e
+        return erros
+
+    def persistir(self):
+        """Grava em uma consulta os tokens renovados desde a última gravação. Retorna quantos foram gravados"""
+        with self._lock:
+            alterados = {
+                pk: (item, item.credentials.token, item.credentials.to_json())
+                for pk, item in self._itens.items()
+                if item.credentials.token != item.token_salvo
+            }
+        if not alterados:
+            return 0
+
+        agora = timezone.now()
+        GoogleCalendarCredential.objects.filter(
+            Q(*[Q(pk=pk, updated_at=item.atualizado_em) for pk, (item, _, _) in alterados.items()], _connector=Q.OR)
+        ).update(
+            token_json=Case(
+                *[When(pk=pk, then=Value(token_json)) for pk, (_, _, token_json) in alterados.items()],
+                output_field=TextField(),
+            ),
+            updated_at=agora,
+        )
+        gravados = set(GoogleCalendarCredential.objects.filter(
+            pk__in=list(alterados), updated_at=agora
+        ).values_list('pk', flat=True))
+
+        with self._lock:
+            for pk, (item, token, _) in alterados.items():
+                if pk in gravados:
+                    item.token_salvo = token
+                    item.atualizado_em = agora
+                elif self._itens.get(pk) is item:
+                    # O aluno reconectou enquanto isso: vale o que está no banco
+                    del self._itens[pk]
+        return len(gravados)
+
+
+gerenciador = GerenciadorCredenciais()
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from calendario.sincronizacao import processar_tarefas_pendentes
+
+class Command(BaseCommand):
+    help = 'Sincroniza as aulas com o Google Agenda dos alunos (fila TarefaCalendario)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limite',
+            type=int,
+            default=100,
+            help='Tarefas por rodada (padrão: 100)'
+        )
+        parser.add_argument(
+            '--continuo',
+            action='store_true',
+            help='Fica rodando e verifica a fila a cada --intervalo segundos'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=10,
+            help='Segundos entre rodadas no modo contínuo (padrão: 10)'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            contagem = processar_tarefas_pendentes(limite=options['limite'])
+            if contagem:
+                resumo = ', '.join(f'{status}: {total}' for status, total in sorted(contagem.items()))
+                self.stdout.write(self.style.SUCCESS(f'✅ Tarefas processadas ({resumo})'))
+            elif not options['continuo']:
+                self.stdout.write(self.style.SUCCESS('✅ Nenhuma tarefa pendente'))
+
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
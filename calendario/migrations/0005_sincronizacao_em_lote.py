@@ -0,0 +1,60 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendario', '0004_remove_googlecalendarcredential_event_id'),
+        ('paginas', '0016_preferencia_pagamento'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TarefaCalendario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('aula_id', models.BigIntegerField()),
+                ('acao', models.CharField(choices=[('SINCRONIZAR', 'Sincronizar'), ('EXCLUIR', 'Excluir')], default='SINCRONIZAR', max_length=20)),
+                ('eventos', models.JSONField(blank=True, default=list, help_text='EXCLUIR: eventos a apagar [{usuario_id, google_event_id}]')),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('PROCESSANDO', 'Processando'), ('CONCLUIDA', 'Concluída'), ('ERRO', 'Erro')], default='PENDENTE', max_length=20)),
+                ('tentativas', models.PositiveIntegerField(default=0)),
+                ('proxima_tentativa', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ultimo_erro', models.TextField(blank=True)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('data_conclusao', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Tarefa do Google Agenda',
+                'verbose_name_plural': 'Tarefas do Google Agenda',
+                'ordering': ['-data_criacao'],
+            },
+        ),
+        migrations.AddField(
+            model_name='googlecalendarevent',
+            name='usuario',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='google_eventos', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='googlecalendarevent',
+            name='aula',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='google_eventos', to='paginas.aula'),
+        ),
+        migrations.AddConstraint(
+            model_name='googlecalendarevent',
+            constraint=models.UniqueConstraint(fields=('aula', 'usuario'), name='evento_google_unico_por_aluno'),
+        ),
+        migrations.AddIndex(
+            model_name='tarefacalendario',
+            index=models.Index(fields=['status', 'proxima_tentativa'], name='calendario__status_641dbb_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='tarefacalendario',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'PENDENTE')), fields=('aula_id', 'acao'), name='tarefa_calendario_pendente_unica'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 import json
 
 # Create your models here.
@@ -22,9 +23,63 @@ class GoogleCalendarCredential(models.Model):
         self.save()
         
 class GoogleCalendarEvent(models.Model):
-    aula = models.OneToOneField('paginas.Aula', on_delete=models.CASCADE, related_name='google_evento')
+    # Um evento por aluno: cada um recebe a aula na própria agenda
+    aula = models.ForeignKey('paginas.Aula', on_delete=models.CASCADE, related_name='google_eventos')
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='google_eventos', null=True)
     google_event_id = models.CharField(max_length=255, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['aula', 'usuario'], name='evento_google_unico_por_aluno'),
+        ]
+
+    def __str__(self):
+        return f"Evento Google da aula {self.aula}"
+
+
+class TarefaCalendario(models.Model):
+    """
+    Fila de sincronização das aulas com o Google Agenda.
+    Os sinais de Aula só gravam a tarefa; o comando sincronizar_calendario
+    cria, atualiza ou apaga os eventos dos alunos em lote (calendario.sincronizacao).
+    """
+    ACOES = [
+        ('SINCRONIZAR', 'Sincronizar'),
+        ('EXCLUIR', 'Excluir'),
+    ]
+    STATUS_CHOICES = [
+        ('PENDENTE', 'Pendente'),
+        ('PROCESSANDO', 'Processando'),
+        ('CONCLUIDA', 'Concluída'),
+        ('ERRO', 'Erro'),
+    ]
+
+    # Sem FK: a tarefa de exclusão continua existindo depois que a aula é apagada
+    aula_id = models.BigIntegerField()
+    acao = models.CharField(max_length=20, choices=ACOES, default='SINCRONIZAR')
+    eventos = models.JSONField(default=list, blank=True, help_text='EXCLUIR: eventos a apagar [{usuario_id, google_event_id}]')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDENTE')
+    tentativas = models.PositiveIntegerField(default=0)
+    proxima_tentativa = models.DateTimeField(default=timezone.now)
+    ultimo_erro = models.TextField(blank=True)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_conclusao = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Tarefa do Google Agenda'
+        verbose_name_plural = 'Tarefas do Google Agenda'
+        ordering = ['-data_criacao']
+        constraints = [
+            # Várias alterações da mesma aula antes da sincronização viram uma tarefa só
+            models.UniqueConstraint(
+                fields=['aula_id', 'acao'], condition=models.Q(status='PENDENTE'),
+                name='tarefa_calendario_pendente_unica',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'proxima_tentativa']),
+        ]
+
     def __str__(self):
-        return f"Evento Google da aula {self.aula}"
\ No newline at end of file
+        return f"{self.get_acao_display()} aula {self.aula_id} - {self.get_status_display()}"
\ No newline at end of file
@@ -0,0 +1,36 @@
+"""
+Sinais do app calendario.
+
+Mantêm o Google Agenda dos alunos em dia com as aulas sem fazer chamadas
+HTTP no save: só gravam tarefas na fila de calendario.sincronizacao.
+"""
+from django.db.models.signals import post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from paginas.models import Aula
+
+from . import sincronizacao
+from .models import GoogleCalendarEvent
+
+
+@receiver(post_init, sender=Aula)
+def guardar_campos_do_evento(sender, instance, **kwargs):
+    instance._campos_calendario = sincronizacao.campos_do_evento(instance)
+
+
+@receiver(post_save, sender=Aula)
+def enfileirar_sincronizacao_aula(sender, instance, created, raw=False, **kwargs):
+    # Upload de vídeo, marcar como realizada etc. não mudam o evento
+    campos = sincronizacao.campos_do_evento(instance)
+    if not raw and (created or campos != getattr(instance, '_campos_calendario', None)):
+        sincronizacao.enfileirar_sincronizacao([instance.pk])
+    instance._campos_calendario = campos
+
+
+@receiver(pre_delete, sender=Aula)
+def enfileirar_exclusao_aula(sender, instance, **kwargs):
+    # Os eventos são apagados em cascata com a aula: guarda os ids na tarefa
+    eventos = list(
+        GoogleCalendarEvent.objects.filter(aula=instance, usuario__isnull=False).values('usuario_id', 'google_event_id')
+    )
+    sincronizacao.enfileirar_exclusao(instance.pk, eventos)
@@ -0,0 +1,358 @@
+"""
+Sincronização das aulas com o Google Agenda dos alunos.
+
+Fila:
+    Salvar ou apagar uma Aula não faz nenhuma chamada HTTP. Os sinais
+    (calendario/signals.py) só gravam uma TarefaCalendario: SINCRONIZAR
+    quando a aula é criada ou muda de turma, data, horário ou tema, e
+    EXCLUIR (com os ids dos eventos) quando ela é apagada.
+
+Processamento (comando sincronizar_calendario):
+    processar_tarefas_pendentes() reserva um lote de tarefas e monta as
+    operações de todas elas: inserir, atualizar ou apagar o evento de cada
+    aluno com o Google conectado. As operações são agrupadas por credencial
+    e enviadas em batch HTTP do Google (até TAMANHO_BATCH por requisição).
+    Uma tarefa com falha volta para a fila com backoff exponencial e jitter.
+    Como a tarefa compara o estado da aula com os eventos gravados,
+    repeti-la não duplica eventos.
+
+O documento de descoberta da API é lido uma vez por processo (vem embutido
+no googleapiclient) e o serviço montado é guardado por credencial. As
+Credentials vêm do calendario.credenciais: os tokens perto de vencer são
+renovados antes do batch e os renovados são gravados de volta em lote no
+fim da rodada.
+"""
+import threading
+from collections import OrderedDict, defaultdict, namedtuple
+from datetime import datetime, timedelta
+
+import google_auth_httplib2
+import httplib2
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+
+from paginas.filas import calcular_backoff
+from paginas.models import Aluno, Aula
+
+from .credenciais import gerenciador as gerenciador_padrao
+from .models import GoogleCalendarCredential, GoogleCalendarEvent, TarefaCalendario
+
+FUSO_HORARIO = 'America/Sao_Paulo'
+# Limite do Google Agenda por requisição em batch
+TAMANHO_BATCH = 50
+TIMEOUT_HTTP_SEGUNDOS = 30
+MAX_TENTATIVAS = 6
+BACKOFF_BASE_SEGUNDOS = 60
+BACKOFF_MAXIMO_SEGUNDOS = 6 * 60 * 60
+# Tempo que uma tarefa fica reservada antes de poder ser retomada
+TEMPO_RESERVA_SEGUNDOS = 10 * 60
+# Serviços guardados (um por credencial)
+MAX_SERVICOS = 256
+
+# Campos da aula que aparecem no evento
+CAMPOS_DO_EVENTO = ('turma_id', 'data', 'hora_inicio', 'hora_fim', 'tema')
+
+Operacao = namedtuple('Operacao', 'tipo tarefa_id aula_id usuario_id event_id corpo')
+
+
+# ---------------------------------------------------------
+# FILA
+# ---------------------------------------------------------
+
+def campos_do_evento(aula):
+    """Valores que, se mudarem, exigem atualizar o evento (lidos de __dict__)"""
+    return tuple(aula.__dict__.get(campo) for campo in CAMPOS_DO_EVENTO)
+
+
+def enfileirar_sincronizacao(aula_ids):
+    """Agenda a sincronização das aulas (uma tarefa pendente por aula)"""
+    TarefaCalendario.objects.bulk_create(
+        [TarefaCalendario(aula_id=aula_id, acao='SINCRONIZAR') for aula_id in set(aula_ids)],
+        ignore_conflicts=True,
+    )
+
+
+def enfileirar_exclusao(aula_id, eventos):
+    """Agenda a exclusão dos eventos [{usuario_id, google_event_id}] de uma aula"""
+    if not eventos:
+        return
+    with transaction.atomic():
+        pendente = TarefaCalendario.objects.select_for_update().filter(
+            aula_id=aula_id, acao='EXCLUIR', status='PENDENTE'
+        ).first()
+        if pendente:
+            pendente.eventos = pendente.eventos + list(eventos)
+            pendente.save(update_fields=['eventos'])
+        else:
+            TarefaCalendario.objects.create(aula_id=aula_id, acao='EXCLUIR', eventos=list(eventos))
+
+
+# ---------------------------------------------------------
+# API DO GOOGLE AGENDA
+# ---------------------------------------------------------
+
+_documento = None
+_servicos = OrderedDict()
+_servicos_lock = threading.Lock()
+
+
+def _documento_descoberta():
+    global _documento
+    if _documento is None:
+        _documento = get_static_doc('calendar', 'v3')
+    return _documento
+
+
+def servico_calendario(credencial, gerenciador=None):
+    """Serviço da API para a credencial, reaproveitado enquanto as Credentials forem as mesmas"""
+    credentials = (gerenciador or gerenciador_padrao).obter(credencial)
+    with _servicos_lock:
+        guardado = _servicos.get(credencial.pk)
+        if guardado is not None and guardado[0] is credentials:
+            _servicos.move_to_end(credencial.pk)
+            return guardado[1]
+
+    # Token renovado em memória é visto pelo mesmo AuthorizedHttp; só um
+    # token novo vindo do banco (reconexão) monta outro serviço
+    http = google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http(timeout=TIMEOUT_HTTP_SEGUNDOS))
+    servico = build_from_document(_documento_descoberta(), http=http)
+
+    with _servicos_lock:
+        _servicos[credencial.pk] = (credentials, servico)
+        _servicos.move_to_end(credencial.pk)
+        while len(_servicos) > MAX_SERVICOS:
+            _servicos.popitem(last=False)
+    return servico
+
+
+class GoogleCalendarAPI:
+    """Executa operações na agenda principal do dono de uma credencial"""
+
+    def __init__(self, gerenciador=None):
+        self.gerenciador = gerenciador
+
+    def executar(self, credencial, operacoes):
+        """
+        Envia as operações em batch. Retorna uma lista (resposta, erro) na
+        mesma ordem das operações; falha de rede no batch inteiro levanta.
+        """
+        servico = servico_calendario(credencial, self.gerenciador)
+        resultados = [(None, None)] * len(operacoes)
+
+        def guardar(request_id, resposta, erro):
+            resultados[int(request_id)] = (resposta, erro)
+
+        for inicio in range(0, len(operacoes), TAMANHO_BATCH):
+            batch = servico.new_batch_http_request(callback=guardar)
+            for indice in range(inicio, min(inicio + TAMANHO_BATCH, len(operacoes))):
+                batch.add(self._requisicao(servico, operacoes[indice]), request_id=str(indice))
+            batch.execute()
+        return resultados
+
+    def _requisicao(self, servico, operacao):
+        eventos = servico.events()
+        if operacao.tipo == 'inserir':
+            return eventos.insert(calendarId='primary', body=operacao.corpo)
+        if operacao.tipo == 'atualizar':
+            return eventos.patch(calendarId='primary', eventId=operacao.event_id, body=operacao.corpo)
+        return eventos.delete(calendarId='primary', eventId=operacao.event_id)
+
+
+# ---------------------------------------------------------
+# PROCESSAMENTO
+# ---------------------------------------------------------
+
+def corpo_do_evento(aula):
+    """Evento do Google Agenda de uma aula"""
+    inicio = datetime.combine(aula.data, aula.hora_inicio).isoformat()
+    fim = datetime.combine(aula.data, aula.hora_fim).isoformat()
+    return {
+        "summary": f"Aula: {aula.turma.nome}",
+        "description": aula.tema or "Aula de dança",
+        "start": {"dateTime": inicio, "timeZone": FUSO_HORARIO},
+        "end": {"dateTime": fim, "timeZone": FUSO_HORARIO},
+    }
+
+
+def _status_http(erro):
+    return getattr(getattr(erro, 'resp', None), 'status', None)
+
+
+def _disponiveis(agora):
+    # PROCESSANDO com a reserva vencida: o worker que a pegou morreu
+    return TarefaCalendario.objects.filter(
+        Q(status='PENDENTE') | Q(status='PROCESSANDO'),
+        proxima_tentativa__lte=agora,
+    )
+
+
+def _reservar(limite):
+    agora = timezone.now()
+    reserva = agora + timedelta(seconds=TEMPO_RESERVA_SEGUNDOS)
+    ids = list(_disponiveis(agora).order_by('proxima_tentativa', 'id').values_list('id', flat=True)[:limite])
+    _disponiveis(agora).filter(pk__in=ids).update(
+        status='PROCESSANDO', tentativas=F('tentativas') + 1, proxima_tentativa=reserva
+    )
+    # A reserva serve de marca: tarefas pegas por outro worker no meio tempo ficam de fora
+    return list(TarefaCalendario.objects.filter(pk__in=ids, status='PROCESSANDO', proxima_tentativa=reserva))
+
+
+def _planejar(tarefas):
+    """Operações que levam a agenda de cada aluno ao estado atual das aulas"""
+    sincronizar = {tarefa.aula_id: tarefa for tarefa in tarefas if tarefa.acao == 'SINCRONIZAR'}
+    aulas = Aula.objects.select_related('turma').in_bulk(list(sincronizar))
+
+    conectados = defaultdict(set)
+    for turma_id, usuario_id in Aluno.turmas.through.objects.filter(
+        turma_id__in={aula.turma_id for aula in aulas.values()},
+        aluno__usuario__google_credentials__isnull=False,
+    ).values_list('turma_id', 'aluno__usuario_id'):
+        conectados[turma_id].add(usuario_id)
+
+    existentes = defaultdict(dict)
+    for aula_id, usuario_id, event_id in GoogleCalendarEvent.objects.filter(
+        aula_id__in=list(aulas), usuario__isnull=False
+    ).values_list('aula_id', 'usuario_id', 'google_event_id'):
+        existentes[aula_id][usuario_id] = event_id
+
+    operacoes = []
+    for aula_id, aula in aulas.items():
+        tarefa_id = sincronizar[aula_id].pk
+        corpo = corpo_do_evento(aula)
+        alunos = conectados[aula.turma_id]
+        for usuario_id in alunos:
+            event_id = existentes[aula_id].get(usuario_id)
+            tipo = 'atualizar' if event_id else 'inserir'
+            operacoes.append(Operacao(tipo, tarefa_id, aula_id, usuario_id, event_id, corpo))
+        # Saiu da turma (ou a aula mudou de turma)
+        for usuario_id, event_id in existentes[aula_id].items():
+            if usuario_id not in alunos:
+                operacoes.append(Operacao('excluir', tarefa_id, aula_id, usuario_id, event_id, None))
+
+    for tarefa in tarefas:
+        if tarefa.acao == 'EXCLUIR':
+            for evento in tarefa.eventos:
+                operacoes.append(Operacao(
+                    'excluir', tarefa.pk, tarefa.aula_id, evento['usuario_id'], evento['google_event_id'], None
+                ))
+    return operacoes
+
+
+def processar_tarefas_pendentes(api=None, limite=100, gerenciador=None):
+    """
+    Processa até `limite` tarefas da fila. Retorna um dict
+    {status_final: quantidade}.
+    """
+    gerenciador = gerenciador or gerenciador_padrao
+    api = api or GoogleCalendarAPI(gerenciador)
+    tarefas = _reservar(limite)
+    if not tarefas:
+        return {}
+
+    operacoes = _planejar(tarefas)
+    por_usuario = defaultdict(list)
+    for operacao in operacoes:
+        por_usuario[operacao.usuario_id].append(operacao)
+    credenciais = {
+        credencial.user_id: credencial
+        for credencial in GoogleCalendarCredential.objects.filter(user_id__in=list(por_usuario))
+    }
+
+    # Renovações ficam aqui, antes dos batches, e não no meio de uma requisição
+    erros_renovacao = gerenciador.renovar_expirando(credenciais.values())
+
+    inseridos = []
+    removidos = []
+    falhas = defaultdict(list)
+    restantes = defaultdict(list)  # exclusões que falharam, por tarefa EXCLUIR
+    for usuario_id, ops in por_usuario.items():
+        credencial = credenciais.get(usuario_id)
+        if credencial is None:
+            # Desconectou o Google: não há como mexer na agenda dele
+            removidos.extend(op.event_id for op in ops if op.event_id)
+            continue
+        if credencial.pk in erros_renovacao:
+            resultados = [(None, erros_renovacao[credencial.pk])] * len(ops)
+        else:
+            try:
+                resultados = api.executar(credencial, ops)
+            except Exception as e:
+                resultados = [(None, e)] * len(ops)
+
+        for op, (resposta, erro) in zip(ops, resultados):
+            status = _status_http(erro)
+            if op.tipo == 'excluir' and (erro is None or status in (404, 410)):
+                removidos.append(op.event_id)
+                continue
+            if erro is None:
+                if op.tipo == 'inserir':
+                    inseridos.append(GoogleCalendarEvent(
+                        aula_id=op.aula_id, usuario_id=usuario_id, google_event_id=resposta['id']
+                    ))
+                continue
+            if op.tipo == 'atualizar' and status in (404, 410):
+                # O aluno apagou o evento: é criado de novo na próxima tentativa
+                removidos.append(op.event_id)
+            falhas[op.tarefa_id].append(f'{op.tipo} (usuário {usuario_id}): {erro}')
+            if op.tipo == 'excluir':
+                restantes[op.tarefa_id].append({'usuario_id': usuario_id, 'google_event_id': op.event_id})
+
+    # Tokens renovados nesta rodada (aqui ou pelo AuthorizedHttp) em uma consulta
+    gerenciador.persistir()
+    _gravar_eventos(inseridos, removidos)
+    return _finalizar(tarefas, falhas, restantes)
+
+
+def _gravar_eventos(inseridos, removidos):
+    if removidos:
+        GoogleCalendarEvent.objects.filter(google_event_id__in=removidos).delete()
+    if not inseridos:
+        return
+    # A aula pode ter sido apagada enquanto os eventos eram criados
+    vivas = set(Aula.objects.filter(pk__in={e.aula_id for e in inseridos}).values_list('pk', flat=True))
+    GoogleCalendarEvent.objects.bulk_create([e for e in inseridos if e.aula_id in vivas], ignore_conflicts=True)
+    orfaos = defaultdict(list)
+    for evento in inseridos:
+        if evento.aula_id not in vivas:
+            orfaos[evento.aula_id].append({'usuario_id': evento.usuario_id, 'google_event_id': evento.google_event_id})
+    for aula_id, eventos in orfaos.items():
+        enfileirar_exclusao(aula_id, eventos)
+
+
+def _finalizar(tarefas, falhas, restantes):
+    contagem = defaultdict(int)
+    agora = timezone.now()
+    concluidas = [tarefa.pk for tarefa in tarefas if tarefa.pk not in falhas]
+    if concluidas:
+        TarefaCalendario.objects.filter(pk__in=concluidas).update(
+            status='CONCLUIDA', ultimo_erro='', data_conclusao=agora
+        )
+        contagem['CONCLUIDA'] = len(concluidas)
+
+    for tarefa in tarefas:
+        if tarefa.pk not in falhas:
+            continue
+        erro = '\n'.join(falhas[tarefa.pk][:20])
+        campos = {'ultimo_erro': erro}
+        if tarefa.acao == 'EXCLUIR':
+            campos['eventos'] = restantes[tarefa.pk]
+
+        if tarefa.tentativas >= MAX_TENTATIVAS:
+            status = 'ERRO'
+        elif TarefaCalendario.objects.filter(aula_id=tarefa.aula_id, acao=tarefa.acao, status='PENDENTE').exists():
+            # Já existe uma tarefa mais nova na fila para a mesma aula: ela assume o trabalho
+            if tarefa.acao == 'EXCLUIR':
+                enfileirar_exclusao(tarefa.aula_id, restantes[tarefa.pk])
+            status = 'CONCLUIDA'
+            campos.update(data_conclusao=agora, ultimo_erro=f'Substituída por uma tarefa mais nova. {erro}')
+        else:
+            status = 'PENDENTE'
+            campos['proxima_tentativa'] = agora + calcular_backoff(
+                tarefa.tentativas, BACKOFF_BASE_SEGUNDOS, BACKOFF_MAXIMO_SEGUNDOS
+            )
+        TarefaCalendario.objects.filter(pk=tarefa.pk).update(status=status, **campos)
+        contagem[status] += 1
+    return dict(contagem)
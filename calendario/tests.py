@@ -1,3 +1,218 @@
+import json
+from datetime import date, time, timedelta
+from itertools import count
+
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.utils import timezone
+
+from paginas.models import Aluno, Aula, Turma
+
+from . import sincronizacao
+from .credenciais import GerenciadorCredenciais
+from .models import GoogleCalendarCredential, GoogleCalendarEvent, TarefaCalendario
+from .sincronizacao import processar_tarefas_pendentes
+
+
+class ErroHttpFake(Exception):
+    def __init__(self, status):
+        super().__init__(f'HTTP {status}')
+        self.resp = type('Resposta', (), {'status': status})()
+
+
+class CalendarioFake:
+    """Google Agenda em memória: eventos por usuário e falhas programadas"""
+
+    def __init__(self, falhas=0):
+        self.eventos = {}
+        self.chamadas = []
+        self.falhas = falhas
+        self._ids = count(1)
+
+    def executar(self, credencial, operacoes):
+        self.chamadas.append((credencial.user_id, [op.tipo for op in operacoes]))
+        if self.falhas:
+            self.falhas -= 1
+            raise ConnectionError('rede indisponível')
+        resultados = []
+        for op in operacoes:
+            agenda = self.eventos.setdefault(credencial.user_id, {})
+            if op.tipo == 'inserir':
+                event_id = f'evt-{next(self._ids)}'
+                agenda[event_id] = op.corpo
+                resultados.append(({'id': event_id}, None))
+            elif op.event_id not in agenda:
+                resultados.append((None, ErroHttpFake(404)))
+            elif op.tipo == 'atualizar':
+                agenda[op.event_id] = op.corpo
+                resultados.append((dict(op.corpo, id=op.event_id), None))
+            else:
+                del agenda[op.event_id]
+                resultados.append(('', None))
+        return resultados
+
+
+TOKEN = {'refresh_token': 'r', 'client_id': 'c', 'client_secret': 's', 'token': 't', 'expiry': '2099-01-01T00:00:00Z'}
+
+
+class SincronizacaoCalendarioTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        professor = User.objects.create_user('professor')
+        cls.turma = Turma.objects.create(nome='Ballet', modalidade='BALLET', nivel='INICIANTE', professor=professor)
+        cls.usuarios = []
+        for i in range(3):
+            usuario = User.objects.create_user(f'aluno{i}')
+            aluno = Aluno.objects.create(usuario=usuario, cpf=f'000.000.000-0{i}', data_nascimento=date(2000, 1, 1))
+            aluno.turmas.add(cls.turma)
+            cls.usuarios.append(usuario)
+        # Só os dois primeiros conectaram o Google
+        for usuario in cls.usuarios[:2]:
+            GoogleCalendarCredential.objects.create(user=usuario, token_json=json.dumps(TOKEN))
+
+    def setUp(self):
+        self.api = CalendarioFake()
+
+    def _nova_aula(self):
+        return Aula.objects.create(turma=self.turma, data=date(2040, 5, 4), hora_inicio=time(19, 0), hora_fim=time(20, 0))
+
+    def test_criar_aula_so_enfileira_e_o_lote_cria_os_eventos(self):
+        aula = self._nova_aula()
+        self.assertEqual(TarefaCalendario.objects.get().aula_id, aula.pk)
+        self.assertEqual(self.api.chamadas, [])
+
+        self.assertEqual(processar_tarefas_pendentes(api=self.api), {'CONCLUIDA': 1})
+        self.assertEqual(GoogleCalendarEvent.objects.filter(aula=aula).count(), 2)
+        # Uma chamada em batch por aluno conectado
+        self.assertEqual(sorted(self.api.chamadas), sorted((u.pk, ['inserir']) for u in self.usuarios[:2]))
+
+    def test_alteracoes_atualizam_e_exclusao_apaga(self):
+        aula = self._nova_aula()
+        processar_tarefas_pendentes(api=self.api)
+
+        aula.realizada = True
+        aula.save()
+        self.assertFalse(TarefaCalendario.objects.filter(status='PENDENTE').exists())
+
+        aula.hora_inicio, aula.hora_fim = time(18, 0), time(19, 0)
+        aula.save()
+        aula.tema = 'Giros'
+        aula.save()
+        self.assertEqual(TarefaCalendario.objects.filter(status='PENDENTE').count(), 1)
+        processar_tarefas_pendentes(api=self.api)
+        agenda = self.api.eventos[self.usuarios[0].pk]
+        self.assertEqual(len(agenda), 1)
+        self.assertEqual(next(iter(agenda.values()))['description'], 'Giros')
+
+        aula.delete()
+        self.assertEqual(processar_tarefas_pendentes(api=self.api), {'CONCLUIDA': 1})
+        self.assertEqual(self.api.eventos[self.usuarios[0].pk], {})
+        self.assertFalse(GoogleCalendarEvent.objects.exists())
+
+    def test_falha_volta_para_fila_sem_duplicar(self):
+        self._nova_aula()
+        self.api.falhas = 1
+        self.assertEqual(processar_tarefas_pendentes(api=self.api), {'PENDENTE': 1})
+        tarefa = TarefaCalendario.objects.get()
+        self.assertGreater(tarefa.proxima_tentativa, timezone.now())
+        self.assertIn('rede indisponível', tarefa.ultimo_erro)
+
+        # Ainda no backoff: nada a fazer
+        self.assertEqual(processar_tarefas_pendentes(api=self.api), {})
+        TarefaCalendario.objects.update(proxima_tentativa=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(processar_tarefas_pendentes(api=self.api), {'CONCLUIDA': 1})
+        self.assertEqual(GoogleCalendarEvent.objects.count(), 2)
+        self.assertEqual(sum(len(agenda) for agenda in self.api.eventos.values()), 2)
+
+    def test_servico_reaproveitado_por_credencial(self):
+        credencial = GoogleCalendarCredential.objects.get(user=self.usuarios[0])
+        servico = sincronizacao.servico_calendario(credencial)
+        self.assertIs(sincronizacao.servico_calendario(credencial), servico)
+
+        credencial.set_token(dict(TOKEN, token='novo'))
+        self.assertIsNot(sincronizacao.servico_calendario(credencial), servico)
+
+
+class RespostaTokenFake:
+    status = 200
+    headers = {}
+
+    def __init__(self, token):
+        self.data = json.dumps({'access_token': token, 'expires_in': 3600}).encode()
+
+
+class TransporteFake:
+    """Endpoint de token do Google: devolve tokens novos e conta as renovações"""
+
+    def __init__(self, falhar=False):
+        self.renovacoes = 0
+        self.falhar = falhar
+
+    def __call__(self):
+        return self._requisicao
+
+    def _requisicao(self, url, method='GET', body=None, headers=None, **kwargs):
+        self.renovacoes += 1
+        if self.falhar:
+            resposta = RespostaTokenFake('')
+            resposta.status = 400
+            resposta.data = b'{"error": "invalid_grant"}'
+            return resposta
+        return RespostaTokenFake(f'novo-{self.renovacoes}')
+
+
+class CredenciaisTests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('aluno')
+        self.credencial = GoogleCalendarCredential.objects.create(
+            user=self.usuario, token_json=json.dumps(dict(TOKEN, expiry='2020-01-01T00:00:00Z'))
+        )
+        self.transporte = TransporteFake()
+        self.gerenciador = GerenciadorCredenciais(transporte=self.transporte)
+
+    def test_credentials_reaproveitadas_ate_mudar_no_banco(self):
+        credentials = self.gerenciador.obter(self.credencial)
+        self.assertIs(self.gerenciador.obter(GoogleCalendarCredential.objects.get()), credentials)
+
+        self.credencial.set_token(dict(TOKEN, token='reconectado'))
+        self.assertEqual(self.gerenciador.obter(self.credencial).token, 'reconectado')
+
+    def test_renova_antes_de_usar_e_grava_em_lote(self):
+        outro = GoogleCalendarCredential.objects.create(
+            user=User.objects.create_user('outro'), token_json=json.dumps(dict(TOKEN, expiry='2020-01-01T00:00:00Z'))
+        )
+        self.assertEqual(self.gerenciador.renovar_expirando([self.credencial, outro]), {})
+        self.assertEqual(self.transporte.renovacoes, 2)
+
+        with self.assertNumQueries(2):
+            self.assertEqual(self.gerenciador.persistir(), 2)
+        self.assertEqual(GoogleCalendarCredential.objects.get(pk=self.credencial.pk).get_token()['token'], 'novo-1')
+
+        # Já renovado e gravado: nada a fazer na próxima rodada, sem reler o JSON
+        credencial = GoogleCalendarCredential.objects.get(pk=self.credencial.pk)
+        self.assertEqual(self.gerenciador.renovar_expirando([credencial]), {})
+        self.assertEqual(self.transporte.renovacoes, 2)
+        self.assertEqual(self.gerenciador.persistir(), 0)
+
+    def test_nao_sobrescreve_reconexao(self):
+        self.gerenciador.renovar_expirando([self.credencial])
+        GoogleCalendarCredential.objects.filter(pk=self.credencial.pk).update(
+            token_json=json.dumps(dict(TOKEN, token='reconectado')), updated_at=timezone.now() + timedelta(seconds=1)
+        )
+        self.assertEqual(self.gerenciador.persistir(), 0)
+        self.assertEqual(GoogleCalendarCredential.objects.get().get_token()['token'], 'reconectado')
+
+    def test_falha_na_renovacao_devolve_a_tarefa_para_a_fila(self):
+        professor = User.objects.create_user('professor')
+        turma = Turma.objects.create(nome='Jazz', modalidade='JAZZ', nivel='INICIANTE', professor=professor)
+        aluno = Aluno.objects.create(usuario=self.usuario, cpf='000.000.000-09', data_nascimento=date(2000, 1, 1))
+        aluno.turmas.add(turma)
+        Aula.objects.create(turma=turma, data=date(2040, 5, 4), hora_inicio=time(19, 0), hora_fim=time(20, 0))
 
-# Create your tests here.
+        self.transporte.falhar = True
+        api = CalendarioFake()
+        self.assertEqual(processar_tarefas_pendentes(api=api, gerenciador=self.gerenciador), {'PENDENTE': 1})
+        self.assertEqual(api.chamadas, [])
+        self.assertIn('invalid_grant', TarefaCalendario.objects.get().ultimo_erro)
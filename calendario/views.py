@@ -5,11 +5,7 @@ from google_auth_oauthlib.flow import Flow
 from .models import GoogleCalendarCredential
 import os
 from django.contrib.auth.decorators import login_required
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
 from django.conf import settings
-from datetime import datetime, timedelta, timezone
-from calendario.models import GoogleCalendarCredential, GoogleCalendarEvent
 
 os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'  # Apenas para desenvolvimento local (HTTP)
 
@@ -18,36 +14,6 @@ SCOPES = [
     "https://www.googleapis.com/auth/calendar.events"
 ]
 
-def criar_evento_google(aula):
-    # alunos da turma
-    alunos = aula.turma.alunos.all()
-
-    for aluno in alunos:
-        cred = getattr(aluno.usuario, 'google_credentials', None)
-        if not cred:
-            continue  # pular quem não conectou o Google
-
-        credentials = Credentials.from_authorized_user_info(cred.get_token())
-        service = build("calendar", "v3", credentials=credentials)
-
-        # Monta data/hora no formato ISO
-        inicio = datetime.combine(aula.data, aula.hora_inicio).isoformat()
-        fim = datetime.combine(aula.data, aula.hora_fim).isoformat()
-
-        evento = {
-            "summary": f"Aula: {aula.turma.nome}",
-            "description": aula.tema or "Aula de dança",
-            "start": {"dateTime": inicio, "timeZone": "America/Sao_Paulo"},
-            "end": {"dateTime": fim, "timeZone": "America/Sao_Paulo"},
-        }
-
-        event_result = service.events().insert(calendarId="primary", body=evento).execute()
-
-        GoogleCalendarEvent.objects.create(
-            aula=aula,
-            google_event_id=event_result['id']
-        )
-
 @login_required
 def conectar_google(request):
     with open(settings.GOOGLE_CALENDAR_SECRET_PATH) as f:
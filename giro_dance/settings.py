@@ -33,6 +33,18 @@ MP_PUBLIC_KEY = env("MP_PUBLIC_KEY")
 MP_ACCESS_TOKEN = env("MP_ACCESS_TOKEN")
 MP_WEBHOOK_URL = env("MP_WEBHOOK_URL")
 
+# Cliente do Mercado Pago (paginas/gateway_mp.py)
+# MP_BACKEND = "fake" usa um backend em memória (desenvolvimento sem credenciais)
+MP_BACKEND = env("MP_BACKEND", default="sdk")
+MP_TIMEOUT_CONEXAO = 3.05          # segundos para abrir a conexão
+MP_TIMEOUT_LEITURA = 10            # segundos esperando a resposta
+MP_POOL_CONEXOES = 10              # conexões keep-alive reaproveitadas
+MP_TENTATIVAS = 3                  # tentativas em erro de rede, 429 e 5xx
+MP_BACKOFF_BASE_SEGUNDOS = 0.2     # base do backoff exponencial (com jitter)
+MP_DISJUNTOR_FALHAS = 5            # falhas seguidas que abrem o disjuntor
+MP_DISJUNTOR_ABERTO_SEGUNDOS = 30  # tempo sem chamar o gateway depois disso
+MP_PREFERENCIA_VALIDADE_HORAS = 24  # validade da preferência de checkout reaproveitada
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -54,6 +66,7 @@ STATIC_URL = '/static/'
 # Application definition
 
 API_EXPORT_TOKEN = os.environ.get("API_EXPORT_TOKEN")
+EXPORT_CHUNK_SIZE = 2000  # Linhas lidas por bloco nas exportações em streaming
 
 
 
@@ -151,6 +164,41 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Compartilhado entre os workers do gunicorn e os comandos do cron
+# (atualizar_mensalidades, processar_webhooks, gerar_aulas, processar_videos,
+# limpar_videos_antigos): a invalidação do painel e da grade feita por um
+# processo precisa valer para todos. Um LocMemCache (por processo) deixaria
+# os outros servindo dados velhos até o timeout. Sem Redis, FileBasedCache
+# na mesma máquina do banco SQLite; com vários servidores, use DatabaseCache
+# (e rode `python manage.py createcachetable`).
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv("CACHE_DIR", str(BASE_DIR / "cache")),
+        "OPTIONS": {
+            # Um painel por aluno e seção, mais grades e feeds por turma
+            "MAX_ENTRIES": 20000,
+        },
+    }
+}
+
+# Tempo (segundos) que o contexto do painel do aluno fica em cache.
+# A invalidação por sinais (em qualquer processo, pelo cache compartilhado)
+# mantém os dados atualizados antes disso.
+PAINEL_CACHE_TIMEOUT = 60 * 60
+
+# Tempo (segundos) da grade semanal compilada de cada turma (paginas.grade).
+# Também é invalidada pelos sinais de HorarioAula/Turma.
+GRADE_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Tempo (segundos) dos eventos de cada turma no feed iCal (paginas.ical).
+# Qualquer mudança de Aula/HorarioAula/Turma troca a versão antes disso.
+ICAL_CACHE_TIMEOUT = 24 * 60 * 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -221,10 +269,44 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
 # Configurações de upload de arquivos
-FILE_UPLOAD_MAX_MEMORY_SIZE = 52428800  # 50MB em bytes
-DATA_UPLOAD_MAX_MEMORY_SIZE = 52428800  # 50MB em bytes
+# Uploads maiores que isso vão para um arquivo temporário em disco, não para a memória
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440  # 2.5MB em bytes
+DATA_UPLOAD_MAX_MEMORY_SIZE = 2621440  # 2.5MB em bytes (sem contar arquivos)
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 1000    # Limite de campos no formulário
 
+# Processamento dos vídeos das aulas (comando processar_videos, paginas.videos)
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+FFPROBE_BIN = os.getenv("FFPROBE_BIN", "ffprobe")
+VIDEO_WORKERS = int(os.getenv("VIDEO_WORKERS", "2"))
+VIDEO_TIMEOUT_SEGUNDOS = 15 * 60
+# (nome, altura, kbps de vídeo, kbps de áudio) das versões para o celular
+VIDEO_RENDICOES = (
+    ('480p', 480, 1000, 96),
+    ('360p', 360, 600, 64),
+)
+
+# Entrega dos vídeos pela view video_aula (paginas.streaming):
+# 'django', 'x-accel' (nginx, location internal em VIDEO_X_ACCEL_PREFIXO
+# apontando para MEDIA_ROOT) ou 'x-sendfile' (Apache/lighttpd)
+# MEDIA_ROOT/aulas/ e MEDIA_ROOT/uploads_parciais/ não podem ser servidos pelo
+# MEDIA_URL: no proxy, só pela location internal (ver paginas/streaming.py)
+VIDEO_ENTREGA = os.getenv("VIDEO_ENTREGA", "django")
+VIDEO_X_ACCEL_PREFIXO = "/protegido/"
+
+# Upload em partes dos vídeos (paginas.uploads); as partes ficam em
+# MEDIA_ROOT/uploads_parciais para o arquivo final ser só um rename
+VIDEO_UPLOAD_TAMANHO_PARTE = 5 * 1024 * 1024
+# Prazo para anexar uma parte reservada; depois disso o offset volta ao tamanho do .part
+VIDEO_UPLOAD_RESERVA_SEGUNDOS = 5 * 60
+
+# Retenção dos vídeos (comando limpar_videos_antigos, paginas.retencao); None desliga a política
+VIDEO_RETENCAO = {
+    'dias': 30,
+    'cota_turma_mb': None,
+    'orcamento_mb': None,
+    'manter_recentes': 2,
+}
+
 # Configurações de Login/Logout
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/painel/'
@@ -15,10 +15,14 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+import posixpath
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+from django.http import Http404
+from django.views.static import serve
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -27,6 +31,27 @@ urlpatterns = [
     path('calendario/', include('calendario.urls')),
 ]
 
+# Pastas de MEDIA_ROOT que só saem pela view video_aula (login e matrícula)
+PASTAS_PROTEGIDAS = ('aulas/', 'uploads_parciais/')
+
+
+def servir_midia(request, path, document_root=None):
+    """serve() do DEBUG sem os vídeos das aulas e os uploads incompletos"""
+    # normpath: "x/../aulas/..." também é protegido
+    if posixpath.normpath(path).lstrip('/').lower().startswith(PASTAS_PROTEGIDAS):
+        raise Http404
+    return serve(request, path, document_root=document_root)
+
+
+def rotas_de_midia():
+    return [
+        re_path(
+            rf'^{re.escape(settings.MEDIA_URL.lstrip("/"))}(?P<path>.*)$',
+            servir_midia, {'document_root': settings.MEDIA_ROOT},
+        ),
+    ]
+
+
 # Adicione as configurações de mídia se necessário
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    urlpatterns += rotas_de_midia()
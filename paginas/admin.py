@@ -1,16 +1,19 @@
 from django.contrib import admin
 from django.db.models import Sum, Count, Q
+from django.utils import timezone
 from django.utils.html import format_html
+from . import armazenamento, financeiro, grade, ical, videos
 from .models import (
-    Aluno, Turma, Aula, HorarioAula, Frequencia, 
+    Aluno, Turma, Aula, HorarioAula, DiaSemAula, Frequencia, 
     Aviso, Mensalidade, Mensagem, Notificacao,
-    Evento, VendaIngresso, ResultadoFinanceiroMensal, DespesaAluno, DespesaAdministrativa
+    Evento, VendaIngresso, ResultadoFinanceiroMensal, DespesaAluno, DespesaAdministrativa,
+    RegistroTransicaoMensalidades, EventoWebhook, ResumoFrequenciaMensal, VersaoVideo,
 )
 
 
 @admin.register(Turma)
 class TurmaAdmin(admin.ModelAdmin):
-    list_display = ['nome', 'modalidade', 'nivel', 'professor', 'capacidade_maxima', 'ativa']
+    list_display = ['nome', 'modalidade', 'nivel', 'professor', 'grade_semanal', 'capacidade_maxima', 'ativa']
     list_filter = ['modalidade', 'nivel', 'ativa']
     search_fields = ['nome', 'professor__first_name', 'professor__last_name']
     list_editable = ['ativa']
@@ -26,7 +29,44 @@ class TurmaAdmin(admin.ModelAdmin):
         ('Período', {
             'fields': ('data_inicio', 'data_fim')
         }),
+        ('Calendário', {
+            'fields': ('link_feed_ical',)
+        }),
     )
+    readonly_fields = ['link_feed_ical']
+    actions = ['gerar_aulas_semestre']
+    
+    def gerar_aulas_semestre(self, request, queryset):
+        """Gera as aulas das turmas selecionadas de hoje até o fim do semestre"""
+        from .cronograma import fim_do_semestre, gerar_aulas
+        
+        hoje = timezone.now().date()
+        resultado = gerar_aulas(hoje, fim_do_semestre(hoje), turmas=queryset)
+        self.message_user(
+            request,
+            f'{resultado["criadas"]} aula(s) gerada(s) até {fim_do_semestre(hoje):%d/%m/%Y} '
+            f'({resultado["existentes"]} já existiam, {resultado["puladas"]} em dias sem aula).'
+        )
+    gerar_aulas_semestre.short_description = 'Gerar aulas até o fim do semestre'
+    
+    def get_changelist_instance(self, request):
+        # Grade de todas as turmas da página com um get_many no cache
+        changelist = super().get_changelist_instance(request)
+        grades = grade.grades_das_turmas([turma.pk for turma in changelist.result_list])
+        for turma in changelist.result_list:
+            turma.grade_compilada = grades.get(turma.pk)
+        return changelist
+    
+    def grade_semanal(self, obj):
+        grade_turma = getattr(obj, 'grade_compilada', None) or grade.grade_da_turma(obj.pk)
+        return grade.resumo_da_grade(grade_turma) if grade_turma and grade_turma['horarios'] else '-'
+    grade_semanal.short_description = 'Grade semanal'
+    
+    def link_feed_ical(self, obj):
+        if not obj or not obj.pk:
+            return '-'
+        return format_html('<a href="{}">Feed .ics da turma</a>', ical.caminho_feed('turma', obj.pk))
+    link_feed_ical.short_description = 'Feed iCal'
 
 
 @admin.register(Aluno)
@@ -62,6 +102,21 @@ class AlunoAdmin(admin.ModelAdmin):
     def email(self, obj):
         return obj.usuario.email
     email.short_description = "E-mail"
+    
+    def changelist_view(self, request, extra_context=None):
+        """Adiciona os contadores do cache do painel do aluno no topo do admin"""
+        from django.http import HttpResponseRedirect
+        from . import painel_cache
+        
+        # Só por POST (com CSRF): um GET de prefetch ou crawler não muda nada
+        if request.method == 'POST' and 'zerar_cache_painel' in request.POST:
+            if request.user.is_superuser:
+                painel_cache.zerar_estatisticas()
+            return HttpResponseRedirect(request.path)
+        
+        extra_context = extra_context or {}
+        extra_context['cache_painel'] = painel_cache.estatisticas()
+        return super().changelist_view(request, extra_context=extra_context)
 
 
 @admin.register(HorarioAula)
@@ -72,10 +127,32 @@ class HorarioAulaAdmin(admin.ModelAdmin):
     ordering = ['dia_semana', 'hora_inicio']
 
 
+@admin.register(DiaSemAula)
+class DiaSemAulaAdmin(admin.ModelAdmin):
+    list_display = ['data', 'turma', 'motivo']
+    list_filter = ['turma']
+    date_hierarchy = 'data'
+
+
+class VersaoVideoInline(admin.TabularInline):
+    model = VersaoVideo
+    extra = 0
+    can_delete = False
+    fields = ['nome', 'largura', 'altura', 'bitrate_kbps', 'tamanho_display', 'arquivo']
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def tamanho_display(self, obj):
+        return f'{obj.tamanho_mb():.1f} MB'
+    tamanho_display.short_description = 'Tamanho'
+
+
 @admin.register(Aula)
 class AulaAdmin(admin.ModelAdmin):
-    list_display = ['turma', 'data', 'hora_inicio', 'hora_fim', 'tema', 'realizada', 'tem_video', 'tamanho_video_display']
-    list_filter = ['realizada', 'data', 'turma']
+    list_display = ['turma', 'data', 'hora_inicio', 'hora_fim', 'tema', 'realizada', 'tem_video', 'video_status', 'tamanho_video_display']
+    list_filter = ['realizada', 'video_status', 'data', 'turma']
     search_fields = ['turma__nome', 'tema']
     list_editable = ['realizada']
     date_hierarchy = 'data'
@@ -88,15 +165,24 @@ class AulaAdmin(admin.ModelAdmin):
             'fields': ('tema', 'conteudo')
         }),
         ('Vídeo da Aula', {
-            'fields': ('video', 'data_upload_video'),
-            'description': 'Upload de vídeo da aula (máximo 50MB). Formatos: MP4, WebM, AVI, MOV'
+            'fields': ('video', 'data_upload_video', 'video_status', 'video_poster', 'video_erro'),
+            'description': 'Upload de vídeo da aula (máximo 50MB). Formatos: MP4, WebM, AVI, MOV. '
+                           'As versões para web e celular são geradas em segundo plano (comando processar_videos).'
         }),
         ('Status', {
             'fields': ('realizada', 'observacoes')
         }),
     )
     
-    readonly_fields = ['data_upload_video']
+    readonly_fields = ['data_upload_video', 'video_status', 'video_poster', 'video_erro']
+    inlines = [VersaoVideoInline]
+    actions = ['reprocessar_videos']
+
+    def reprocessar_videos(self, request, queryset):
+        """Coloca os vídeos das aulas selecionadas de volta na fila"""
+        count = videos.enfileirar(queryset.values_list('pk', flat=True))
+        self.message_user(request, f'{count} vídeo(s) colocado(s) na fila de processamento.')
+    reprocessar_videos.short_description = 'Reprocessar vídeos selecionados'
     
     def tem_video(self, obj):
         """Indica se a aula tem vídeo"""
@@ -125,12 +211,11 @@ class AulaAdmin(admin.ModelAdmin):
         """Adiciona estatísticas de vídeos no topo do admin"""
         extra_context = extra_context or {}
         
-        # Estatísticas de vídeos
+        # Estatísticas de vídeos (tamanhos medidos no upload, um SUM no banco)
         aulas_com_video = Aula.objects.filter(video__isnull=False).exclude(video='')
-        total_videos = aulas_com_video.count()
-        
-        # Calcular tamanho total (aproximado)
-        tamanho_total = sum([aula.get_video_size_mb() for aula in aulas_com_video])
+        uso = armazenamento.uso_total(aulas_com_video)
+        total_videos = uso['videos']
+        tamanho_total = uso['bytes_total'] / 1024 / 1024
         
         # Vídeos antigos (mais de 30 dias)
         from django.utils import timezone
@@ -141,6 +226,10 @@ class AulaAdmin(admin.ModelAdmin):
         extra_context['tamanho_total_mb'] = tamanho_total
         extra_context['tamanho_total_gb'] = tamanho_total / 1024
         extra_context['videos_antigos'] = videos_antigos
+        extra_context['uso_por_turma'] = [
+            {'turma': linha['turma__nome'], 'videos': linha['videos'], 'mb': linha['bytes_total'] / 1024 / 1024}
+            for linha in armazenamento.uso_por_turma(aulas_com_video)
+        ]
         
         return super().changelist_view(request, extra_context=extra_context)
 
@@ -213,21 +302,13 @@ class FrequenciaAdmin(admin.ModelAdmin):
         alunos = aula.turma.alunos.all().select_related('usuario').order_by('usuario__first_name')
         
         if request.method == 'POST':
-            # Processa o formulário
-            for aluno in alunos:
-                checkbox_name = f'faltou_{aluno.id}'
-                faltou = checkbox_name in request.POST
-                
-                # Cria ou atualiza a frequência
-                frequencia, created = Frequencia.objects.get_or_create(
-                    aluno=aluno,
-                    aula=aula,
-                    defaults={'status': 'FALTA' if faltou else 'PRESENTE'}
-                )
-                
-                if not created:
-                    frequencia.status = 'FALTA' if faltou else 'PRESENTE'
-                    frequencia.save()
+            from .frequencias import registrar_frequencias
+            
+            # Toda a turma em um único upsert
+            registrar_frequencias(aula, {
+                aluno_id: 'FALTA' if f'faltou_{aluno_id}' in request.POST else 'PRESENTE'
+                for aluno_id in alunos.values_list('id', flat=True)
+            })
             
             messages.success(request, f'Frequência registrada com sucesso para a aula "{aula}"')
             return redirect('admin:registrar_frequencia')
@@ -260,6 +341,21 @@ class FrequenciaAdmin(admin.ModelAdmin):
         return super().changelist_view(request, extra_context)
 
 
+@admin.register(ResumoFrequenciaMensal)
+class ResumoFrequenciaMensalAdmin(admin.ModelAdmin):
+    """Mantido pelas gravações de frequência (somente leitura)"""
+    list_display = ['aluno', 'mes', 'total', 'presencas', 'faltas', 'justificadas', 'percentual_presenca']
+    list_select_related = ['aluno__usuario']
+    search_fields = ['aluno__usuario__first_name', 'aluno__usuario__last_name', 'aluno__cpf']
+    date_hierarchy = 'mes'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Aviso)
 class AvisoAdmin(admin.ModelAdmin):
     list_display = ['titulo', 'tipo', 'autor', 'data_criacao', 'importante', 'ativo']
@@ -492,7 +588,8 @@ class ResultadoFinanceiroMensalAdmin(admin.ModelAdmin):
     list_filter = ['mes', 'data_criacao']
     search_fields = ['observacoes']
     date_hierarchy = 'mes'
-    readonly_fields = ['data_criacao', 'data_atualizacao', 'criado_por']
+    readonly_fields = ['data_criacao', 'data_atualizacao', 'criado_por', 'calculado_em']
+    actions = ['recalcular_meses']
     
     fieldsets = (
         ('Período', {
@@ -512,11 +609,29 @@ class ResultadoFinanceiroMensalAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
         ('Metadados', {
-            'fields': ('criado_por', 'data_criacao', 'data_atualizacao'),
+            'fields': ('criado_por', 'data_criacao', 'data_atualizacao', 'calculado_em'),
             'classes': ('collapse',)
         }),
     )
     
+    def get_readonly_fields(self, request, obj=None):
+        """Meses calculados automaticamente não são editados à mão"""
+        campos = list(super().get_readonly_fields(request, obj))
+        if obj and obj.calculado_em:
+            campos += ['lucro_total', 'gasto_total', 'a_receber_total']
+        return campos
+    
+    def changelist_view(self, request, extra_context=None):
+        """Recalcula os meses marcados como alterados antes de listar"""
+        financeiro.processar_meses_pendentes()
+        return super().changelist_view(request, extra_context)
+    
+    def recalcular_meses(self, request, queryset):
+        """Recalcula os meses selecionados a partir das tabelas de origem"""
+        count = financeiro.recalcular_meses(queryset.values_list('mes', flat=True))
+        self.message_user(request, f'{count} mês(es) recalculado(s).')
+    recalcular_meses.short_description = 'Recalcular meses selecionados'
+    
     def save_model(self, request, obj, form, change):
         """Salva o usuário que criou o registro"""
         if not change:  # Se é um novo registro
@@ -794,3 +909,48 @@ class DespesaAdministrativaAdmin(admin.ModelAdmin):
 
 
 
+
+
+@admin.register(RegistroTransicaoMensalidades)
+class RegistroTransicaoMensalidadesAdmin(admin.ModelAdmin):
+    """Auditoria do comando atualizar_mensalidades (somente leitura)"""
+    list_display = ['data_execucao', 'data_referencia', 'desde', 'total_atualizadas', 'total_notificacoes', 'lotes', 'duracao_segundos']
+    date_hierarchy = 'data_execucao'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(EventoWebhook)
+class EventoWebhookAdmin(admin.ModelAdmin):
+    """Caixa de entrada dos webhooks do Mercado Pago"""
+    list_display = ['tipo', 'recurso_id', 'status', 'resultado', 'recebimentos', 'tentativas', 'proxima_tentativa', 'data_recebimento']
+    list_filter = ['status', 'tipo']
+    search_fields = ['recurso_id']
+    readonly_fields = ['data_recebimento', 'data_processamento']
+    actions = ['reprocessar']
+    
+    def reprocessar(self, request, queryset):
+        """Coloca os eventos selecionados de volta na fila"""
+        count = queryset.update(status='PENDENTE', tentativas=0, proxima_tentativa=timezone.now())
+        self.message_user(request, f'{count} evento(s) colocado(s) na fila novamente.')
+    reprocessar.short_description = 'Reprocessar eventos selecionados'
+    
+    def changelist_view(self, request, extra_context=None):
+        """Adiciona as métricas do cliente do Mercado Pago no topo do admin"""
+        from django.http import HttpResponseRedirect
+        from .gateway_mp import metricas, obter_cliente
+        
+        # Só por POST (com CSRF): um GET de prefetch ou crawler não muda nada
+        if request.method == 'POST' and 'zerar_metricas_gateway' in request.POST:
+            if request.user.is_superuser:
+                metricas.zerar()
+            return HttpResponseRedirect(request.path)
+        
+        extra_context = extra_context or {}
+        extra_context['metricas_gateway'] = metricas.resumo()
+        extra_context['disjuntor_gateway'] = obter_cliente().disjuntor.estado
+        return super().changelist_view(request, extra_context=extra_context)
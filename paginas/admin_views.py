@@ -8,10 +8,13 @@ from django.db.models import Q, Count, Sum
 from django.utils import timezone
 from datetime import timedelta
 from calendar import monthrange
+import json
 from .models import (
     Aluno, Turma, Aula, Frequencia,
     Mensalidade, Evento, Aviso, Mensagem, VendaIngresso
 )
+from .financeiro import JANELAS_MESES, interpretar_janela, serie_receita
+from .paginacao import paginar_keyset
 
 
 def is_superuser(user):
@@ -24,8 +27,6 @@ def is_superuser(user):
 def admin_dashboard(request):
     """Dashboard administrativo principal"""
     hoje = timezone.now().date()
-    mes_atual = hoje.month
-    ano_atual = hoje.year
     
     # Pegar filtro de receita (padrão: data_pagamento)
     filtro_receita = request.GET.get('filtro_receita', 'data_pagamento')
@@ -40,92 +41,39 @@ def admin_dashboard(request):
         data__lte=hoje + timedelta(days=7)
     ).count()
     
-    # Receita do mês (baseado no filtro selecionado)
-    if filtro_receita == 'mes_referencia':
-        receita_mes = Mensalidade.objects.filter(
-            mes_referencia__month=mes_atual,
-            mes_referencia__year=ano_atual,
-            status='PAGO'
-        ).aggregate(total=Sum('valor_final'))['total'] or 0
-    else:  # data_pagamento
-        receita_mes = Mensalidade.objects.filter(
-            data_pagamento__month=mes_atual,
-            data_pagamento__year=ano_atual,
-            status='PAGO'
-        ).aggregate(total=Sum('valor_final'))['total'] or 0
+    # Receita (gráfico e mês atual) e status das mensalidades, em uma consulta
+    meses_grafico = interpretar_janela(request.GET.get('meses'))
+    financeiro = serie_receita(filtro_receita, meses_grafico, hoje)
     
     # Mensalidades atrasadas
-    mensalidades_atrasadas = Mensalidade.objects.filter(
-        status='ATRASADO'
-    ).select_related('aluno__usuario').order_by('data_vencimento')
+    mensalidades_atrasadas = paginar_keyset(
+        request,
+        Mensalidade.objects.filter(status='ATRASADO').select_related('aluno__usuario'),
+        ['data_vencimento', 'id'],
+        por_pagina=10,
+        parametro='cursor_atrasadas',
+    )
     
     # Próximas aulas
     proximas_aulas = Aula.objects.filter(
         data__gte=hoje
     ).select_related('turma').order_by('data', 'hora_inicio')[:10]
     
-    # Dados para gráfico de receita (últimos 6 meses)
-    receita_labels = []
-    receita_valores = []
-    meses_pt = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun',
-                'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
-    
-    for i in range(5, -1, -1):
-        mes = mes_atual - i
-        ano = ano_atual
-        if mes <= 0:
-            mes += 12
-            ano -= 1
-        
-        receita_labels.append(f"{meses_pt[mes-1]}/{str(ano)[2:]}")
-        
-        if filtro_receita == 'mes_referencia':
-            valor = Mensalidade.objects.filter(
-                mes_referencia__month=mes,
-                mes_referencia__year=ano,
-                status='PAGO'
-            ).aggregate(total=Sum('valor_final'))['total'] or 0
-        else:  # data_pagamento
-            valor = Mensalidade.objects.filter(
-                data_pagamento__month=mes,
-                data_pagamento__year=ano,
-                status='PAGO'
-            ).aggregate(total=Sum('valor_final'))['total'] or 0
-        
-        receita_valores.append(float(valor))
-    
-    # Status de mensalidades
-    mens_pagas = Mensalidade.objects.filter(
-        mes_referencia__month=mes_atual,
-        mes_referencia__year=ano_atual,
-        status='PAGO'
-    ).count()
-    
-    mens_pendentes = Mensalidade.objects.filter(
-        mes_referencia__month=mes_atual,
-        mes_referencia__year=ano_atual,
-        status='PENDENTE'
-    ).count()
-    
-    mens_atrasadas = Mensalidade.objects.filter(
-        mes_referencia__month=mes_atual,
-        mes_referencia__year=ano_atual,
-        status='ATRASADO'
-    ).count()
-    
     context = {
         'total_alunos': total_alunos,
         'total_turmas': total_turmas,
         'aulas_proximos_7_dias': aulas_proximos_7_dias,
-        'receita_mes': receita_mes,
+        'receita_mes': financeiro['receita_mes'],
         'mensalidades_atrasadas': mensalidades_atrasadas,
         'proximas_aulas': proximas_aulas,
-        'receita_labels': receita_labels,
-        'receita_valores': receita_valores,
-        'mens_pagas': mens_pagas,
-        'mens_pendentes': mens_pendentes,
-        'mens_atrasadas': mens_atrasadas,
+        'receita_labels': json.dumps(financeiro['labels']),
+        'receita_valores': json.dumps(financeiro['valores']),
+        'mens_pagas': financeiro['mens_pagas'],
+        'mens_pendentes': financeiro['mens_pendentes'],
+        'mens_atrasadas': financeiro['mens_atrasadas'],
         'filtro_receita': filtro_receita,
+        'meses_grafico': meses_grafico,
+        'janelas_meses': JANELAS_MESES,
     }
     
     return render(request, 'admin_painel/dashboard.html', context)
@@ -3,9 +3,16 @@ from django.http import JsonResponse
 from django.views.decorators.http import require_GET
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.dateparse import parse_date
-from .models import Aluno, Mensalidade, ResultadoFinanceiroMensal
+from .models import ResultadoFinanceiroMensal
+from django.utils import timezone
+from .exportacao import (
+    resposta_streaming, queryset_alunos, iterar_alunos, serializar_aluno,
+    queryset_mensalidades, iterar_mensalidades, serializar_mensalidade,
+    sincronizacao_incremental, resposta_incremental,
+    queryset_resumos_frequencia, iterar_resumos_frequencia,
+)
 from datetime import datetime
-from .views import grafico_frequencia
+from .financeiro import processar_meses_pendentes
 
     
 API_TOKEN = os.environ.get("API_EXPORT_TOKEN")
@@ -22,29 +29,18 @@ def export_alunos(request):
     # Filtros opcionais
     ativo = request.GET.get("ativo")
     if ativo in ["true", "1", "True"]:
-        alunos = Aluno.objects.filter(ativo=True)
+        alunos = queryset_alunos(ativo=True)
     elif ativo in ["false", "0", "False"]:
-        alunos = Aluno.objects.filter(ativo=False)
+        alunos = queryset_alunos(ativo=False)
     else:
-        alunos = Aluno.objects.all()
+        alunos = queryset_alunos()
 
-    data = []
-    for a in alunos:
-        data.append({
-            "id": a.id,
-            "nome": a.usuario.get_full_name(),
-            "cpf": a.cpf,
-            "data_nascimento": a.data_nascimento,
-            "telefone": a.telefone,
-            "telefone_emergencia": a.telefone_emergencia,
-            "endereco": a.endereco,
-            "data_matricula": a.data_matricula,
-            "ativo": a.ativo,
-            "observacoes": a.observacoes,
-            "turmas": [t.nome for t in a.turmas.all()],  # lista de nomes da turma
-        })
+    # Sincronização incremental: ?updated_since=<ISO 8601> ou ?cursor=<proximo_cursor>
+    if sincronizacao_incremental(request):
+        return resposta_incremental(request, alunos, 'ALUNO', serializar_aluno)
 
-    return JsonResponse(data, safe=False,)
+    # Streaming: memória constante independente do tamanho da tabela
+    return resposta_streaming(iterar_alunos(alunos), request.GET.get("formato", "json"))
 
 # ---------------------------------------------------------
 # EXPORTAÇÃO DE MENSALIDADES
@@ -56,70 +52,40 @@ def export_mensalidades(request):
     if not token or token != API_TOKEN:
         return JsonResponse({"detail": "Unauthorized"}, status=401)
 
-    qs = Mensalidade.objects.select_related("aluno", "aluno__usuario")
-
-    # Filtro por status
-    status = request.GET.get("status")
-    if status:
-        qs = qs.filter(status=status.upper())
-
-    # Filtro por mês de referência (yyyy-mm)
-    mes = request.GET.get("mes")
-    if mes:
-        qs = qs.filter(mes_referencia__startswith=mes)
-
-    # Filtro por aluno específico
-    aluno_id = request.GET.get("aluno_id")
-    if aluno_id:
-        qs = qs.filter(aluno__id=aluno_id)
-
-    data = []
-    from django.utils import timezone
-    today = timezone.now().date()
-
-    for m in qs:
-        data.append({
-            "id": m.id,
-            "aluno_id": m.aluno.id,
-            "aluno_nome": m.aluno.usuario.get_full_name() or m.aluno.usuario.username,
-            "cpf": m.aluno.cpf,
-
-            # Valores
-            "mes_referencia": m.mes_referencia,
-            "valor": float(m.valor),
-            "valor_desconto": float(m.valor_desconto),
-            "valor_final": float(m.valor_final),
-
-            # Datas
-            "data_vencimento": m.data_vencimento,
-            "data_pagamento": m.data_pagamento,
+    qs = queryset_mensalidades(
+        status=request.GET.get("status"),                # Filtro por status
+        mes=request.GET.get("mes"),                      # Filtro por mês de referência (yyyy-mm)
+        aluno_id=request.GET.get("aluno_id"),            # Filtro por aluno específico
+    )
 
-            # Status
-            "status": m.status,
-            "forma_pagamento": m.forma_pagamento,
+    if sincronizacao_incremental(request):
+        hoje = timezone.now().date()
+        return resposta_incremental(
+            request, qs, 'MENSALIDADE', lambda m: serializar_mensalidade(m, hoje)
+        )
 
-            # Atraso
-            "dias_em_atraso": m.dias_em_atraso(),
-
-            "observacoes": m.observacoes,
-        })
-
-    return JsonResponse(data, safe=False)
+    return resposta_streaming(iterar_mensalidades(qs), request.GET.get("formato", "json"))
 
 @csrf_exempt
 @require_GET
 def export_frequencias(request):
     token = request.GET.get("token")
-    data = grafico_frequencia(request) 
-    
-    if token != API_TOKEN:
+    if not token or token != API_TOKEN:
         return JsonResponse({"detail": "Unauthorized"}, status=401)
 
-    return data
+    # Uma linha por aluno e mês, lida do resumo mantido a cada chamada
+    qs = queryset_resumos_frequencia(
+        mes=request.GET.get("mes"),                      # Filtro por mês (yyyy-mm)
+        aluno_id=request.GET.get("aluno_id"),            # Filtro por aluno específico
+    )
+    return resposta_streaming(iterar_resumos_frequencia(qs), request.GET.get("formato", "json"))
 
 @require_GET
 def exportar_resultados_json(request):
     """Endpoint para exportar resultados financeiros mensais em JSON"""
+    # Meses marcados como alterados são recalculados antes da leitura
+    processar_meses_pendentes()
+    
     mes_filtro = request.GET.get('mes', None)
     if mes_filtro:
         try:
@@ -0,0 +1,157 @@
+"""
+Espaço ocupado pelos vídeos das aulas.
+
+O admin e o limpar_videos_antigos faziam os.path.isfile + getsize em cada
+vídeo a cada listagem. Agora os tamanhos ficam na própria Aula:
+
+    video_tamanho              bytes do original, medidos no upload
+                               (Aula.save / paginas.uploads)
+    video_checksum             SHA-256 do original, calculado junto
+    video_tamanho_processados  bytes das versões e do poster, gravados
+                               pelo processamento (paginas.videos)
+
+e o uso por turma e por mês é um SUM agrupado em uma consulta.
+
+reconciliar() confere o banco com o disco (arquivo ausente, tamanho ou
+checksum diferente, arquivos órfãos) e, com corrigir=True, regrava as
+medidas; é o que o comando reconciliar_videos roda, também para medir os
+vídeos enviados antes destes campos existirem.
+"""
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+
+from .models import Aula, VersaoVideo, medir_arquivo
+
+PASTAS_VIDEOS = ('aulas/videos', 'aulas/processados')
+
+_COM_VIDEO = Q(video_tamanho__gt=0) | Q(video_tamanho_processados__gt=0)
+
+
+def _somas():
+    return {
+        'videos': Count('pk', filter=Q(video__gt='')),
+        'bytes_originais': Coalesce(Sum('video_tamanho'), 0),
+        'bytes_processados': Coalesce(Sum('video_tamanho_processados'), 0),
+        'bytes_total': Coalesce(Sum(F('video_tamanho') + F('video_tamanho_processados')), 0),
+    }
+
+
+def uso_total(aulas=None):
+    """{'videos', 'bytes_originais', 'bytes_processados', 'bytes_total'} em uma consulta"""
+    return (Aula.objects.all() if aulas is None else aulas).aggregate(**_somas())
+
+
+def uso_por_turma(aulas=None):
+    """Uso por turma, da que mais ocupa para a que menos ocupa"""
+    return list(
+        (Aula.objects.all() if aulas is None else aulas).filter(_COM_VIDEO)
+        .values('turma_id', 'turma__nome').annotate(**_somas()).order_by('-bytes_total')
+    )
+
+
+def uso_por_mes(aulas=None):
+    """Uso por mês de upload do vídeo, em ordem cronológica"""
+    linhas = (
+        (Aula.objects.all() if aulas is None else aulas).filter(_COM_VIDEO, data_upload_video__isnull=False)
+        .annotate(mes_upload=TruncMonth('data_upload_video')).values('mes_upload')
+        .annotate(**_somas()).order_by('mes_upload')
+    )
+    resultado = []
+    for linha in linhas:
+        mes = linha.pop('mes_upload')
+        # TruncMonth de DateTimeField devolve datetime
+        linha['mes'] = mes.date() if hasattr(mes, 'date') and callable(mes.date) else mes
+        resultado.append(linha)
+    return resultado
+
+
+# ---------------------------------------------------------
+# RECONCILIAÇÃO BANCO x DISCO
+# ---------------------------------------------------------
+
+def _tamanho_no_disco(nome):
+    try:
+        return default_storage.size(nome)
+    except OSError:
+        return None
+
+
+def _arquivos_no_disco():
+    """Nomes (relativos ao storage) de todos os arquivos das pastas de vídeo"""
+    for pasta in PASTAS_VIDEOS:
+        if not default_storage.exists(pasta):
+            continue
+        pendentes = [pasta]
+        while pendentes:
+            atual = pendentes.pop()
+            subpastas, arquivos = default_storage.listdir(atual)
+            pendentes.extend(f'{atual}/{subpasta}' for subpasta in subpastas)
+            for arquivo in arquivos:
+                yield f'{atual}/{arquivo}'
+
+
+def reconciliar(corrigir=False, checksum=False):
+    """
+    Confere as medidas gravadas com o disco. Com checksum=True também relê
+    os originais para comparar o SHA-256 (lento: lê todos os vídeos).
+
+    Retorna um relatório com as listas de aula_ids em 'ausentes',
+    'divergentes' e 'corrompidos', os nomes em 'orfaos' e quantas aulas
+    foram 'corrigidas'.
+    """
+    relatorio = {
+        'verificadas': 0, 'ausentes': [], 'divergentes': [], 'corrompidos': [], 'orfaos': [], 'corrigidas': 0,
+    }
+    referenciados = set()
+    correcoes = []
+
+    versoes_por_aula = {}
+    for aula_id, nome in VersaoVideo.objects.values_list('aula_id', 'arquivo').iterator():
+        versoes_por_aula.setdefault(aula_id, []).append(nome)
+        referenciados.add(nome)
+
+    aulas = Aula.objects.filter(
+        Q(video__gt='') | Q(video_poster__gt='') | Q(video_tamanho__gt=0) | Q(video_tamanho_processados__gt=0)
+    ).values_list('pk', 'video', 'video_poster', 'video_tamanho', 'video_checksum', 'video_tamanho_processados')
+    for pk, video, poster, tamanho, soma, processados in aulas.iterator():
+        relatorio['verificadas'] += 1
+        referenciados.update(nome for nome in (video, poster) if nome)
+        correcao = {}
+
+        real = _tamanho_no_disco(video) if video else 0
+        if real is None:
+            relatorio['ausentes'].append(pk)
+        elif real != tamanho:
+            relatorio['divergentes'].append(pk)
+            correcao['video_tamanho'] = real
+            if video:
+                with default_storage.open(video, 'rb') as arquivo:
+                    correcao['video_checksum'] = medir_arquivo(File(arquivo))[1]
+        elif checksum and video:
+            with default_storage.open(video, 'rb') as arquivo:
+                atual = medir_arquivo(File(arquivo))[1]
+            if not soma:
+                correcao['video_checksum'] = atual
+            elif atual != soma:
+                # Mesmo tamanho, conteúdo diferente: só avisa, o checksum gravado é a referência
+                relatorio['corrompidos'].append(pk)
+
+        gerados = versoes_por_aula.get(pk, []) + ([poster] if poster else [])
+        real_processados = sum(_tamanho_no_disco(nome) or 0 for nome in gerados)
+        if real_processados != processados:
+            if pk not in relatorio['divergentes']:
+                relatorio['divergentes'].append(pk)
+            correcao['video_tamanho_processados'] = real_processados
+
+        if correcao:
+            correcoes.append((pk, correcao))
+
+    relatorio['orfaos'] = sorted(nome for nome in _arquivos_no_disco() if nome not in referenciados)
+
+    if corrigir:
+        for pk, correcao in correcoes:
+            Aula.objects.filter(pk=pk).update(**correcao)
+        relatorio['corrigidas'] = len(correcoes)
+    return relatorio
@@ -0,0 +1,100 @@
+"""
+Geração das aulas a partir da grade semanal (HorarioAula).
+
+Cada horário da turma vira uma Aula em cada semana do período, respeitando
+data_inicio/data_fim da turma, os DiaSemAula (feriados gerais ou da turma)
+e as datas extras informadas. As aulas são inseridas com
+bulk_create(ignore_conflicts=True) sobre (turma, data, hora_inicio), então
+rodar de novo para o mesmo período não duplica nada nem mexe nas aulas já
+existentes.
+
+bulk_create não dispara os sinais de Aula: a sincronização com o Google
+Agenda é enfileirada de uma vez para as aulas criadas e o painel dos alunos
+e o feed iCal das turmas são invalidados no fim.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+
+from calendario.sincronizacao import enfileirar_sincronizacao
+
+from . import ical, painel_cache
+from .models import Aluno, Aula, DiaSemAula, HorarioAula
+
+DIAS_DA_SEMANA = {'SEG': 0, 'TER': 1, 'QUA': 2, 'QUI': 3, 'SEX': 4, 'SAB': 5, 'DOM': 6}
+TAMANHO_LOTE = 1000
+
+
+def fim_do_semestre(dia):
+    """Último dia do semestre de `dia` (30/06 ou 31/12)"""
+    return date(dia.year, 6, 30) if dia.month <= 6 else date(dia.year, 12, 31)
+
+
+def _datas_sem_aula(inicio, fim, excluir):
+    """(datas de todas as turmas, {turma_id: datas})"""
+    gerais = set(excluir)
+    por_turma = defaultdict(set)
+    for data, turma_id in DiaSemAula.objects.filter(data__range=(inicio, fim)).values_list('data', 'turma_id'):
+        if turma_id is None:
+            gerais.add(data)
+        else:
+            por_turma[turma_id].add(data)
+    return gerais, por_turma
+
+
+def gerar_aulas(inicio, fim, turmas=None, excluir=()):
+    """
+    Cria as aulas de `inicio` a `fim` (inclusive) das turmas ativas, ou só
+    das `turmas` informadas (queryset ou lista de ids).
+
+    excluir -> datas extras sem aula, além dos DiaSemAula cadastrados
+
+    Retorna um dict com 'criadas', 'existentes' e 'puladas' (feriados).
+    """
+    horarios = HorarioAula.objects.filter(turma__ativa=True)
+    if turmas is not None:
+        horarios = horarios.filter(turma__in=turmas)
+    horarios = list(horarios.values_list(
+        'turma_id', 'dia_semana', 'hora_inicio', 'hora_fim', 'turma__data_inicio', 'turma__data_fim'
+    ))
+    if not horarios:
+        return {'criadas': 0, 'existentes': 0, 'puladas': 0}
+
+    turma_ids = {horario[0] for horario in horarios}
+    gerais, por_turma = _datas_sem_aula(inicio, fim, excluir)
+    existentes = set(Aula.objects.filter(turma_id__in=turma_ids, data__range=(inicio, fim)).values_list(
+        'turma_id', 'data', 'hora_inicio'
+    ))
+
+    novas = []
+    ja_existiam = puladas = 0
+    for turma_id, dia_semana, hora_inicio, hora_fim, turma_inicio, turma_fim in horarios:
+        primeiro = max(inicio, turma_inicio) if turma_inicio else inicio
+        ultimo = min(fim, turma_fim) if turma_fim else fim
+        dia = primeiro + timedelta(days=(DIAS_DA_SEMANA[dia_semana] - primeiro.weekday()) % 7)
+        while dia <= ultimo:
+            if dia in gerais or dia in por_turma[turma_id]:
+                puladas += 1
+            elif (turma_id, dia, hora_inicio) in existentes:
+                ja_existiam += 1
+            else:
+                novas.append(Aula(turma_id=turma_id, data=dia, hora_inicio=hora_inicio, hora_fim=hora_fim))
+            dia += timedelta(days=7)
+
+    if novas:
+        Aula.objects.bulk_create(novas, batch_size=TAMANHO_LOTE, ignore_conflicts=True)
+        # ignore_conflicts não devolve os ids: busca as aulas que não existiam antes
+        criadas = [
+            pk for pk, turma_id, data, hora_inicio in Aula.objects.filter(
+                turma_id__in=turma_ids, data__range=(inicio, fim)
+            ).values_list('pk', 'turma_id', 'data', 'hora_inicio')
+            if (turma_id, data, hora_inicio) not in existentes
+        ]
+        enfileirar_sincronizacao(criadas)
+        ical.invalidar_turmas(turma_ids)
+        painel_cache.invalidar_usuarios(
+            Aluno.objects.filter(turmas__in=turma_ids).values_list('usuario_id', flat=True).distinct()
+        )
+    else:
+        criadas = []
+
+    return {'criadas': len(criadas), 'existentes': ja_existiam, 'puladas': puladas}
@@ -0,0 +1,164 @@
+"""
+Serviço de dados do painel do aluno.
+
+Concentra as consultas do dashboard (/painel/) em poucas idas ao banco:
+o aluno, as estatísticas de frequência (somadas do ResumoFrequenciaMensal)
+e o total de mensagens não lidas saem de uma única consulta.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import grade, ical
+from .models import Aluno, Aula, Aviso, Mensagem, Mensalidade, ResumoFrequenciaMensal, Turma
+
+
+def aluno_com_estatisticas(usuario):
+    """
+    Busca o aluno do usuário já anotado com as contagens do painel.
+
+    Anotações: total_aulas, presencas, faltas e mensagens_nao_lidas.
+    Levanta Aluno.DoesNotExist se o usuário não for aluno.
+    """
+    nao_lidas = Mensagem.objects.filter(
+        destinatario=OuterRef('usuario'),
+        lida=False
+    ).order_by().values('destinatario').annotate(total=Count('id')).values('total')
+
+    def somar_resumos(campo):
+        soma = ResumoFrequenciaMensal.objects.filter(
+            aluno=OuterRef('pk')
+        ).order_by().values('aluno').annotate(soma=Sum(campo)).values('soma')
+        return Coalesce(Subquery(soma, output_field=IntegerField()), Value(0))
+
+    return Aluno.objects.select_related('usuario').annotate(
+        total_aulas=somar_resumos('total'),
+        presencas=somar_resumos('presencas'),
+        faltas=somar_resumos('faltas'),
+        mensagens_nao_lidas=Coalesce(
+            Subquery(nao_lidas, output_field=IntegerField()), Value(0)
+        ),
+    ).get(usuario=usuario)
+
+
+def turmas_ativas(aluno):
+    """Queryset (não avaliado) das turmas ativas do aluno, usado como subconsulta"""
+    return Turma.objects.filter(alunos=aluno, ativa=True)
+
+
+def dados_painel_aluno(usuario):
+    """
+    Monta o contexto do dashboard do aluno.
+
+    Executa 4 consultas no total: aluno + estatísticas, avisos recentes,
+    próximas aulas e mensalidades pendentes. Os resultados são listas já
+    avaliadas para que o contexto possa ser guardado em cache.
+    """
+    aluno = aluno_com_estatisticas(usuario)
+    turmas = turmas_ativas(aluno)
+
+    # Avisos recentes (últimos 7 dias)
+    data_limite = timezone.now() - timedelta(days=7)
+    avisos_recentes = list(Aviso.objects.filter(
+        Q(tipo='GERAL') |
+        Q(turma__in=turmas) |
+        Q(aluno=aluno),
+        ativo=True,
+        data_criacao__gte=data_limite
+    ).select_related('autor', 'turma').distinct().order_by('-importante', '-data_criacao')[:5])
+
+    # Próximas aulas (próximos 7 dias)
+    hoje = timezone.now().date()
+    proximas_aulas = list(Aula.objects.filter(
+        turma__in=turmas,
+        data__gte=hoje,
+        data__lte=hoje + timedelta(days=7),
+        realizada=False
+    ).select_related('turma').order_by('data', 'hora_inicio')[:5])
+
+    # Mensalidades pendentes
+    mensalidades_pendentes = list(Mensalidade.objects.filter(
+        aluno=aluno,
+        status__in=['PENDENTE', 'ATRASADO']
+    ).order_by('data_vencimento')[:3])
+
+    total_aulas = aluno.total_aulas
+    percentual_presenca = (aluno.presencas / total_aulas * 100) if total_aulas > 0 else 0
+
+    return {
+        'aluno': aluno,
+        'avisos_recentes': avisos_recentes,
+        'proximas_aulas': proximas_aulas,
+        'total_aulas': total_aulas,
+        'presencas': aluno.presencas,
+        'faltas': aluno.faltas,
+        'percentual_presenca': round(percentual_presenca, 1),
+        'mensalidades_pendentes': mensalidades_pendentes,
+        'mensagens_nao_lidas': aluno.mensagens_nao_lidas,
+    }
+
+
+def dados_horarios_aluno(usuario):
+    """Contexto da página de horários: grade semanal, próximas aulas e vídeos"""
+    aluno = Aluno.objects.select_related('usuario').get(usuario=usuario)
+    turmas = turmas_ativas(aluno)
+
+    # Grade semanal compilada (cache por turma, ver paginas.grade)
+    horarios_por_dia = grade.horarios_por_dia(turmas.values_list('pk', flat=True))
+
+    # Próximas aulas (não realizadas e futuras)
+    hoje = timezone.now().date()
+    proximas_aulas = list(Aula.objects.filter(
+        turma__in=turmas,
+        data__gte=hoje,
+        realizada=False
+    ).select_related('turma').order_by('data', 'hora_inicio')[:10])
+
+    # Últimas aulas realizadas COM vídeo (máximo 5)
+    aulas_com_video = list(Aula.objects.filter(
+        turma__in=turmas,
+        realizada=True,
+        video__isnull=False
+    ).exclude(video='').select_related('turma').prefetch_related('versoes_video').order_by('-data', '-hora_inicio')[:5])
+
+    return {
+        'aluno': aluno,
+        'horarios': [horario for horarios in horarios_por_dia.values() for horario in horarios],
+        'horarios_por_dia': horarios_por_dia,
+        'dias_semana': list(horarios_por_dia),
+        'url_ical': ical.caminho_feed('aluno', aluno.pk),
+        'proximas_aulas': proximas_aulas,
+        'aulas_com_video': aulas_com_video,
+    }
+
+
+def dados_minhas_aulas_aluno(usuario):
+    """Contexto da página "Minhas aulas": próximos 30 dias e aulas com vídeo"""
+    aluno = Aluno.objects.select_related('usuario').get(usuario=usuario)
+    turmas = turmas_ativas(aluno)
+    hoje = timezone.now().date()
+
+    # Buscar aulas FUTURAS (próximos 30 dias)
+    aulas_futuras = list(Aula.objects.filter(
+        turma__in=turmas,
+        data__gt=hoje,
+        data__lte=hoje + timedelta(days=30)
+    ).select_related('turma').order_by('data', 'hora_inicio'))
+
+    # Adicionar dias até a aula
+    for aula in aulas_futuras:
+        aula.dias_ate_aula = max((aula.data - hoje).days, 0)
+
+    # Últimas 12 aulas com vídeo
+    aulas_com_video = list(Aula.objects.filter(
+        turma__in=turmas,
+        video__isnull=False
+    ).exclude(video='').select_related('turma').prefetch_related('versoes_video').order_by('-data', '-hora_inicio')[:12])
+
+    return {
+        'aluno': aluno,
+        'aulas_futuras': aulas_futuras,
+        'aulas_com_video': aulas_com_video,
+    }
@@ -0,0 +1,316 @@
+"""
+Motor de exportação em streaming para as APIs protegidas por token.
+
+As linhas são lidas do banco com .iterator(chunk_size=...) e enviadas ao
+cliente conforme são serializadas, então o uso de memória do worker não
+cresce com o tamanho da tabela.
+
+Formatos suportados (parâmetro ?formato=):
+    json   -> array JSON enviado em pedaços (padrão, compatível com o antigo)
+    jsonl  -> JSON Lines, um objeto por linha
+
+Sincronização incremental (parâmetros ?updated_since= ou ?cursor=):
+    Retorna uma página ordenada por (data_atualizacao, id) com as linhas
+    alteradas, as lápides (RegistroExcluido) do mesmo intervalo e o cursor
+    da próxima página. Exclusões podem aparecer repetidas entre páginas;
+    o consumidor deve tratá-las de forma idempotente.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch, Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Aluno, Mensalidade, RegistroExcluido, ResumoFrequenciaMensal, Turma
+
+FORMATOS = {
+    'json': 'application/json',
+    'jsonl': 'application/x-ndjson',
+}
+
+# Quantas linhas são agrupadas em cada pedaço enviado ao cliente
+LINHAS_POR_PEDACO = 200
+
+
+def _chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+def _dumps(obj):
+    return json.dumps(obj, cls=DjangoJSONEncoder)
+
+
+def _agrupar(textos):
+    """Junta pequenos pedaços de texto para não fazer um write por linha"""
+    buffer = []
+    for texto in textos:
+        buffer.append(texto)
+        if len(buffer) >= LINHAS_POR_PEDACO:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _json_array(registros):
+    yield '['
+    primeiro = True
+    for registro in registros:
+        if primeiro:
+            primeiro = False
+            yield _dumps(registro)
+        else:
+            yield ',' + _dumps(registro)
+    yield ']'
+
+
+def _json_lines(registros):
+    for registro in registros:
+        yield _dumps(registro) + '\n'
+
+
+def resposta_streaming(registros, formato='json'):
+    """
+    Cria um StreamingHttpResponse a partir de um iterável de dicts.
+
+    Formatos desconhecidos caem no padrão (array JSON).
+    """
+    if formato not in FORMATOS:
+        formato = 'json'
+    gerador = _json_lines(registros) if formato == 'jsonl' else _json_array(registros)
+    return StreamingHttpResponse(_agrupar(gerador), content_type=FORMATOS[formato])
+
+
+# ---------------------------------------------------------
+# SINCRONIZAÇÃO INCREMENTAL
+# ---------------------------------------------------------
+
+LIMITE_PADRAO = 1000
+LIMITE_MAXIMO = 10000
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def codificar_cursor(data_atualizacao, pk):
+    bruto = f"{data_atualizacao.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(bruto.encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    try:
+        bruto = base64.urlsafe_b64decode(cursor.encode()).decode()
+        data_str, pk = bruto.rsplit('|', 1)
+        data = parse_datetime(data_str)
+        if data is None:
+            raise ValueError(data_str)
+        return data, int(pk)
+    except (ValueError, UnicodeError) as e:
+        raise CursorInvalido(f'Cursor inválido: {cursor}') from e
+
+
+def interpretar_updated_since(valor):
+    """Aceita data/hora ISO 8601; datas sem fuso usam o fuso do projeto"""
+    data = parse_datetime(valor)
+    if data is None:
+        raise CursorInvalido(f'updated_since inválido: {valor}')
+    if timezone.is_naive(data):
+        data = timezone.make_aware(data)
+    return data
+
+
+def pagina_incremental(qs, modelo, serializar, cursor=None, updated_since=None, limite=LIMITE_PADRAO):
+    """
+    Monta uma página da sincronização incremental (keyset em data_atualizacao, id).
+
+    qs         -> queryset base (já filtrado)
+    modelo     -> valor de RegistroExcluido.modelo para as lápides
+    serializar -> função que transforma um objeto em dict
+    """
+    limite = max(1, min(int(limite), LIMITE_MAXIMO))
+
+    if cursor:
+        desde, desde_pk = decodificar_cursor(cursor)
+        qs = qs.filter(
+            Q(data_atualizacao__gt=desde) |
+            Q(data_atualizacao=desde, pk__gt=desde_pk)
+        )
+    elif updated_since:
+        desde = interpretar_updated_since(updated_since)
+        qs = qs.filter(data_atualizacao__gte=desde)
+    else:
+        desde = None
+
+    # Um registro a mais indica se existe próxima página
+    linhas = list(qs.order_by('data_atualizacao', 'pk')[:limite + 1])
+    tem_mais = len(linhas) > limite
+    linhas = linhas[:limite]
+
+    excluidos = RegistroExcluido.objects.filter(modelo=modelo)
+    if desde is not None:
+        excluidos = excluidos.filter(data_exclusao__gte=desde)
+    if tem_mais:
+        excluidos = excluidos.filter(data_exclusao__lte=linhas[-1].data_atualizacao)
+
+    if linhas:
+        proximo_cursor = codificar_cursor(linhas[-1].data_atualizacao, linhas[-1].pk)
+    elif desde is not None:
+        proximo_cursor = cursor or codificar_cursor(desde, 0)
+    else:
+        proximo_cursor = None
+
+    return {
+        'dados': [serializar(obj) for obj in linhas],
+        'excluidos': list(excluidos.values_list('objeto_id', flat=True).distinct()),
+        'proximo_cursor': proximo_cursor,
+        'tem_mais': tem_mais,
+    }
+
+
+def resposta_incremental(request, qs, modelo, serializar):
+    """JsonResponse com uma página da sincronização incremental, ou 400 se os parâmetros forem inválidos"""
+    try:
+        pagina = pagina_incremental(
+            qs, modelo, serializar,
+            cursor=request.GET.get('cursor'),
+            updated_since=request.GET.get('updated_since'),
+            limite=request.GET.get('limit', LIMITE_PADRAO),
+        )
+    except (CursorInvalido, ValueError) as e:
+        return JsonResponse({"detail": str(e)}, status=400)
+    return JsonResponse(pagina)
+
+
+def sincronizacao_incremental(request):
+    """Indica se a requisição pediu o modo incremental"""
+    return bool(request.GET.get('cursor') or request.GET.get('updated_since'))
+
+
+# ---------------------------------------------------------
+# ALUNOS
+# ---------------------------------------------------------
+
+def queryset_alunos(ativo=None):
+    qs = Aluno.objects.select_related('usuario').prefetch_related(
+        Prefetch('turmas', queryset=Turma.objects.only('id', 'nome'))
+    ).order_by('id')
+    if ativo is not None:
+        qs = qs.filter(ativo=ativo)
+    return qs
+
+
+def serializar_aluno(a):
+    return {
+        "id": a.id,
+        "nome": a.usuario.get_full_name(),
+        "cpf": a.cpf,
+        "data_nascimento": a.data_nascimento,
+        "telefone": a.telefone,
+        "telefone_emergencia": a.telefone_emergencia,
+        "endereco": a.endereco,
+        "data_matricula": a.data_matricula,
+        "ativo": a.ativo,
+        "observacoes": a.observacoes,
+        "turmas": [t.nome for t in a.turmas.all()],  # lista de nomes da turma
+        "data_atualizacao": a.data_atualizacao,
+    }
+
+
+def iterar_alunos(qs):
+    for a in qs.iterator(chunk_size=_chunk_size()):
+        yield serializar_aluno(a)
+
+
+# ---------------------------------------------------------
+# MENSALIDADES
+# ---------------------------------------------------------
+
+def queryset_mensalidades(status=None, mes=None, aluno_id=None):
+    qs = Mensalidade.objects.select_related("aluno", "aluno__usuario").order_by('id')
+    if status:
+        qs = qs.filter(status=status.upper())
+    if mes:
+        qs = qs.filter(mes_referencia__startswith=mes)
+    if aluno_id:
+        qs = qs.filter(aluno__id=aluno_id)
+    return qs
+
+
+def serializar_mensalidade(m, hoje):
+    # Mesma regra de Mensalidade.dias_em_atraso(), sem consultar o relógio por linha
+    atrasada = m.status in ['PENDENTE', 'ATRASADO'] and m.data_vencimento < hoje
+    return {
+        "id": m.id,
+        "aluno_id": m.aluno.id,
+        "aluno_nome": m.aluno.usuario.get_full_name() or m.aluno.usuario.username,
+        "cpf": m.aluno.cpf,
+
+        # Valores
+        "mes_referencia": m.mes_referencia,
+        "valor": float(m.valor),
+        "valor_desconto": float(m.valor_desconto),
+        "valor_final": float(m.valor_final),
+
+        # Datas
+        "data_vencimento": m.data_vencimento,
+        "data_pagamento": m.data_pagamento,
+
+        # Status
+        "status": m.status,
+        "forma_pagamento": m.forma_pagamento,
+
+        # Atraso
+        "dias_em_atraso": (hoje - m.data_vencimento).days if atrasada else 0,
+
+        "observacoes": m.observacoes,
+        "data_atualizacao": m.data_atualizacao,
+    }
+
+
+def iterar_mensalidades(qs):
+    hoje = timezone.now().date()
+    for m in qs.iterator(chunk_size=_chunk_size()):
+        yield serializar_mensalidade(m, hoje)
+
+
+# ---------------------------------------------------------
+# FREQUÊNCIAS (RESUMO MENSAL)
+# ---------------------------------------------------------
+
+def queryset_resumos_frequencia(mes=None, aluno_id=None):
+    qs = ResumoFrequenciaMensal.objects.select_related("aluno", "aluno__usuario").order_by('id')
+    if mes:
+        # yyyy-mm; formatos inválidos são ignorados, como nas mensalidades
+        try:
+            ano, numero = mes.split('-')
+            qs = qs.filter(mes__year=int(ano), mes__month=int(numero))
+        except ValueError:
+            pass
+    if aluno_id:
+        qs = qs.filter(aluno__id=aluno_id)
+    return qs
+
+
+def serializar_resumo_frequencia(r):
+    return {
+        "id": r.id,
+        "aluno_id": r.aluno.id,
+        "aluno_nome": r.aluno.usuario.get_full_name() or r.aluno.usuario.username,
+        "mes": r.mes.strftime('%Y-%m'),
+        "total": r.total,
+        "presencas": r.presencas,
+        "faltas": r.faltas,
+        "faltas_justificadas": r.justificadas,
+        "percentual_presenca": r.percentual_presenca(),
+        "data_atualizacao": r.data_atualizacao,
+    }
+
+
+def iterar_resumos_frequencia(qs):
+    for r in qs.iterator(chunk_size=_chunk_size()):
+        yield serializar_resumo_frequencia(r)
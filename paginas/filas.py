@@ -0,0 +1,14 @@
+"""
+Peças comuns às filas com reserva do projeto: eventos de webhook
+(paginas.pagamentos), vídeos das aulas (paginas.videos) e tarefas do
+Google Agenda (calendario.sincronizacao). Cada fila tem os próprios
+limites; o cálculo é o mesmo.
+"""
+import random
+from datetime import timedelta
+
+
+def calcular_backoff(tentativas, base_segundos, maximo_segundos):
+    """Espera antes da próxima tentativa: exponencial, com teto e jitter"""
+    espera = min(maximo_segundos, base_segundos * 2 ** max(tentativas - 1, 0))
+    return timedelta(seconds=espera * random.uniform(0.5, 1.0))
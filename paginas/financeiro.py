@@ -0,0 +1,303 @@
+"""
+Séries e consolidação financeira usadas pelos dashboards administrativos.
+
+A série de receita e a contagem de mensalidades por status saem de uma
+única consulta agrupada por mês (TruncMonth + agregações condicionais),
+então aumentar a janela de 6 para 24 meses não aumenta o número de idas
+ao banco.
+
+O ResultadoFinanceiroMensal é calculado a partir de Mensalidade,
+VendaIngresso, EntradaFinanceira e DespesaAdministrativa. Os sinais só
+marcam os meses tocados em MesFinanceiroPendente; os meses marcados são
+recalculados em lote (poucas consultas agrupadas, qualquer que seja o
+número de meses) antes de a tela, a API ou o admin lerem os resultados.
+"""
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .models import (
+    DespesaAdministrativa, EntradaFinanceira, Mensalidade, MesFinanceiroPendente,
+    ResultadoFinanceiroMensal, VendaIngresso,
+)
+
+MESES_PT = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun',
+            'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
+
+# Janelas aceitas pelo gráfico de receita (em meses)
+JANELAS_MESES = (6, 12, 24)
+JANELA_PADRAO = 6
+
+FILTROS_RECEITA = ('data_pagamento', 'mes_referencia')
+
+
+def somar_meses(mes, quantidade):
+    """Primeiro dia do mês `quantidade` meses depois (ou antes, se negativo)"""
+    indice = mes.year * 12 + (mes.month - 1) + quantidade
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def meses_da_janela(hoje, meses):
+    """Lista com o primeiro dia de cada mês da janela, do mais antigo ao atual"""
+    atual = hoje.replace(day=1)
+    return [somar_meses(atual, -i) for i in range(meses - 1, -1, -1)]
+
+
+def interpretar_janela(valor):
+    """Converte o parâmetro ?meses= para uma janela válida"""
+    try:
+        meses = int(valor)
+    except (TypeError, ValueError):
+        return JANELA_PADRAO
+    return meses if meses in JANELAS_MESES else JANELA_PADRAO
+
+
+def _como_data(valor):
+    # TruncMonth devolve date para DateField, mas datetime em alguns bancos
+    return valor.date() if hasattr(valor, 'date') and callable(valor.date) else valor
+
+
+def serie_receita(filtro_receita='data_pagamento', meses=JANELA_PADRAO, hoje=None):
+    """
+    Receita mensal e status das mensalidades do mês atual em uma consulta.
+
+    filtro_receita -> 'data_pagamento' (quando o dinheiro entrou) ou
+                      'mes_referencia' (competência da mensalidade)
+    meses          -> tamanho da janela do gráfico
+
+    Retorna um dict com labels, valores, receita_mes e as contagens
+    mens_pagas, mens_pendentes e mens_atrasadas do mês de referência atual.
+    """
+    if filtro_receita not in FILTROS_RECEITA:
+        filtro_receita = 'data_pagamento'
+    hoje = hoje or timezone.now().date()
+    janela = meses_da_janela(hoje, meses)
+    inicio, fim = janela[0], somar_meses(janela[-1], 1)
+
+    pago = Q(status='PAGO')
+    # Agrupa pelos dois meses ao mesmo tempo: a receita é somada pelo campo
+    # escolhido no filtro e os status sempre pelo mês de referência
+    linhas = Mensalidade.objects.filter(
+        Q(mes_referencia__gte=inicio, mes_referencia__lt=fim) |
+        Q(pago, data_pagamento__gte=inicio, data_pagamento__lt=fim)
+    ).order_by().values(
+        mes_ref=TruncMonth('mes_referencia'),
+        mes_pag=TruncMonth('data_pagamento'),
+    ).annotate(
+        total=Sum('valor_final', filter=pago),
+        pagas=Count('id', filter=pago),
+        pendentes=Count('id', filter=Q(status='PENDENTE')),
+        atrasadas=Count('id', filter=Q(status='ATRASADO')),
+    )
+
+    receita = dict.fromkeys(janela, 0)
+    status_mes_atual = {'pagas': 0, 'pendentes': 0, 'atrasadas': 0}
+    mes_atual = janela[-1]
+    campo = 'mes_pag' if filtro_receita == 'data_pagamento' else 'mes_ref'
+
+    for linha in linhas:
+        mes = _como_data(linha[campo])
+        if mes in receita and linha['total']:
+            receita[mes] += linha['total']
+        if _como_data(linha['mes_ref']) == mes_atual:
+            for chave in status_mes_atual:
+                status_mes_atual[chave] += linha[chave]
+
+    return {
+        'labels': [f"{MESES_PT[mes.month - 1]}/{str(mes.year)[2:]}" for mes in janela],
+        'valores': [float(valor) for valor in receita.values()],
+        'receita_mes': receita[mes_atual],
+        'mens_pagas': status_mes_atual['pagas'],
+        'mens_pendentes': status_mes_atual['pendentes'],
+        'mens_atrasadas': status_mes_atual['atrasadas'],
+    }
+
+
+# ---------------------------------------------------------
+# RESULTADO FINANCEIRO MENSAL
+# ---------------------------------------------------------
+
+# Campos de data que decidem em qual mês cada registro entra no resultado
+CAMPOS_DE_DATA = {
+    Mensalidade: ('data_pagamento', 'data_vencimento'),
+    VendaIngresso: ('data_venda',),
+    EntradaFinanceira: ('data_recebimento', 'data_prevista'),
+    DespesaAdministrativa: ('data_pagamento', 'data_vencimento'),
+}
+
+# Mensalidades e ingressos já entram pelas próprias tabelas; entradas
+# manuais dessas categorias seriam contadas duas vezes
+CATEGORIAS_ENTRADA_DUPLICADAS = ['MENSALIDADE', 'INGRESSO']
+
+VALOR = DecimalField(max_digits=12, decimal_places=2)
+ZERO = Decimal('0.00')
+
+
+def inicio_do_mes(valor):
+    """Primeiro dia do mês de uma data (aceita date, datetime ou 'AAAA-MM-DD')"""
+    if isinstance(valor, str):
+        try:
+            valor = date.fromisoformat(valor[:10])
+        except ValueError:
+            return None
+    if isinstance(valor, datetime):
+        valor = valor.date()
+    if isinstance(valor, date):
+        return valor.replace(day=1)
+    return None
+
+
+def meses_do_registro(instance):
+    """
+    Meses afetados por um registro, lidos direto de __dict__ para não
+    disparar consultas em campos adiados (.only/.defer).
+    """
+    meses = set()
+    for campo in CAMPOS_DE_DATA.get(type(instance), ()):
+        mes = inicio_do_mes(instance.__dict__.get(campo))
+        if mes:
+            meses.add(mes)
+    return meses
+
+
+def marcar_meses(meses):
+    """Coloca os meses na fila de recálculo (idempotente)"""
+    meses = {inicio_do_mes(mes) for mes in meses} - {None}
+    if meses:
+        MesFinanceiroPendente.objects.bulk_create(
+            [MesFinanceiroPendente(mes=mes) for mes in meses],
+            ignore_conflicts=True,
+        )
+
+
+def _somar_por_mes(qs, data, valor, inicio, fim):
+    """{mês: soma} de um queryset agrupado pelo mês da expressão `data`"""
+    linhas = qs.annotate(data_ref=data).filter(
+        data_ref__gte=inicio, data_ref__lt=fim
+    ).order_by().values(mes_ref=TruncMonth('data_ref')).annotate(
+        total=Sum(valor, output_field=VALOR)
+    )
+    return {_como_data(linha['mes_ref']): linha['total'] or ZERO for linha in linhas}
+
+
+def calcular_resultados(meses):
+    """
+    Calcula lucro_total, gasto_total e a_receber_total dos meses informados.
+
+    Receitas   -> mensalidades pagas (data de pagamento), ingressos de vendas
+                  confirmadas (data da venda) e entradas recebidas
+    Gastos     -> valor pago das despesas administrativas e comissões das
+                  vendas confirmadas
+    A receber  -> mensalidades pendentes/atrasadas (vencimento) e saldo das
+                  entradas em aberto (data prevista)
+
+    Faz uma consulta agrupada por fonte, independente do número de meses.
+    """
+    meses = sorted({inicio_do_mes(mes) for mes in meses} - {None})
+    if not meses:
+        return {}
+    inicio, fim = meses[0], somar_meses(meses[-1], 1)
+
+    receitas = [
+        _somar_por_mes(
+            Mensalidade.objects.filter(status='PAGO'),
+            F('data_pagamento'), F('valor_final'), inicio, fim
+        ),
+        _somar_por_mes(
+            VendaIngresso.objects.filter(confirmado=True),
+            F('data_venda'),
+            ExpressionWrapper(F('quantidade') * F('evento__valor_ingresso'), output_field=VALOR),
+            inicio, fim
+        ),
+        _somar_por_mes(
+            EntradaFinanceira.objects.exclude(status='CANCELADO').exclude(
+                categoria__in=CATEGORIAS_ENTRADA_DUPLICADAS
+            ),
+            F('data_recebimento'), F('valor_recebido'), inicio, fim
+        ),
+    ]
+    gastos = [
+        _somar_por_mes(
+            DespesaAdministrativa.objects.exclude(status='CANCELADO'),
+            Coalesce('data_pagamento', 'data_vencimento'), F('valor_pago'), inicio, fim
+        ),
+        _somar_por_mes(
+            VendaIngresso.objects.filter(confirmado=True),
+            F('data_venda'), F('valor_comissao'), inicio, fim
+        ),
+    ]
+    a_receber = [
+        _somar_por_mes(
+            Mensalidade.objects.filter(status__in=['PENDENTE', 'ATRASADO']),
+            F('data_vencimento'), F('valor_final'), inicio, fim
+        ),
+        _somar_por_mes(
+            EntradaFinanceira.objects.filter(status__in=['PENDENTE', 'ATRASADO', 'PARCIAL']).exclude(
+                categoria__in=CATEGORIAS_ENTRADA_DUPLICADAS
+            ),
+            F('data_prevista'),
+            ExpressionWrapper(F('valor_total') - F('valor_recebido'), output_field=VALOR),
+            inicio, fim
+        ),
+    ]
+
+    def total(fontes, mes):
+        return sum((fonte.get(mes, ZERO) for fonte in fontes), ZERO).quantize(ZERO)
+
+    return {
+        mes: {
+            'lucro_total': total(receitas, mes),
+            'gasto_total': total(gastos, mes),
+            'a_receber_total': total(a_receber, mes),
+        }
+        for mes in meses
+    }
+
+
+def recalcular_meses(meses):
+    """Recalcula e grava (upsert) o ResultadoFinanceiroMensal dos meses"""
+    resultados = calcular_resultados(meses)
+    if not resultados:
+        return 0
+    agora = timezone.now()
+    ResultadoFinanceiroMensal.objects.bulk_create(
+        [
+            ResultadoFinanceiroMensal(mes=mes, calculado_em=agora, data_atualizacao=agora, **valores)
+            for mes, valores in resultados.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['mes'],
+        update_fields=['lucro_total', 'gasto_total', 'a_receber_total', 'calculado_em', 'data_atualizacao'],
+    )
+    return len(resultados)
+
+
+def processar_meses_pendentes():
+    """
+    Esvazia a fila de meses marcados e recalcula só esses meses.
+
+    Os itens saem da fila antes do cálculo: um mês marcado de novo durante
+    o cálculo volta para a fila e é processado na próxima chamada.
+    """
+    pendentes = list(MesFinanceiroPendente.objects.values_list('id', 'mes'))
+    if not pendentes:
+        return 0
+    MesFinanceiroPendente.objects.filter(id__in=[pk for pk, _ in pendentes]).delete()
+    meses = [mes for _, mes in pendentes]
+    try:
+        return recalcular_meses(meses)
+    except Exception:
+        marcar_meses(meses)
+        raise
+
+
+def todos_os_meses():
+    """Todos os meses que aparecem nas tabelas de origem"""
+    meses = set()
+    for modelo, campos in CAMPOS_DE_DATA.items():
+        for campo in campos:
+            meses.update(modelo.objects.exclude(**{f'{campo}__isnull': True}).dates(campo, 'month'))
+    return meses
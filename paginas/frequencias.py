@@ -0,0 +1,235 @@
+"""
+Registro de frequência de uma aula inteira de uma vez.
+
+A chamada da turma (admin ou tablet do professor, via API) vira um único
+bulk_create com update_conflicts sobre (aluno, aula) dentro de uma
+transação: cria quem ainda não tinha frequência e atualiza o status de quem
+já tinha, com o mesmo número de consultas para 5 ou 50 alunos.
+
+bulk_create não dispara os sinais de Frequencia, então o painel dos alunos
+da aula é invalidado aqui, depois do commit.
+
+O ResumoFrequenciaMensal (contagens por aluno e mês da aula) é mantido de
+forma incremental: cada gravação recalcula só os pares (aluno, mês)
+tocados, com uma consulta agrupada, seja pelo registro em lote daqui ou
+pelos sinais de Frequencia/Aula em paginas.signals.
+
+A série do gráfico de frequência sai do resumo (ou, na quebra por turma,
+de uma consulta agrupada por TruncMonth) como listas paralelas, sem
+instanciar modelos; versao_serie() dá o validador barato usado no
+ETag/Last-Modified da view.
+"""
+import hashlib
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import painel_cache
+from .financeiro import MESES_PT, inicio_do_mes, meses_da_janela, somar_meses
+from .models import Aluno, Aula, Frequencia, ResumoFrequenciaMensal
+
+STATUS_VALIDOS = {codigo for codigo, _ in Frequencia.STATUS_CHOICES}
+
+
+class FrequenciaInvalida(ValueError):
+    """Status desconhecido ou aluno que não é da turma da aula"""
+
+
+def registrar_frequencias(aula, status_por_aluno, justificativas=None):
+    """
+    Grava a frequência da aula.
+
+    status_por_aluno -> {aluno_id: status}
+    justificativas   -> {aluno_id: texto} opcional; sem ele a justificativa
+                        dos registros existentes não é tocada
+
+    Levanta FrequenciaInvalida sem gravar nada se algum aluno não for da
+    turma ou algum status não existir. Retorna o número de alunos gravados.
+    """
+    invalidos = {status for status in status_por_aluno.values() if status not in STATUS_VALIDOS}
+    if invalidos:
+        raise FrequenciaInvalida(f'Status inválido: {", ".join(sorted(map(str, invalidos)))}')
+
+    alunos = dict(
+        Aluno.objects.filter(turmas=aula.turma_id, pk__in=list(status_por_aluno)).values_list('pk', 'usuario_id')
+    )
+    fora_da_turma = set(status_por_aluno) - set(alunos)
+    if fora_da_turma:
+        raise FrequenciaInvalida(
+            f'Aluno(s) fora da turma da aula: {", ".join(map(str, sorted(fora_da_turma)))}'
+        )
+
+    campos = ['status']
+    with transaction.atomic():
+        if justificativas is not None:
+            campos.append('justificativa')
+            # Quem veio sem justificativa mantém a que já tinha
+            justificativas = {
+                **dict(Frequencia.objects.filter(aula=aula, aluno_id__in=list(status_por_aluno)).exclude(
+                    justificativa=''
+                ).values_list('aluno_id', 'justificativa')),
+                **justificativas,
+            }
+        justificativas = justificativas or {}
+
+        Frequencia.objects.bulk_create(
+            [
+                Frequencia(
+                    aluno_id=aluno_id, aula_id=aula.pk, status=status,
+                    justificativa=justificativas.get(aluno_id, ''),
+                )
+                for aluno_id, status in status_por_aluno.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['aluno', 'aula'],
+            update_fields=campos,
+        )
+        atualizar_resumos((aluno_id, aula.data) for aluno_id in status_por_aluno)
+        usuarios = set(alunos.values())
+        transaction.on_commit(lambda: painel_cache.invalidar_usuarios(usuarios))
+    return len(status_por_aluno)
+
+
+# ==================== RESUMO MENSAL ====================
+
+STATUS_JUSTIFICADOS = ('FALTA_JUSTIFICADA', 'ATESTADO')
+
+
+def _contagens(frequencias, *grupo):
+    """Frequências agrupadas por (campos de `grupo`, mês da aula) em uma consulta"""
+    return frequencias.order_by().values(*(grupo or ('aluno_id',)), mes_aula=TruncMonth('aula__data')).annotate(
+        n_total=Count('id'),
+        n_presencas=Count('id', filter=Q(status='PRESENTE')),
+        n_faltas=Count('id', filter=Q(status='FALTA')),
+        n_justificadas=Count('id', filter=Q(status__in=STATUS_JUSTIFICADOS)),
+    )
+
+
+def _resumo(linha):
+    return ResumoFrequenciaMensal(
+        aluno_id=linha['aluno_id'], mes=inicio_do_mes(linha['mes_aula']), total=linha['n_total'],
+        presencas=linha['n_presencas'], faltas=linha['n_faltas'], justificadas=linha['n_justificadas'],
+    )
+
+
+def atualizar_resumos(pares):
+    """
+    Recalcula o resumo dos pares (aluno_id, data) informados; qualquer data
+    do mês serve. Pares que ficaram sem frequência perdem a linha do resumo.
+    """
+    pares = {(aluno_id, inicio_do_mes(data)) for aluno_id, data in pares if aluno_id and data}
+    if not pares:
+        return
+    meses = sorted({mes for _, mes in pares})
+    linhas = _contagens(Frequencia.objects.filter(
+        aluno_id__in={aluno_id for aluno_id, _ in pares},
+        aula__data__gte=meses[0],
+        aula__data__lt=somar_meses(meses[-1], 1),
+    ))
+    resumos = [resumo for resumo in map(_resumo, linhas) if (resumo.aluno_id, resumo.mes) in pares]
+
+    if resumos:
+        ResumoFrequenciaMensal.objects.bulk_create(
+            resumos,
+            update_conflicts=True,
+            unique_fields=['aluno', 'mes'],
+            update_fields=['presencas', 'faltas', 'justificadas', 'total', 'data_atualizacao'],
+        )
+    vazios = pares - {(resumo.aluno_id, resumo.mes) for resumo in resumos}
+    if vazios:
+        ResumoFrequenciaMensal.objects.filter(
+            reduce(or_, (Q(aluno_id=aluno_id, mes=mes) for aluno_id, mes in vazios))
+        ).delete()
+
+
+def atualizar_resumos_das_aulas(chaves):
+    """Como atualizar_resumos, mas a partir de pares (aluno_id, aula_id)"""
+    chaves = {(aluno_id, aula_id) for aluno_id, aula_id in chaves if aluno_id and aula_id}
+    if not chaves:
+        return
+    datas = dict(Aula.objects.filter(pk__in={aula_id for _, aula_id in chaves}).values_list('pk', 'data'))
+    atualizar_resumos((aluno_id, datas.get(aula_id)) for aluno_id, aula_id in chaves)
+
+
+def recalcular_todos_resumos():
+    """Reconstrói a tabela de resumo inteira a partir das frequências. Retorna o número de linhas"""
+    with transaction.atomic():
+        ResumoFrequenciaMensal.objects.all().delete()
+        resumos = ResumoFrequenciaMensal.objects.bulk_create(
+            map(_resumo, _contagens(Frequencia.objects.all()).iterator()), batch_size=1000
+        )
+    return len(resumos)
+
+
+# ==================== SÉRIE DO GRÁFICO ====================
+
+def _percentual(parte, total):
+    return round(parte / total * 100, 1) if total else 0
+
+
+def versao_serie(aluno, meses, hoje=None):
+    """
+    (etag, última alteração) da série do aluno na janela, em uma consulta.
+
+    Toda gravação de frequência regrava o resumo do mês, então a última
+    data_atualizacao, o número de linhas e a soma dos totais mudam sempre
+    que o gráfico mudaria. O início da janela entra no etag porque ela anda
+    com a virada do mês.
+    """
+    inicio = meses_da_janela(hoje or timezone.now().date(), meses)[0]
+    versao = ResumoFrequenciaMensal.objects.filter(aluno=aluno, mes__gte=inicio).aggregate(
+        ultima=Max('data_atualizacao'), linhas=Count('id'), soma=Sum('total'),
+    )
+    bruto = f"{aluno.pk}:{inicio}:{meses}:{versao['ultima']}:{versao['linhas']}:{versao['soma']}"
+    return hashlib.md5(bruto.encode()).hexdigest(), versao['ultima']
+
+
+def serie_frequencia(aluno, meses, por_turma=False, hoje=None):
+    """
+    Série mensal de frequência do aluno nos últimos `meses` meses.
+
+    Retorna listas paralelas (só meses com aula): meses (AAAA-MM), labels,
+    total e os percentuais de presencas, faltas e justificadas. Com
+    por_turma, inclui 'turmas' com as mesmas listas por turma, alinhadas
+    aos meses (None onde a turma não teve aula).
+    """
+    inicio = meses_da_janela(hoje or timezone.now().date(), meses)[0]
+    linhas = list(ResumoFrequenciaMensal.objects.filter(aluno=aluno, mes__gte=inicio).order_by('mes').values_list(
+        'mes', 'total', 'presencas', 'faltas', 'justificadas'
+    ))
+    serie = {
+        'meses': [mes.strftime('%Y-%m') for mes, *_ in linhas],
+        'labels': [f"{MESES_PT[mes.month - 1]}/{mes.strftime('%y')}" for mes, *_ in linhas],
+        'total': [total for _, total, *_ in linhas],
+        'presencas': [_percentual(presencas, total) for _, total, presencas, _, _ in linhas],
+        'faltas': [_percentual(faltas, total) for _, total, _, faltas, _ in linhas],
+        'justificadas': [_percentual(justificadas, total) for _, total, _, _, justificadas in linhas],
+    }
+    if not por_turma:
+        return serie
+
+    posicao = {mes: i for i, mes in enumerate(serie['meses'])}
+    turmas = {}
+    for linha in _contagens(
+        Frequencia.objects.filter(aluno=aluno, aula__data__gte=inicio), 'aula__turma_id', 'aula__turma__nome'
+    ).order_by('aula__turma__nome', 'mes_aula'):
+        turma = turmas.get(linha['aula__turma_id'])
+        if turma is None:
+            vazio = [None] * len(posicao)
+            turma = turmas[linha['aula__turma_id']] = {
+                'id': linha['aula__turma_id'], 'nome': linha['aula__turma__nome'],
+                'total': list(vazio), 'presencas': list(vazio), 'faltas': list(vazio), 'justificadas': list(vazio),
+            }
+        i = posicao.get(inicio_do_mes(linha['mes_aula']).strftime('%Y-%m'))
+        if i is None:
+            continue
+        turma['total'][i] = linha['n_total']
+        turma['presencas'][i] = _percentual(linha['n_presencas'], linha['n_total'])
+        turma['faltas'][i] = _percentual(linha['n_faltas'], linha['n_total'])
+        turma['justificadas'][i] = _percentual(linha['n_justificadas'], linha['n_total'])
+    serie['turmas'] = list(turmas.values())
+    return serie
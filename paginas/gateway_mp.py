@@ -0,0 +1,371 @@
+"""
+Cliente do Mercado Pago compartilhado pelo processo.
+
+O SDK oficial abre uma requests.Session nova a cada chamada (handshake TLS
+toda vez) e usa 60s de timeout. Aqui o SDK é criado uma vez por processo
+com um HttpClient próprio:
+
+    Conexões     -> uma Session com pool de conexões keep-alive
+                    (MP_POOL_CONEXOES), segura para as threads do
+                    processar_webhooks
+    Timeouts     -> (conexão, leitura) explícitos: MP_TIMEOUT_CONEXAO e
+                    MP_TIMEOUT_LEITURA
+    Repetição    -> erros de rede, 429 e 5xx são tentados de novo até
+                    MP_TENTATIVAS vezes, com backoff exponencial e jitter.
+                    Criação de pagamento só é repetida com chave de
+                    idempotência (X-Idempotency-Key)
+    Disjuntor    -> depois de MP_DISJUNTOR_FALHAS falhas seguidas as chamadas
+                    falham na hora (GatewayIndisponivel) por
+                    MP_DISJUNTOR_ABERTO_SEGUNDOS; depois disso uma chamada de
+                    teste decide se ele fecha ou abre de novo
+    Métricas     -> latência, chamadas e erros por operação, em memória
+                    (metricas.resumo(), exibidas no admin dos webhooks)
+
+Para testes e desenvolvimento sem credenciais, MP_BACKEND = 'fake' (ou
+configurar_cliente(ClienteMercadoPago(sdk=MercadoPagoFake()))) troca o SDK
+por um backend em memória com a mesma interface.
+"""
+import itertools
+import random
+import threading
+import time
+from collections import deque
+
+import mercadopago
+import requests
+from django.conf import settings
+from mercadopago.config import RequestOptions
+from mercadopago.http import HttpClient
+from requests.adapters import HTTPAdapter
+
+# Respostas que indicam falha temporária do gateway
+STATUS_TEMPORARIOS = {429, 500, 502, 503, 504}
+# Amostras guardadas por operação para o cálculo do p95
+AMOSTRAS_LATENCIA = 200
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+class ErroGateway(Exception):
+    """Falha temporária ao falar com o Mercado Pago (o evento é tentado de novo)"""
+
+
+class GatewayIndisponivel(ErroGateway):
+    """Disjuntor aberto: o Mercado Pago falhou seguidamente e não foi chamado"""
+
+
+# ---------------------------------------------------------
+# MÉTRICAS
+# ---------------------------------------------------------
+
+class MetricasGateway:
+    """Contadores de chamadas e latência por operação (por processo)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dados = {}
+
+    def registrar(self, operacao, duracao_ms, erro=False):
+        with self._lock:
+            dados = self._dados.setdefault(operacao, {
+                'chamadas': 0, 'erros': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'amostras': deque(maxlen=AMOSTRAS_LATENCIA),
+            })
+            dados['chamadas'] += 1
+            dados['erros'] += int(erro)
+            dados['total_ms'] += duracao_ms
+            dados['max_ms'] = max(dados['max_ms'], duracao_ms)
+            dados['amostras'].append(duracao_ms)
+
+    def resumo(self):
+        """{operação: chamadas, erros, media_ms, p95_ms, max_ms}"""
+        with self._lock:
+            resumo = {}
+            for operacao, dados in sorted(self._dados.items()):
+                amostras = sorted(dados['amostras'])
+                p95 = amostras[min(len(amostras) - 1, int(len(amostras) * 0.95))] if amostras else 0
+                resumo[operacao] = {
+                    'chamadas': dados['chamadas'],
+                    'erros': dados['erros'],
+                    'media_ms': round(dados['total_ms'] / dados['chamadas'], 1) if dados['chamadas'] else 0,
+                    'p95_ms': round(p95, 1),
+                    'max_ms': round(dados['max_ms'], 1),
+                }
+            return resumo
+
+    def zerar(self):
+        with self._lock:
+            self._dados.clear()
+
+
+metricas = MetricasGateway()
+
+
+# ---------------------------------------------------------
+# DISJUNTOR
+# ---------------------------------------------------------
+
+class Disjuntor:
+    """
+    Circuit breaker simples: FECHADO -> ABERTO após `limite_falhas` falhas
+    seguidas; depois de `tempo_aberto` segundos deixa passar uma chamada de
+    teste (MEIO_ABERTO) que fecha ou reabre o circuito.
+    """
+
+    def __init__(self, limite_falhas=5, tempo_aberto=30, relogio=time.monotonic):
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+        self.relogio = relogio
+        self._lock = threading.Lock()
+        self.falhas = 0
+        self.aberto_ate = None
+        self._testando = False
+
+    @property
+    def estado(self):
+        if self.aberto_ate is None:
+            return 'FECHADO'
+        return 'ABERTO' if self.relogio() < self.aberto_ate else 'MEIO_ABERTO'
+
+    def permite(self):
+        """True se a chamada pode ir ao gateway"""
+        with self._lock:
+            if self.aberto_ate is None:
+                return True
+            if self.relogio() < self.aberto_ate or self._testando:
+                return False
+            # Só uma chamada de teste por vez
+            self._testando = True
+            return True
+
+    def sucesso(self):
+        with self._lock:
+            self.falhas = 0
+            self.aberto_ate = None
+            self._testando = False
+
+    def falha(self):
+        with self._lock:
+            self.falhas += 1
+            if self._testando or self.falhas >= self.limite_falhas:
+                self.aberto_ate = self.relogio() + self.tempo_aberto
+            self._testando = False
+
+
+# ---------------------------------------------------------
+# HTTP
+# ---------------------------------------------------------
+
+class HttpClientPool(HttpClient):
+    """HttpClient do SDK com uma Session compartilhada e timeouts explícitos"""
+
+    def __init__(self, timeout_conexao=3.05, timeout_leitura=10, tamanho_pool=10):
+        self.timeout = (timeout_conexao, timeout_leitura)
+        self.sessao = requests.Session()
+        # A repetição fica com o ClienteMercadoPago (que conhece a operação)
+        adaptador = HTTPAdapter(pool_connections=tamanho_pool, pool_maxsize=tamanho_pool, max_retries=0)
+        self.sessao.mount('https://', adaptador)
+        self.sessao.mount('http://', adaptador)
+
+    def request(self, method, url, maxretries=None, **kwargs):
+        kwargs['timeout'] = self.timeout
+        resposta = self.sessao.request(method, url, **kwargs)
+        try:
+            corpo = resposta.json()
+        except ValueError:
+            corpo = {'message': resposta.text}
+        return {'status': resposta.status_code, 'response': corpo}
+
+
+# ---------------------------------------------------------
+# CLIENTE
+# ---------------------------------------------------------
+
+class ClienteMercadoPago:
+    """Operações do Mercado Pago usadas pelo sistema, com repetição, disjuntor e métricas"""
+
+    def __init__(self, sdk=None, tentativas=None, disjuntor=None, backoff_base=None, dormir=time.sleep):
+        if sdk is None:
+            sdk = mercadopago.SDK(
+                settings.MP_ACCESS_TOKEN,
+                http_client=HttpClientPool(
+                    timeout_conexao=_config('MP_TIMEOUT_CONEXAO', 3.05),
+                    timeout_leitura=_config('MP_TIMEOUT_LEITURA', 10),
+                    tamanho_pool=_config('MP_POOL_CONEXOES', 10),
+                ),
+            )
+        self.sdk = sdk
+        self.tentativas = tentativas or _config('MP_TENTATIVAS', 3)
+        self.disjuntor = disjuntor or Disjuntor(
+            limite_falhas=_config('MP_DISJUNTOR_FALHAS', 5),
+            tempo_aberto=_config('MP_DISJUNTOR_ABERTO_SEGUNDOS', 30),
+        )
+        self.backoff_base = backoff_base if backoff_base is not None else _config('MP_BACKOFF_BASE_SEGUNDOS', 0.2)
+        self.dormir = dormir
+
+    def _espera(self, tentativa):
+        # "Full jitter": espalha as repetições de várias threads no tempo
+        return random.uniform(0, self.backoff_base * 2 ** (tentativa - 1))
+
+    def _chamar(self, operacao, funcao, repetir=True):
+        """
+        Executa `funcao` (uma chamada do SDK) respeitando o disjuntor.
+
+        Retorna a resposta do SDK ({'status', 'response'}); 4xx voltam para
+        quem chamou. Levanta GatewayIndisponivel com o disjuntor aberto e
+        ErroGateway se a rede falhar em todas as tentativas.
+        """
+        tentativas = self.tentativas if repetir else 1
+        resposta = erro = None
+        for tentativa in range(1, tentativas + 1):
+            if not self.disjuntor.permite():
+                metricas.registrar(f'{operacao}:disjuntor_aberto', 0, erro=True)
+                raise GatewayIndisponivel(f'Mercado Pago indisponível (disjuntor aberto) em {operacao}')
+
+            inicio = time.perf_counter()
+            try:
+                resposta, erro = funcao(), None
+                falhou = resposta['status'] in STATUS_TEMPORARIOS
+            except requests.RequestException as e:
+                resposta, erro = None, e
+                falhou = True
+            metricas.registrar(operacao, (time.perf_counter() - inicio) * 1000, erro=falhou)
+
+            if not falhou:
+                self.disjuntor.sucesso()
+                return resposta
+            self.disjuntor.falha()
+            if tentativa < tentativas:
+                self.dormir(self._espera(tentativa))
+
+        if resposta is not None:
+            return resposta
+        raise ErroGateway(f'Falha de comunicação com o Mercado Pago em {operacao}: {erro}')
+
+    def criar_preferencia(self, dados):
+        # Repetir no pior caso cria uma preferência a mais, que nunca é paga
+        return self._chamar('preferencia.criar', lambda: self.sdk.preference().create(dados))
+
+    def criar_pagamento(self, dados, chave_idempotencia=None):
+        """Cria o pagamento; sem chave de idempotência não há repetição (evita cobrança dupla)"""
+        opcoes = None
+        if chave_idempotencia:
+            opcoes = RequestOptions(
+                access_token=settings.MP_ACCESS_TOKEN,
+                custom_headers={'x-idempotency-key': chave_idempotencia},
+            )
+        return self._chamar(
+            'pagamento.criar',
+            lambda: self.sdk.payment().create(dados, request_options=opcoes),
+            repetir=bool(chave_idempotencia),
+        )
+
+    def buscar_pagamento(self, payment_id):
+        """Dados do pagamento, ou None se ele não existir"""
+        resposta = self._chamar('pagamento.buscar', lambda: self.sdk.payment().get(payment_id))
+        if resposta['status'] == 200:
+            return resposta['response']
+        if resposta['status'] == 404:
+            return None
+        raise ErroGateway(f"Mercado Pago respondeu {resposta['status']} para o pagamento {payment_id}")
+
+
+# ---------------------------------------------------------
+# BACKEND FAKE
+# ---------------------------------------------------------
+
+class MercadoPagoFake:
+    """
+    Substituto em memória do mercadopago.SDK (mesmas chamadas e formato de
+    resposta). falhar(n, status) faz as próximas n chamadas responderem
+    `status` (ou levantarem erro de rede, com status=None).
+    """
+
+    def __init__(self, status_pagamento='approved'):
+        self.status_pagamento = status_pagamento
+        self.pagamentos = {}
+        self.preferencias = {}
+        self.chamadas = []
+        self._falhas = deque()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def falhar(self, vezes=1, status=503):
+        self._falhas.extend([status] * vezes)
+
+    def _responder(self, chamada, funcao):
+        with self._lock:
+            self.chamadas.append(chamada)
+            if self._falhas:
+                status = self._falhas.popleft()
+                if status is None:
+                    raise requests.ConnectionError('Falha simulada')
+                return {'status': status, 'response': {'message': 'Falha simulada'}}
+            return funcao()
+
+    def payment(self):
+        return _PagamentosFake(self)
+
+    def preference(self):
+        return _PreferenciasFake(self)
+
+
+class _PagamentosFake:
+    def __init__(self, fake):
+        self.fake = fake
+
+    def create(self, dados, request_options=None):
+        def criar():
+            pagamento = dict(dados, id=next(self.fake._ids), status=self.fake.status_pagamento,
+                             status_detail='accredited' if self.fake.status_pagamento == 'approved' else '')
+            self.fake.pagamentos[str(pagamento['id'])] = pagamento
+            return {'status': 201, 'response': pagamento}
+        return self.fake._responder('pagamento.criar', criar)
+
+    def get(self, payment_id, request_options=None):
+        def buscar():
+            pagamento = self.fake.pagamentos.get(str(payment_id))
+            if pagamento is None:
+                return {'status': 404, 'response': {'message': 'Payment not found'}}
+            return {'status': 200, 'response': pagamento}
+        return self.fake._responder('pagamento.buscar', buscar)
+
+
+class _PreferenciasFake:
+    def __init__(self, fake):
+        self.fake = fake
+
+    def create(self, dados, request_options=None):
+        def criar():
+            preference_id = f'fake-pref-{next(self.fake._ids)}'
+            self.fake.preferencias[preference_id] = dados
+            return {'status': 201, 'response': dict(dados, id=preference_id)}
+        return self.fake._responder('preferencia.criar', criar)
+
+
+# ---------------------------------------------------------
+# INSTÂNCIA DO PROCESSO
+# ---------------------------------------------------------
+
+_cliente = None
+_cliente_lock = threading.Lock()
+
+
+def obter_cliente():
+    """Cliente compartilhado pelo processo (criado na primeira chamada)"""
+    global _cliente
+    if _cliente is None:
+        with _cliente_lock:
+            if _cliente is None:
+                sdk = MercadoPagoFake() if _config('MP_BACKEND', 'sdk') == 'fake' else None
+                _cliente = ClienteMercadoPago(sdk=sdk)
+    return _cliente
+
+
+def configurar_cliente(cliente):
+    """Troca o cliente do processo (None volta ao padrão na próxima chamada)"""
+    global _cliente
+    with _cliente_lock:
+        _cliente = cliente
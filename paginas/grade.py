@@ -0,0 +1,138 @@
+"""
+Grade semanal compilada das turmas (cache de HorarioAula).
+
+A grade quase nunca muda, mas era remontada a cada acesso com um loop em
+Python e get_dia_semana_display(). Aqui cada turma é compilada uma vez
+para uma estrutura compacta e guardada no cache padrão do Django:
+
+    {'nome', 'modalidade', 'professor', 'ativa', 'data_fim',
+     'horarios': ((dia, inicio, fim, sala), ...)}
+
+dia é o índice da semana (0 = segunda, como date.weekday()) e inicio/fim
+são minutos desde a meia-noite. Várias turmas são lidas com um único
+get_many; só as que faltam vão ao banco, em uma consulta. Os sinais de
+HorarioAula, Turma e User (professor) apagam a grade da turma afetada.
+
+A mesma grade alimenta o painel do aluno, o admin e o feed iCal.
+"""
+from collections import namedtuple
+from datetime import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import HorarioAula, Turma
+
+# HorarioAula.DIAS_SEMANA já está na ordem de date.weekday()
+INDICE_DIAS = {codigo: indice for indice, (codigo, _) in enumerate(HorarioAula.DIAS_SEMANA)}
+NOMES_DIAS = [nome for _, nome in HorarioAula.DIAS_SEMANA]
+ABREVIACOES_DIAS = ['Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sáb', 'Dom']
+
+
+def _timeout():
+    return getattr(settings, 'GRADE_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+def _chave(turma_id):
+    return f'grade:turma:{turma_id}'
+
+
+def _minutos(hora):
+    return hora.hour * 60 + hora.minute
+
+
+def _hora(minutos):
+    return time(*divmod(minutos, 60))
+
+
+class Horario(namedtuple('Horario', 'turma_id turma_nome modalidade professor dia inicio fim sala')):
+    """Um horário da grade expandida, com os campos que as telas usam"""
+    __slots__ = ()
+
+    @property
+    def dia_nome(self):
+        return NOMES_DIAS[self.dia]
+
+    @property
+    def hora_inicio(self):
+        return _hora(self.inicio)
+
+    @property
+    def hora_fim(self):
+        return _hora(self.fim)
+
+
+def _compilar(turma_ids):
+    """Monta a grade das turmas informadas em uma consulta"""
+    grades = {
+        turma.pk: {
+            'nome': turma.nome,
+            'modalidade': turma.modalidade,
+            'professor': (turma.professor.get_full_name() or turma.professor.username) if turma.professor else '',
+            'ativa': turma.ativa,
+            'data_fim': turma.data_fim,
+            'horarios': [],
+        }
+        for turma in Turma.objects.filter(pk__in=turma_ids).select_related('professor').only(
+            'nome', 'modalidade', 'ativa', 'data_fim', 'professor__first_name', 'professor__last_name', 'professor__username'
+        )
+    }
+    for turma_id, dia_semana, hora_inicio, hora_fim, sala in HorarioAula.objects.filter(
+        turma_id__in=grades
+    ).values_list('turma_id', 'dia_semana', 'hora_inicio', 'hora_fim', 'sala'):
+        grades[turma_id]['horarios'].append(
+            (INDICE_DIAS[dia_semana], _minutos(hora_inicio), _minutos(hora_fim), sala)
+        )
+    for grade in grades.values():
+        grade['horarios'] = tuple(sorted(grade['horarios']))
+    return grades
+
+
+def grades_das_turmas(turma_ids):
+    """{turma_id: grade compilada}; turmas inexistentes ficam de fora"""
+    turma_ids = list(dict.fromkeys(turma_ids))
+    em_cache = cache.get_many([_chave(turma_id) for turma_id in turma_ids])
+    grades = {turma_id: em_cache[_chave(turma_id)] for turma_id in turma_ids if _chave(turma_id) in em_cache}
+
+    faltando = [turma_id for turma_id in turma_ids if turma_id not in grades]
+    if faltando:
+        compiladas = _compilar(faltando)
+        cache.set_many({_chave(turma_id): grade for turma_id, grade in compiladas.items()}, _timeout())
+        grades.update(compiladas)
+    return grades
+
+
+def grade_da_turma(turma_id):
+    return grades_das_turmas([turma_id]).get(turma_id)
+
+
+def horarios(turma_ids):
+    """Horários das turmas em ordem de dia da semana e início"""
+    return sorted(
+        (
+            Horario(turma_id, grade['nome'], grade['modalidade'], grade['professor'], *horario)
+            for turma_id, grade in grades_das_turmas(turma_ids).items()
+            for horario in grade['horarios']
+        ),
+        key=lambda h: (h.dia, h.inicio, h.turma_nome),
+    )
+
+
+def horarios_por_dia(turma_ids):
+    """{nome do dia: [Horario, ...]} com os dias na ordem da semana"""
+    por_dia = {}
+    for horario in horarios(turma_ids):
+        por_dia.setdefault(horario.dia_nome, []).append(horario)
+    return por_dia
+
+
+def resumo_da_grade(grade):
+    """Texto curto da grade ("Seg 18:00-19:00, Qua 18:00-19:00") para listas"""
+    return ', '.join(
+        f'{ABREVIACOES_DIAS[dia]} {_hora(inicio):%H:%M}-{_hora(fim):%H:%M}'
+        for dia, inicio, fim, _ in grade['horarios']
+    )
+
+
+def invalidar_turmas(turma_ids):
+    cache.delete_many([_chave(turma_id) for turma_id in turma_ids if turma_id is not None])
@@ -0,0 +1,295 @@
+"""
+Feed iCalendar (.ics) somente leitura das aulas, por aluno e por turma.
+
+Quem só quer ver as aulas no celular assina a URL do feed no calendário
+(Google, Apple, Outlook) em vez de conectar a conta Google, sem nenhuma
+chamada à API do Google por aula e por aluno.
+
+Cada turma tem uma versão no banco (Turma.agenda_atualizada_em), trocada
+com update() pelos sinais e por gerar_aulas sempre que uma Aula, um
+HorarioAula ou a própria Turma muda. Por estar no banco, a troca feita
+num comando do cron ou em outro worker vale para todos os processos. O
+ETag do feed é calculado só a partir das versões das turmas e do início da
+janela, então o polling dos clientes recebe 304 com uma consulta e sem
+montar nada. Os eventos de cada turma ficam em cache pela versão e o feed
+é enviado em streaming; num miss o bloco da turma é gerado lendo as aulas
+com .iterator() e guardado ao final.
+
+Eventos:
+    - uma VEVENT por Aula a partir do primeiro dia do mês anterior;
+    - para as turmas ativas, uma VEVENT semanal (RRULE) por horário da grade
+      compilada (paginas.grade), começando depois da última aula gerada,
+      para que o calendário mostre a rotina mesmo antes de gerar_aulas.
+
+Horários: DTSTART/DTEND usam TZID=settings.TIME_ZONE e o VCALENDAR leva o
+VTIMEZONE correspondente (gerado do zoneinfo para a janela do feed), que o
+Outlook exige. O UNTIL das rotinas vai em UTC (RFC 5545, 3.3.10).
+
+A URL leva uma assinatura (django.core.signing) do tipo e do id, já que os
+clientes de calendário não fazem login.
+"""
+import hashlib
+from datetime import datetime, time as hora, timedelta, timezone as dt_timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+from . import grade
+from .financeiro import somar_meses
+from .models import Aula, Turma
+
+SALT = 'paginas.ical'
+TIPOS = ('aluno', 'turma')
+UID_DOMINIO = 'giro-dance'
+EPOCA = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _timeout():
+    return getattr(settings, 'ICAL_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+# ---------------------------------------------------------
+# ASSINATURA DAS URLS
+# ---------------------------------------------------------
+
+def token_feed(tipo, pk):
+    return signing.Signer(salt=SALT).signature(f'{tipo}:{pk}')
+
+
+def token_valido(tipo, pk, token):
+    return constant_time_compare(token_feed(tipo, pk), token)
+
+
+def caminho_feed(tipo, pk):
+    return reverse(f'paginas:feed_ical_{tipo}', args=[pk, token_feed(tipo, pk)])
+
+
+# ---------------------------------------------------------
+# VERSÕES POR TURMA
+# ---------------------------------------------------------
+
+def _microssegundos(momento):
+    return (momento - EPOCA) // timedelta(microseconds=1)
+
+
+def versoes(turma_ids):
+    """{turma_id: versão} em microssegundos, lidos de Turma.agenda_atualizada_em"""
+    return {
+        turma_id: _microssegundos(atualizada_em)
+        for turma_id, atualizada_em in Turma.objects.filter(pk__in=list(turma_ids)).values_list(
+            'pk', 'agenda_atualizada_em'
+        )
+    }
+
+
+def invalidar_turmas(turma_ids):
+    """Troca a versão das turmas: muda o ETag e descarta os eventos em cache. Retorna a nova"""
+    agora = timezone.now()
+    Turma.objects.filter(pk__in=[turma_id for turma_id in turma_ids if turma_id is not None]).update(
+        agenda_atualizada_em=agora
+    )
+    return agora
+
+
+def inicio_da_janela(hoje=None):
+    return somar_meses((hoje or timezone.localdate()).replace(day=1), -1)
+
+
+def etag_feed(tipo, pk, versao, inicio):
+    """ETag forte do feed a partir das versões ({turma_id: versão}) das turmas"""
+    bruto = f'{tipo}:{pk}:{inicio}:' + ','.join(f'{turma_id}={versao[turma_id]}' for turma_id in sorted(versao))
+    return '"' + hashlib.sha1(bruto.encode()).hexdigest() + '"'
+
+
+# ---------------------------------------------------------
+# GERAÇÃO
+# ---------------------------------------------------------
+
+def _texto(valor):
+    return (
+        str(valor).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def _linha(conteudo):
+    """Linha com dobra em 75 octetos (RFC 5545, 3.1)"""
+    dados = conteudo.encode()
+    if len(dados) <= 75:
+        return conteudo + '\r\n'
+    partes = []
+    limite = 75
+    while dados:
+        corte = min(limite, len(dados))
+        # Não corta no meio de um caractere UTF-8
+        while corte < len(dados) and (dados[corte] & 0xC0) == 0x80:
+            corte -= 1
+        partes.append(dados[:corte].decode())
+        dados = dados[corte:]
+        limite = 74
+    return '\r\n '.join(partes) + '\r\n'
+
+
+def _data_hora(dia, horario):
+    return f'{dia:%Y%m%d}T{horario:%H%M%S}'
+
+
+def _hora(minutos):
+    return hora(*divmod(minutos, 60))
+
+
+def _ate(data_fim):
+    """UNTIL da rotina: fim do último dia, no fuso do feed, convertido para UTC"""
+    fim = datetime.combine(data_fim, hora(23, 59, 59), tzinfo=ZoneInfo(settings.TIME_ZONE))
+    return fim.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+# Anos cobertos pelas transições do VTIMEZONE (a rotina semanal não tem fim)
+ANOS_FUSO = 2
+
+
+def _deslocamento(delta):
+    minutos = int(delta.total_seconds()) // 60
+    return f"{'+' if minutos >= 0 else '-'}{abs(minutos) // 60:02d}{abs(minutos) % 60:02d}"
+
+
+def _transicoes(zona, inicio, fim):
+    """Instantes UTC em que o deslocamento do fuso muda entre inicio e fim (datetimes UTC)"""
+    transicoes = []
+    atual = inicio
+    while atual < fim:
+        proximo = atual + timedelta(days=1)
+        if atual.astimezone(zona).utcoffset() != proximo.astimezone(zona).utcoffset():
+            # Refina para a hora da mudança
+            while proximo - atual > timedelta(hours=1):
+                meio = atual + (proximo - atual) / 2
+                if atual.astimezone(zona).utcoffset() == meio.astimezone(zona).utcoffset():
+                    atual = meio
+                else:
+                    proximo = meio
+            transicoes.append(proximo.replace(minute=0, second=0, microsecond=0))
+        atual = proximo
+    return transicoes
+
+
+@lru_cache(maxsize=8)
+def vtimezone(nome_fuso, inicio):
+    """Componente VTIMEZONE de `nome_fuso` válido de `inicio` (date) até ANOS_FUSO anos depois"""
+    zona = ZoneInfo(nome_fuso)
+    comeco = datetime.combine(inicio, hora(0), tzinfo=dt_timezone.utc)
+    fim = comeco.replace(year=comeco.year + ANOS_FUSO)
+
+    def observancia(instante, antes):
+        local = instante.astimezone(zona)
+        tipo = 'DAYLIGHT' if local.dst() else 'STANDARD'
+        return [
+            f'BEGIN:{tipo}',
+            # DTSTART na hora local de antes da mudança (TZOFFSETFROM)
+            f'DTSTART:{(instante + antes).replace(tzinfo=None):%Y%m%dT%H%M%S}',
+            f'TZOFFSETFROM:{_deslocamento(antes)}',
+            f'TZOFFSETTO:{_deslocamento(local.utcoffset())}',
+            f'TZNAME:{local.tzname()}',
+            f'END:{tipo}',
+        ]
+
+    linhas = ['BEGIN:VTIMEZONE', f'TZID:{nome_fuso}']
+    linhas += observancia(comeco, comeco.astimezone(zona).utcoffset())
+    for instante in _transicoes(zona, comeco, fim):
+        linhas += observancia(instante, (instante - timedelta(hours=1)).astimezone(zona).utcoffset())
+    linhas.append('END:VTIMEZONE')
+    return ''.join(map(_linha, linhas))
+
+
+def _evento(uid, dtstamp, dia, hora_inicio, hora_fim, resumo, descricao='', local='', rrule=None):
+    linhas = [
+        'BEGIN:VEVENT',
+        f'UID:{uid}@{UID_DOMINIO}',
+        f'DTSTAMP:{dtstamp}',
+        f'DTSTART;TZID={settings.TIME_ZONE}:{_data_hora(dia, hora_inicio)}',
+        f'DTEND;TZID={settings.TIME_ZONE}:{_data_hora(dia, hora_fim)}',
+        f'SUMMARY:{_texto(resumo)}',
+    ]
+    if rrule:
+        linhas.append(f'RRULE:{rrule}')
+    if descricao:
+        linhas.append(f'DESCRIPTION:{_texto(descricao)}')
+    if local:
+        linhas.append(f'LOCATION:{_texto(local)}')
+    linhas.append('END:VEVENT')
+    return ''.join(map(_linha, linhas))
+
+
+def _eventos_da_turma(turma_id, versao, inicio):
+    """
+    VEVENTs da turma. Com DTSTAMP derivado da versão, o mesmo ETag sempre
+    corresponde aos mesmos bytes (ETag forte).
+    """
+    dtstamp = (EPOCA + timedelta(microseconds=versao)).strftime('%Y%m%dT%H%M%SZ')
+    grade_turma = grade.grade_da_turma(turma_id)
+    if grade_turma is None:
+        return
+    titulo = f"{grade_turma['nome']} ({grade_turma['modalidade'].title()})"
+    professor = f"Professor(a): {grade_turma['professor']}" if grade_turma['professor'] else ''
+
+    ultima = None
+    for pk, data, hora_inicio, hora_fim, tema in Aula.objects.filter(
+        turma_id=turma_id, data__gte=inicio
+    ).order_by('data', 'hora_inicio').values_list('pk', 'data', 'hora_inicio', 'hora_fim', 'tema').iterator():
+        ultima = data
+        yield _evento(
+            f'aula-{pk}', dtstamp, data, hora_inicio, hora_fim,
+            f'{titulo} - {tema}' if tema else titulo, professor,
+        )
+
+    if not grade_turma.get('ativa'):
+        return
+    data_fim = grade_turma.get('data_fim')
+    # Rotina semanal depois da última aula já gerada
+    a_partir = max(inicio, ultima + timedelta(days=1)) if ultima else inicio
+    ate = f';UNTIL={_ate(data_fim)}' if data_fim else ''
+    if data_fim and data_fim < a_partir:
+        return
+    for dia, inicio_min, fim_min, sala in grade_turma['horarios']:
+        primeiro = a_partir + timedelta(days=(dia - a_partir.weekday()) % 7)
+        yield _evento(
+            f'horario-{turma_id}-{dia}-{inicio_min}', dtstamp, primeiro,
+            _hora(inicio_min), _hora(fim_min), titulo, professor, sala,
+            rrule=f'FREQ=WEEKLY{ate}',
+        )
+
+
+def _bloco_da_turma(turma_id, versao, inicio):
+    """Eventos da turma do cache ou, num miss, gerados em streaming e guardados no fim"""
+    chave = f'ical:eventos:{turma_id}:{versao}:{inicio}'
+    bloco = cache.get(chave)
+    if bloco is not None:
+        yield bloco
+        return
+    partes = []
+    for evento in _eventos_da_turma(turma_id, versao, inicio):
+        partes.append(evento)
+        yield evento
+    cache.set(chave, ''.join(partes), _timeout())
+
+
+def gerar_feed(nome, versao, inicio):
+    """Gerador com o VCALENDAR das turmas de `versao` ({turma_id: versão}), para StreamingHttpResponse"""
+    yield ''.join(map(_linha, [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Giro Dance//Aulas//PT-BR',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{_texto(nome)}',
+        f'X-WR-TIMEZONE:{settings.TIME_ZONE}',
+    ]))
+    yield vtimezone(settings.TIME_ZONE, inicio)
+    for turma_id in sorted(versao):
+        yield from _bloco_da_turma(turma_id, versao[turma_id], inicio)
+    yield _linha('END:VCALENDAR')
@@ -1,26 +1,56 @@
-from django.core.management.base import BaseCommand
-from django.utils import timezone
-from paginas.models import Mensalidade
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from paginas.mensalidades import (
+    TAMANHO_LOTE_PADRAO, transicionar_mensalidades_vencidas, ultima_marca_dagua
+)
 
 class Command(BaseCommand):
-    help = 'Atualiza o status das mensalidades vencidas para ATRASADO'
+    help = 'Atualiza o status das mensalidades vencidas para ATRASADO e notifica os alunos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help=(
+                'Marca d\'água: só verifica vencimentos a partir desta data (AAAA-MM-DD). '
+                'Use "ultima" para continuar de onde a última execução parou.'
+            )
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=TAMANHO_LOTE_PADRAO,
+            help=f'Mensalidades por transação (padrão: {TAMANHO_LOTE_PADRAO})'
+        )
+        parser.add_argument(
+            '--sem-notificacoes',
+            action='store_true',
+            help='Não cria notificações para os alunos'
+        )
 
     def handle(self, *args, **options):
-        hoje = timezone.now().date()
-        
-        # Buscar mensalidades pendentes e vencidas
-        mensalidades_vencidas = Mensalidade.objects.filter(
-            status='PENDENTE',
-            data_vencimento__lt=hoje
+        desde = None
+        if options['since'] == 'ultima':
+            desde = ultima_marca_dagua()
+        elif options['since']:
+            desde = parse_date(options['since'])
+            if desde is None:
+                raise CommandError(f'Data inválida: {options["since"]} (use AAAA-MM-DD ou "ultima")')
+        if options['lote'] < 1:
+            raise CommandError('--lote deve ser maior que zero')
+
+        registro = transicionar_mensalidades_vencidas(
+            desde=desde,
+            tamanho_lote=options['lote'],
+            notificar=not options['sem_notificacoes'],
         )
-        
-        count = mensalidades_vencidas.count()
-        
-        if count > 0:
-            # Atualizar status para ATRASADO
-            mensalidades_vencidas.update(status='ATRASADO')
+
+        if registro.total_atualizadas > 0:
             self.stdout.write(
-                self.style.SUCCESS(f'✅ {count} mensalidade(s) atualizada(s) para ATRASADO')
+                self.style.SUCCESS(
+                    f'✅ {registro.total_atualizadas} mensalidade(s) atualizada(s) para ATRASADO '
+                    f'({registro.total_notificacoes} notificação(ões), {registro.lotes} lote(s), '
+                    f'{registro.duracao_segundos:.2f}s)'
+                )
             )
         else:
             self.stdout.write(
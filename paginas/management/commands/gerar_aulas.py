@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from paginas.cronograma import fim_do_semestre, gerar_aulas
+from paginas.models import Turma
+
+class Command(BaseCommand):
+    help = 'Gera as aulas a partir da grade semanal (HorarioAula) das turmas ativas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--inicio',
+            help='Primeira data AAAA-MM-DD (padrão: hoje)'
+        )
+        parser.add_argument(
+            '--fim',
+            help='Última data AAAA-MM-DD (padrão: fim do semestre da data inicial)'
+        )
+        parser.add_argument(
+            '--turma',
+            type=int,
+            action='append',
+            help='ID da turma (pode repetir). Sem ele, gera para todas as turmas ativas'
+        )
+        parser.add_argument(
+            '--excluir',
+            action='append',
+            default=[],
+            help='Data sem aula AAAA-MM-DD, além dos Dias sem Aula cadastrados (pode repetir)'
+        )
+
+    def _data(self, valor, nome):
+        data = parse_date(valor)
+        if data is None:
+            raise CommandError(f'{nome} inválida: {valor} (use AAAA-MM-DD)')
+        return data
+
+    def handle(self, *args, **options):
+        inicio = self._data(options['inicio'], 'Data inicial') if options['inicio'] else timezone.now().date()
+        fim = self._data(options['fim'], 'Data final') if options['fim'] else fim_do_semestre(inicio)
+        if fim < inicio:
+            raise CommandError('--fim não pode ser anterior a --inicio')
+        excluir = [self._data(valor, 'Data a excluir') for valor in options['excluir']]
+
+        turmas = None
+        if options['turma']:
+            turmas = list(Turma.objects.filter(pk__in=options['turma']).values_list('pk', flat=True))
+            faltando = set(options['turma']) - set(turmas)
+            if faltando:
+                raise CommandError(f'Turma(s) não encontrada(s): {", ".join(map(str, sorted(faltando)))}')
+
+        resultado = gerar_aulas(inicio, fim, turmas=turmas, excluir=excluir)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✅ {resultado["criadas"]} aula(s) gerada(s) de {inicio:%d/%m/%Y} a {fim:%d/%m/%Y} '
+                f'({resultado["existentes"]} já existiam, {resultado["puladas"]} em dias sem aula)'
+            )
+        )
@@ -0,0 +1,100 @@
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from paginas.financeiro import somar_meses
+from paginas.mensalidades import DIA_VENCIMENTO_PADRAO, TAMANHO_LOTE_PADRAO, gerar_mensalidades_do_mes
+from paginas.models import Turma
+
+class Command(BaseCommand):
+    help = 'Gera as mensalidades de um mês para todos os alunos ativos (ou de uma turma)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mes',
+            help='Mês de referência AAAA-MM (padrão: próximo mês)'
+        )
+        parser.add_argument(
+            '--valor',
+            help='Valor da mensalidade. Sem ele, repete o valor da última mensalidade de cada aluno'
+        )
+        parser.add_argument(
+            '--desconto',
+            help='Desconto aplicado a todos (padrão: o da última mensalidade de cada aluno)'
+        )
+        parser.add_argument(
+            '--dia-vencimento',
+            type=int,
+            default=DIA_VENCIMENTO_PADRAO,
+            help=f'Dia do vencimento (padrão: {DIA_VENCIMENTO_PADRAO})'
+        )
+        parser.add_argument(
+            '--turma',
+            type=int,
+            help='ID da turma: gera só para os alunos dela'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=TAMANHO_LOTE_PADRAO,
+            help=f'Linhas por INSERT (padrão: {TAMANHO_LOTE_PADRAO})'
+        )
+
+    def _decimal(self, valor, nome):
+        if valor is None:
+            return None
+        try:
+            return Decimal(valor.replace(',', '.'))
+        except InvalidOperation:
+            raise CommandError(f'{nome} inválido: {valor}')
+
+    def handle(self, *args, **options):
+        if options['mes']:
+            try:
+                ano, mes = options['mes'].split('-')
+                mes = date(int(ano), int(mes), 1)
+            except ValueError:
+                raise CommandError(f'Mês inválido: {options["mes"]} (use AAAA-MM)')
+        else:
+            mes = somar_meses(timezone.now().date().replace(day=1), 1)
+
+        if not 1 <= options['dia_vencimento'] <= 31:
+            raise CommandError('--dia-vencimento deve estar entre 1 e 31')
+
+        turma = None
+        if options['turma']:
+            try:
+                turma = Turma.objects.get(pk=options['turma'])
+            except Turma.DoesNotExist:
+                raise CommandError(f'Turma {options["turma"]} não encontrada')
+
+        try:
+            resultado = gerar_mensalidades_do_mes(
+                mes,
+                valor=self._decimal(options['valor'], 'Valor'),
+                valor_desconto=self._decimal(options['desconto'], 'Desconto'),
+                dia_vencimento=options['dia_vencimento'],
+                turma=turma,
+                tamanho_lote=options['lote'],
+            )
+        except ValidationError as e:
+            raise CommandError(' '.join(e.messages))
+
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ {resultado["criadas"]} mensalidade(s) gerada(s) para {mes:%m/%Y}')
+        )
+        if resultado['sem_valor']:
+            self.stdout.write(
+                self.style.WARNING(
+                    f'⚠️ {resultado["sem_valor"]} aluno(s) sem mensalidade anterior foram ignorados; use --valor'
+                )
+            )
+        if resultado['desconto_maior']:
+            self.stdout.write(
+                self.style.WARNING(
+                    f'⚠️ {resultado["desconto_maior"]} aluno(s) com desconto maior que o valor foram ignorados; '
+                    'use --desconto'
+                )
+            )
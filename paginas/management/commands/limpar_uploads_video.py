@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from paginas.uploads import limpar_abandonados
+
+
+class Command(BaseCommand):
+    help = 'Cancela os uploads de vídeo em partes abandonados e apaga os arquivos incompletos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horas',
+            type=int,
+            default=24,
+            help='Horas sem receber partes para considerar o upload abandonado (padrão: 24)'
+        )
+
+    def handle(self, *args, **options):
+        count = limpar_abandonados(horas=options['horas'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ {count} upload(s) abandonado(s) cancelado(s)')
+        )
@@ -1,90 +1,98 @@
+import json
+
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from paginas.models import Aula
-import os
+from paginas.retencao import executar, politica_configurada
 
 class Command(BaseCommand):
-    help = 'Remove vídeos de aulas com mais de X dias para liberar espaço no servidor'
+    help = (
+        'Remove vídeos de aulas segundo a política de retenção (idade, cota por turma, '
+        'orçamento total e N mais recentes por turma). Roda sem interação, pronto para o cron.'
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
             '--dias',
             type=int,
-            default=30,
-            help='Número de dias para manter os vídeos (padrão: 30)'
+            help='Remove vídeos enviados há mais de X dias (padrão: VIDEO_RETENCAO ou 30)'
+        )
+        parser.add_argument(
+            '--sem-limite-de-dias',
+            action='store_true',
+            help='Desliga a política por idade'
+        )
+        parser.add_argument(
+            '--orcamento-mb',
+            type=int,
+            help='Espaço total máximo dos vídeos; remove os menos vistos até caber'
+        )
+        parser.add_argument(
+            '--cota-turma-mb',
+            type=int,
+            help='Espaço máximo por turma; remove os menos vistos da turma até caber'
+        )
+        parser.add_argument(
+            '--manter-recentes',
+            type=int,
+            help='Nunca remove os vídeos das N aulas mais recentes de cada turma'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Arquivos apagados em paralelo (padrão: 4)'
         )
         parser.add_argument(
             '--dry-run',
             action='store_true',
             help='Simula a execução sem deletar os arquivos'
         )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Imprime só o relatório em JSON (para logs e monitoramento)'
+        )
 
     def handle(self, *args, **options):
-        dias = options['dias']
-        dry_run = options['dry_run']
-        
-        # Data limite (aulas mais antigas que isso terão vídeos removidos)
-        data_limite = timezone.now() - timezone.timedelta(days=dias)
-        
-        # Buscar aulas com vídeo mais antigas que a data limite
-        aulas_antigas = Aula.objects.filter(
-            data_upload_video__lt=data_limite,
-            video__isnull=False
-        ).exclude(video='')
-        
-        total_aulas = aulas_antigas.count()
-        tamanho_total = 0
-        
-        self.stdout.write(self.style.WARNING(f'\n🔍 Buscando vídeos com mais de {dias} dias...'))
-        self.stdout.write(f'   Data limite: {data_limite.strftime("%d/%m/%Y %H:%M")}\n')
-        
-        if total_aulas == 0:
-            self.stdout.write(self.style.SUCCESS('✅ Nenhum vídeo antigo encontrado!'))
+        politica = politica_configurada(
+            dias=options['dias'],
+            orcamento_mb=options['orcamento_mb'],
+            cota_turma_mb=options['cota_turma_mb'],
+            manter_recentes=options['manter_recentes'],
+        )
+        if options['sem_limite_de_dias']:
+            politica['dias'] = None
+
+        relatorio = executar(politica, workers=options['workers'], simular=options['dry_run'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(relatorio, ensure_ascii=False, indent=2))
             return
-        
-        self.stdout.write(f'📹 Encontradas {total_aulas} aulas com vídeos antigos:\n')
-        
-        for aula in aulas_antigas:
-            tamanho_mb = aula.get_video_size_mb()
-            tamanho_total += tamanho_mb
-            dias_upload = aula.dias_desde_upload()
-            
-            self.stdout.write(
-                f'   • {aula.turma.nome} - {aula.data.strftime("%d/%m/%Y")} '
-                f'({tamanho_mb:.2f} MB, {dias_upload} dias)'
-            )
-        
-        self.stdout.write(f'\n💾 Espaço total a ser liberado: {tamanho_total:.2f} MB\n')
-        
-        if dry_run:
-            self.stdout.write(self.style.WARNING('⚠️  DRY RUN - Nenhum arquivo foi deletado'))
-            self.stdout.write('   Execute sem --dry-run para deletar os vídeos\n')
-        else:
-            # Confirmar antes de deletar
-            confirmacao = input('⚠️  Deseja realmente deletar esses vídeos? (s/N): ')
-            
-            if confirmacao.lower() == 's':
-                deletados = 0
-                for aula in aulas_antigas:
-                    try:
-                        # Deletar o arquivo físico
-                        if aula.video and os.path.isfile(aula.video.path):
-                            os.remove(aula.video.path)
-                        
-                        # Limpar o campo no banco
-                        aula.video = None
-                        aula.save()
-                        deletados += 1
-                    except Exception as e:
-                        self.stdout.write(
-                            self.style.ERROR(f'❌ Erro ao deletar vídeo de {aula}: {str(e)}')
-                        )
-                
-                self.stdout.write(
-                    self.style.SUCCESS(f'\n✅ {deletados} vídeos deletados com sucesso!')
-                )
-                self.stdout.write(
-                    self.style.SUCCESS(f'💾 {tamanho_total:.2f} MB liberados no servidor\n')
-                )
-            else:
-                self.stdout.write(self.style.WARNING('\n❌ Operação cancelada\n'))
+
+        if relatorio['sem_tamanho'] and (politica['cota_turma_mb'] is not None or politica['orcamento_mb'] is not None):
+            self.stdout.write(self.style.WARNING(
+                f"⚠️  {relatorio['sem_tamanho']} vídeo(s) sem tamanho medido contam como 0 MB nas cotas; "
+                'rode reconciliar_videos --corrigir'
+            ))
+
+        if not relatorio['videos_removidos']:
+            self.stdout.write(self.style.SUCCESS('✅ Nenhum vídeo para remover pela política atual!'))
+            return
+
+        for motivo, soma in sorted(relatorio['por_politica'].items()):
+            self.stdout.write(f"   • {motivo}: {soma['videos']} vídeo(s), {soma['bytes'] / 1024 / 1024:.2f} MB")
+        liberados = relatorio['bytes_liberados'] / 1024 / 1024
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️  DRY RUN - {relatorio['videos_removidos']} vídeo(s) ({liberados:.2f} MB) seriam removidos"
+            ))
+            return
+
+        for erro in relatorio['erros']:
+            self.stdout.write(self.style.ERROR(f'❌ Erro ao deletar {erro}'))
+        self.stdout.write(
+            self.style.SUCCESS(f"✅ {relatorio['videos_removidos']} vídeos deletados com sucesso!")
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f'💾 {liberados:.2f} MB liberados no servidor')
+        )
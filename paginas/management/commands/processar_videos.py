@@ -0,0 +1,46 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from paginas.videos import processar_videos_pendentes
+
+class Command(BaseCommand):
+    help = 'Gera as versões web/celular e a miniatura dos vídeos enviados nas aulas (ffmpeg)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limite',
+            type=int,
+            default=4,
+            help='Vídeos por rodada (padrão: 4)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'VIDEO_WORKERS', 2),
+            help='Vídeos processados ao mesmo tempo (padrão: VIDEO_WORKERS)'
+        )
+        parser.add_argument(
+            '--continuo',
+            action='store_true',
+            help='Fica rodando e verifica a fila a cada --intervalo segundos'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=30,
+            help='Segundos entre rodadas no modo contínuo (padrão: 30)'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            contagem = processar_videos_pendentes(limite=options['limite'], workers=options['workers'])
+            if contagem:
+                resumo = ', '.join(f'{status}: {total}' for status, total in sorted(contagem.items()))
+                self.stdout.write(self.style.SUCCESS(f'✅ Vídeos processados ({resumo})'))
+            elif not options['continuo']:
+                self.stdout.write(self.style.SUCCESS('✅ Nenhum vídeo na fila'))
+
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
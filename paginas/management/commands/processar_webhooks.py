@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+from paginas.pagamentos import processar_eventos_pendentes
+
+class Command(BaseCommand):
+    help = 'Processa a caixa de entrada de webhooks do Mercado Pago (EventoWebhook)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Threads consultando o Mercado Pago em paralelo (padrão: 4)'
+        )
+        parser.add_argument(
+            '--limite',
+            type=int,
+            default=200,
+            help='Eventos por rodada (padrão: 200)'
+        )
+        parser.add_argument(
+            '--continuo',
+            action='store_true',
+            help='Fica rodando e verifica a fila a cada --intervalo segundos'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=5,
+            help='Segundos entre rodadas no modo contínuo (padrão: 5)'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            contagem = processar_eventos_pendentes(workers=options['workers'], limite=options['limite'])
+            if contagem:
+                resumo = ', '.join(f'{status}: {total}' for status, total in sorted(contagem.items()))
+                self.stdout.write(self.style.SUCCESS(f'✅ Eventos processados ({resumo})'))
+            elif not options['continuo']:
+                self.stdout.write(self.style.SUCCESS('✅ Nenhum evento pendente'))
+
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
@@ -0,0 +1,41 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from paginas import financeiro
+
+
+class Command(BaseCommand):
+    help = 'Recalcula o ResultadoFinanceiroMensal a partir de mensalidades, vendas, entradas e despesas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--todos',
+            action='store_true',
+            help='Recalcula todos os meses que aparecem nas tabelas de origem'
+        )
+        parser.add_argument(
+            '--mes',
+            action='append',
+            default=[],
+            help='Mês no formato AAAA-MM (pode ser repetido)'
+        )
+
+    def handle(self, *args, **options):
+        if options['todos']:
+            count = financeiro.recalcular_meses(financeiro.todos_os_meses())
+        elif options['mes']:
+            meses = []
+            for valor in options['mes']:
+                try:
+                    ano, mes = valor.split('-')
+                    meses.append(date(int(ano), int(mes), 1))
+                except ValueError:
+                    raise CommandError(f'Mês inválido: {valor} (use AAAA-MM)')
+            count = financeiro.recalcular_meses(meses)
+        else:
+            # Padrão: só os meses marcados pelos sinais
+            count = financeiro.processar_meses_pendentes()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ {count} mês(es) recalculado(s)')
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from paginas.frequencias import recalcular_todos_resumos
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstrói o ResumoFrequenciaMensal a partir de todas as frequências '
+        '(carga inicial ou depois de alterações feitas direto no banco)'
+    )
+
+    def handle(self, *args, **options):
+        count = recalcular_todos_resumos()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ {count} resumo(s) de frequência recalculado(s)')
+        )
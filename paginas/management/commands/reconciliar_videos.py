@@ -0,0 +1,50 @@
+import json
+
+from django.core.management.base import BaseCommand
+from paginas.armazenamento import reconciliar
+
+
+class Command(BaseCommand):
+    help = (
+        'Confere o tamanho e o checksum dos vídeos gravados no banco com os arquivos em disco '
+        '(também mede os vídeos enviados antes desses campos existirem, com --corrigir)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--corrigir',
+            action='store_true',
+            help='Regrava no banco as medidas lidas do disco'
+        )
+        parser.add_argument(
+            '--checksum',
+            action='store_true',
+            help='Relê os vídeos para comparar o SHA-256 (lento)'
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Imprime o relatório completo em JSON'
+        )
+
+    def handle(self, *args, **options):
+        relatorio = reconciliar(corrigir=options['corrigir'], checksum=options['checksum'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(relatorio, ensure_ascii=False, indent=2))
+            return
+
+        self.stdout.write(f"🔍 {relatorio['verificadas']} aula(s) com vídeo verificada(s)")
+        for chave, rotulo in (
+            ('ausentes', 'arquivo(s) ausente(s) no disco'),
+            ('divergentes', 'tamanho(s) diferente(s) do banco'),
+            ('corrompidos', 'checksum(s) diferente(s)'),
+            ('orfaos', 'arquivo(s) sem aula no banco'),
+        ):
+            if relatorio[chave]:
+                exemplos = ', '.join(map(str, relatorio[chave][:10]))
+                self.stdout.write(self.style.WARNING(f'⚠️  {len(relatorio[chave])} {rotulo}: {exemplos}'))
+
+        self.stdout.write(
+            self.style.SUCCESS(f"✅ {relatorio['corrigidas']} aula(s) corrigida(s)")
+        )
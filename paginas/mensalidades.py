@@ -0,0 +1,191 @@
+"""
+Operações em lote sobre mensalidades.
+
+Transição PENDENTE -> ATRASADO (comando atualizar_mensalidades):
+    As mensalidades vencidas são percorridas por id em lotes. Cada lote roda
+    em uma transação: trava as linhas, muda o status com um único update(),
+    cria as notificações com bulk_create e invalida o painel dos alunos
+    afetados. No fim é gravado um RegistroTransicaoMensalidades.
+
+Geração do mês (comando gerar_mensalidades):
+    Cria a mensalidade do mês para todos os alunos ativos (ou de uma turma)
+    com bulk_create(ignore_conflicts=True) sobre (aluno, mes_referencia),
+    calculando valor_final e status sem save()/full_clean() por linha.
+"""
+import time
+from calendar import monthrange
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.urls import reverse
+from django.utils import timezone
+
+from . import financeiro, painel_cache
+from .models import Aluno, Mensalidade, Notificacao, RegistroTransicaoMensalidades
+
+TAMANHO_LOTE_PADRAO = 1000
+DIA_VENCIMENTO_PADRAO = 10
+
+
+def ultima_marca_dagua():
+    """Data de referência da última execução, ou None se nunca rodou"""
+    return RegistroTransicaoMensalidades.objects.values_list(
+        'data_referencia', flat=True
+    ).order_by('-data_execucao', '-id').first()
+
+
+def _notificacao(usuario_id, mes_referencia, valor_final, data_vencimento, link):
+    return Notificacao(
+        usuario_id=usuario_id,
+        tipo='ALERTA',
+        titulo='Mensalidade em atraso',
+        mensagem=(
+            f'Sua mensalidade de {mes_referencia.strftime("%m/%Y")} '
+            f'(R$ {valor_final:.2f}) venceu em {data_vencimento.strftime("%d/%m/%Y")}.'
+        ),
+        link=link,
+    )
+
+
+def transicionar_mensalidades_vencidas(hoje=None, desde=None, tamanho_lote=TAMANHO_LOTE_PADRAO, notificar=True):
+    """
+    Marca como ATRASADO as mensalidades PENDENTE vencidas antes de `hoje`.
+
+    desde        -> marca d'água: ignora vencimentos anteriores a esta data
+                    (já verificados por uma execução anterior)
+    tamanho_lote -> linhas por transação
+
+    Retorna o RegistroTransicaoMensalidades gravado.
+    """
+    inicio = time.monotonic()
+    hoje = hoje or timezone.now().date()
+    link = reverse('paginas:financeiro_mensalidades')
+
+    vencidas = Mensalidade.objects.filter(status='PENDENTE', data_vencimento__lt=hoje)
+    if desde:
+        vencidas = vencidas.filter(data_vencimento__gte=desde)
+
+    total_atualizadas = total_notificacoes = lotes = 0
+    ultimo_id = 0
+    lote_cheio = True
+    while lote_cheio:
+        with transaction.atomic():
+            linhas = list(
+                vencidas.filter(pk__gt=ultimo_id).order_by('pk').select_for_update(of=('self',)).values_list(
+                    'pk', 'aluno__usuario_id', 'mes_referencia', 'valor_final', 'data_vencimento'
+                )[:tamanho_lote]
+            )
+            if not linhas:
+                break
+            # Lote incompleto: não há mais linhas depois dele
+            lote_cheio = len(linhas) == tamanho_lote
+            ultimo_id = linhas[-1][0]
+            lotes += 1
+
+            total_atualizadas += Mensalidade.objects.filter(
+                pk__in=[linha[0] for linha in linhas]
+            ).update(status='ATRASADO', data_atualizacao=timezone.now())
+
+            if notificar:
+                notificacoes = Notificacao.objects.bulk_create(
+                    [_notificacao(*linha[1:], link=link) for linha in linhas]
+                )
+                total_notificacoes += len(notificacoes)
+
+            # update() não dispara sinais: o painel dos alunos é invalidado aqui
+            usuarios = {linha[1] for linha in linhas}
+            transaction.on_commit(lambda usuarios=usuarios: painel_cache.invalidar_usuarios(usuarios))
+
+    return RegistroTransicaoMensalidades.objects.create(
+        data_referencia=hoje,
+        desde=desde,
+        total_atualizadas=total_atualizadas,
+        total_notificacoes=total_notificacoes,
+        lotes=lotes,
+        duracao_segundos=round(time.monotonic() - inicio, 3),
+    )
+
+
+def data_vencimento_do_mes(mes, dia_vencimento=DIA_VENCIMENTO_PADRAO):
+    """Dia de vencimento dentro do mês (limitado ao último dia, ex.: 31 -> 28/02)"""
+    return mes.replace(day=min(dia_vencimento, monthrange(mes.year, mes.month)[1]))
+
+
+def gerar_mensalidades_do_mes(mes, valor=None, valor_desconto=None, dia_vencimento=DIA_VENCIMENTO_PADRAO,
+                              turma=None, tamanho_lote=TAMANHO_LOTE_PADRAO):
+    """
+    Gera as mensalidades de `mes` para os alunos ativos (ou só os da `turma`).
+
+    valor / valor_desconto -> se omitidos, repete os da última mensalidade de
+                              cada aluno; alunos sem histórico são ignorados
+    Alunos que já têm a mensalidade do mês não são tocados. Sem full_clean()
+    por linha, a regra do clean() (desconto <= valor) é conferida aqui: um
+    desconto maior que o valor informado levanta ValidationError, e o aluno
+    cujo desconto (herdado ou informado) passa do próprio valor é ignorado.
+
+    Retorna um dict com 'criadas', 'sem_valor' e 'desconto_maior'.
+    """
+    if valor_desconto is not None and valor_desconto < 0:
+        raise ValidationError('O desconto não pode ser negativo.')
+    if valor is not None and valor_desconto is not None and valor_desconto > valor:
+        raise ValidationError('Desconto não pode ser maior que o valor da mensalidade.')
+    mes = mes.replace(day=1)
+    vencimento = data_vencimento_do_mes(mes, dia_vencimento)
+    hoje = timezone.now().date()
+    # Mesma regra do Mensalidade.save(): criada já vencida nasce ATRASADO
+    status = 'ATRASADO' if vencimento < hoje else 'PENDENTE'
+
+    alunos = Aluno.objects.filter(ativo=True).exclude(mensalidades__mes_referencia=mes)
+    if turma is not None:
+        alunos = alunos.filter(turmas=turma)
+
+    ultima = Mensalidade.objects.filter(aluno=OuterRef('pk')).order_by('-mes_referencia')
+    alunos = alunos.annotate(
+        ultimo_valor=Subquery(ultima.values('valor')[:1]),
+        ultimo_desconto=Subquery(ultima.values('valor_desconto')[:1]),
+    ).order_by().values_list('pk', 'usuario_id', 'ultimo_valor', 'ultimo_desconto')
+
+    antes = Mensalidade.objects.filter(mes_referencia=mes).count()
+    sem_valor = desconto_maior = 0
+    usuarios = set()
+    lote = []
+
+    def gravar(lote):
+        Mensalidade.objects.bulk_create(lote, batch_size=tamanho_lote, ignore_conflicts=True)
+
+    # Lido de uma vez (tuplas pequenas) para não inserir com o cursor de leitura aberto
+    for aluno_id, usuario_id, ultimo_valor, ultimo_desconto in list(alunos):
+        valor_aluno = valor if valor is not None else ultimo_valor
+        if valor_aluno is None:
+            sem_valor += 1
+            continue
+        desconto = valor_desconto if valor_desconto is not None else (ultimo_desconto or Decimal('0'))
+        if desconto > valor_aluno:
+            # Ex.: --valor 50 para quem tinha 80 de desconto; valor_final ficaria negativo
+            desconto_maior += 1
+            continue
+        lote.append(Mensalidade(
+            aluno_id=aluno_id,
+            mes_referencia=mes,
+            valor=valor_aluno,
+            valor_desconto=desconto,
+            valor_final=valor_aluno - desconto,
+            data_vencimento=vencimento,
+            status=status,
+        ))
+        usuarios.add(usuario_id)
+        if len(lote) >= tamanho_lote:
+            gravar(lote)
+            lote = []
+    if lote:
+        gravar(lote)
+
+    criadas = Mensalidade.objects.filter(mes_referencia=mes).count() - antes
+    if criadas:
+        # bulk_create não dispara sinais
+        financeiro.marcar_meses([vencimento])
+        painel_cache.invalidar_usuarios(usuarios)
+
+    return {'criadas': criadas, 'sem_valor': sem_valor, 'desconto_maior': desconto_maior}
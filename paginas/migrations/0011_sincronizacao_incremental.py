@@ -0,0 +1,52 @@
+# Generated by Django 5.2.7 on 2026-10-17 18:52
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paginas', '0010_entradafinanceira'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistroExcluido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(choices=[('ALUNO', 'Aluno'), ('MENSALIDADE', 'Mensalidade')], max_length=20)),
+                ('objeto_id', models.BigIntegerField()),
+                ('data_exclusao', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Registro Excluído',
+                'verbose_name_plural': 'Registros Excluídos',
+                'ordering': ['data_exclusao', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='aluno',
+            name='data_atualizacao',
+            field=models.DateTimeField(auto_now=True, help_text='Usado na sincronização incremental'),
+        ),
+        migrations.AddField(
+            model_name='mensalidade',
+            name='data_atualizacao',
+            field=models.DateTimeField(auto_now=True, help_text='Usado na sincronização incremental'),
+        ),
+        migrations.AddIndex(
+            model_name='aluno',
+            index=models.Index(fields=['data_atualizacao', 'id'], name='paginas_alu_data_at_aa873e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mensalidade',
+            index=models.Index(fields=['data_atualizacao', 'id'], name='paginas_men_data_at_686bcd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registroexcluido',
+            index=models.Index(fields=['modelo', 'data_exclusao', 'id'], name='paginas_reg_modelo_2fcb57_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-17 18:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paginas', '0011_sincronizacao_incremental'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='despesaadministrativa',
+            name='paginas_des_data_ve_6bde13_idx',
+        ),
+        migrations.AddIndex(
+            model_name='aviso',
+            index=models.Index(fields=['ativo', '-importante', '-data_criacao', '-id'], name='paginas_avi_ativo_8b1fd8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='despesaadministrativa',
+            index=models.Index(fields=['-data_vencimento', '-id'], name='paginas_des_data_ve_a1d8cb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mensalidade',
+            index=models.Index(fields=['status', 'data_vencimento', 'id'], name='paginas_men_status_eb3da5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vendaingresso',
+            index=models.Index(fields=['vendedor', '-data_venda', '-id'], name='paginas_ven_vendedo_ff8ec9_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-17 18:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paginas', '0012_paginacao_keyset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MesFinanceiroPendente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(help_text='Primeiro dia do mês', unique=True)),
+                ('data_marcacao', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Mês Financeiro Pendente',
+                'verbose_name_plural': 'Meses Financeiros Pendentes',
+                'ordering': ['mes'],
+            },
+        ),
+        migrations.AddField(
+            model_name='resultadofinanceiromensal',
+            name='calculado_em',
+            field=models.DateTimeField(blank=True, help_text='Preenchido quando os valores vêm do cálculo automático (paginas.financeiro)', null=True, verbose_name='Calculado em'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paginas', '0013_resultado_financeiro_automatico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistroTransicaoMensalidades',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_execucao', models.DateTimeField(auto_now_add=True)),
+                ('data_referencia', models.DateField(help_text='Mensalidades vencidas antes desta data foram verificadas')),
+                ('desde', models.DateField(blank=True, help_text="Marca d'água usada (vazio = verificação completa)", null=True)),
+                ('total_atualizadas', models.PositiveIntegerField(default=0)),
+                ('total_notificacoes', models.PositiveIntegerField(default=0)),
+                ('lotes', models.PositiveIntegerField(default=0)),
+                ('duracao_segundos', models.FloatField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Registro de Transição de Mensalidades',
+                'verbose_name_plural': 'Registros de Transição de Mensalidades',
+                'ordering': ['-data_execucao'],
+            },
+        ),
+    ]
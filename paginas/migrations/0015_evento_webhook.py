@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:03
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paginas', '0014_registro_transicao_mensalidades'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoWebhook',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(help_text='Tipo da notificação (ex: payment)', max_length=50)),
+                ('recurso_id', models.CharField(help_text='ID do recurso notificado (ex: id do pagamento)', max_length=100)),
+                ('corpo', models.JSONField(default=dict, help_text='Último corpo recebido')),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('PROCESSANDO', 'Processando'), ('PROCESSADO', 'Processado'), ('ERRO', 'Erro'), ('IGNORADO', 'Ignorado')], default='PENDENTE', max_length=20)),
+                ('recebimentos', models.PositiveIntegerField(default=1, help_text='Quantas vezes o gateway enviou este evento')),
+                ('tentativas', models.PositiveIntegerField(default=0)),
+                ('proxima_tentativa', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ultimo_erro', models.TextField(blank=True)),
+                ('resultado', models.CharField(blank=True, max_length=100)),
+                ('data_recebimento', models.DateTimeField(auto_now_add=True)),
+                ('data_processamento', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Evento de Webhook',
+                'verbose_name_plural': 'Eventos de Webhook',
+                'ordering': ['-data_recebimento'],
+                'indexes': [models.Index(fields=['status', 'proxima_tentativa'], name='paginas_eve_status_ed747b_idx')],
+                'constraints': [models.UniqueConstraint(fields=('tipo', 'recurso_id'), name='evento_webhook_unico_por_recurso')],
+            },
+        ),
+    ]
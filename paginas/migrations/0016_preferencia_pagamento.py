@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paginas', '0015_evento_webhook'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PreferenciaPagamento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('valor', models.DecimalField(decimal_places=2, help_text='valor_final usado na preferência', max_digits=10)),
+                ('preference_id', models.CharField(max_length=100)),
+                ('expira_em', models.DateTimeField()),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('mensalidade', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='preferencias_pagamento', to='paginas.mensalidade')),
+            ],
+            options={
+                'verbose_name': 'Preferência de Pagamento',
+                'verbose_name_plural': 'Preferências de Pagamento',
+                'constraints': [models.UniqueConstraint(fields=('mensalidade', 'valor'), name='preferencia_unica_por_valor')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paginas', '0016_preferencia_pagamento'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiaSemAula',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('motivo', models.CharField(blank=True, max_length=200)),
+                ('turma', models.ForeignKey(blank=True, help_text='Deixe em branco para valer para todas as turmas', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='dias_sem_aula', to='paginas.turma')),
+            ],
+            options={
+                'verbose_name': 'Dia sem Aula',
+                'verbose_name_plural': 'Dias sem Aula',
+                'ordering': ['data'],
+                'indexes': [models.Index(fields=['data'], name='paginas_dia_data_044af2_idx')],
+            },
+        ),
+    ]
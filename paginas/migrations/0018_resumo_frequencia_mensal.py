@@ -0,0 +1,64 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import TruncMonth
+
+
+def preencher_resumos(apps, schema_editor):
+    """Mesma consulta agrupada de paginas.frequencias.recalcular_todos_resumos"""
+    Frequencia = apps.get_model('paginas', 'Frequencia')
+    ResumoFrequenciaMensal = apps.get_model('paginas', 'ResumoFrequenciaMensal')
+    linhas = Frequencia.objects.order_by().values('aluno_id', mes_aula=TruncMonth('aula__data')).annotate(
+        n_total=Count('id'),
+        n_presencas=Count('id', filter=Q(status='PRESENTE')),
+        n_faltas=Count('id', filter=Q(status='FALTA')),
+        n_justificadas=Count('id', filter=Q(status__in=('FALTA_JUSTIFICADA', 'ATESTADO'))),
+    )
+    ResumoFrequenciaMensal.objects.bulk_create(
+        (
+            ResumoFrequenciaMensal(
+                aluno_id=linha['aluno_id'],
+                # TruncMonth devolve date para DateField, mas datetime em alguns bancos
+                mes=(linha['mes_aula'].date() if callable(getattr(linha['mes_aula'], 'date', None))
+                     else linha['mes_aula']).replace(day=1),
+                total=linha['n_total'], presencas=linha['n_presencas'], faltas=linha['n_faltas'],
+                justificadas=linha['n_justificadas'],
+            )
+            for linha in linhas.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paginas', '0017_dia_sem_aula'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoFrequenciaMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(help_text='Primeiro dia do mês')),
+                ('presencas', models.PositiveIntegerField(default=0)),
+                ('faltas', models.PositiveIntegerField(default=0)),
+                ('justificadas', models.PositiveIntegerField(default=0, help_text='Faltas justificadas e atestados')),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('data_atualizacao', models.DateTimeField(auto_now=True)),
+                ('aluno', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumos_frequencia', to='paginas.aluno')),
+            ],
+            options={
+                'verbose_name': 'Resumo de Frequência Mensal',
+                'verbose_name_plural': 'Resumos de Frequência Mensal',
+                'ordering': ['aluno', 'mes'],
+                'unique_together': {('aluno', 'mes')},
+            },
+        ),
+        # Sem isso todo aluno apareceria com frequência zero até alguém rodar
+        # recalcular_resumos_frequencia
+        migrations.RunPython(preencher_resumos, migrations.RunPython.noop),
+    ]
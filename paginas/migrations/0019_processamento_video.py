@@ -0,0 +1,70 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paginas', '0018_resumo_frequencia_mensal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersaoVideo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(help_text="'web' ou a altura da versão (ex.: 480p)", max_length=20)),
+                ('arquivo', models.FileField(upload_to='aulas/processados/')),
+                ('largura', models.PositiveIntegerField(default=0)),
+                ('altura', models.PositiveIntegerField(default=0)),
+                ('bitrate_kbps', models.PositiveIntegerField(default=0)),
+                ('tamanho_bytes', models.BigIntegerField(default=0)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Versão de Vídeo',
+                'verbose_name_plural': 'Versões de Vídeo',
+                'ordering': ['aula', '-altura'],
+            },
+        ),
+        migrations.AddField(
+            model_name='aula',
+            name='video_erro',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='aula',
+            name='video_poster',
+            field=models.FileField(blank=True, help_text='Miniatura do vídeo', null=True, upload_to='aulas/processados/'),
+        ),
+        migrations.AddField(
+            model_name='aula',
+            name='video_proxima_tentativa',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='aula',
+            name='video_status',
+            field=models.CharField(blank=True, choices=[('PENDENTE', 'Na fila'), ('PROCESSANDO', 'Processando'), ('PRONTO', 'Pronto'), ('ERRO', 'Erro')], max_length=20),
+        ),
+        migrations.AddField(
+            model_name='aula',
+            name='video_tentativas',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='aula',
+            index=models.Index(fields=['video_status', 'video_proxima_tentativa'], name='paginas_aul_video_s_40ee50_idx'),
+        ),
+        migrations.AddField(
+            model_name='versaovideo',
+            name='aula',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versoes_video', to='paginas.aula'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='versaovideo',
+            unique_together={('aula', 'nome')},
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:32
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paginas', '0019_processamento_video'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadVideo',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('nome_arquivo', models.CharField(max_length=255)),
+                ('tamanho', models.BigIntegerField(help_text='Tamanho total anunciado, em bytes')),
+                ('recebido', models.BigIntegerField(default=0)),
+                ('status', models.CharField(choices=[('ABERTO', 'Recebendo'), ('CONCLUIDO', 'Concluído'), ('CANCELADO', 'Cancelado')], default='ABERTO', max_length=20)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('data_atualizacao', models.DateTimeField(auto_now=True)),
+                ('aula', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads_video', to='paginas.aula')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads_video', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Upload de Vídeo',
+                'verbose_name_plural': 'Uploads de Vídeo',
+                'ordering': ['-data_criacao'],
+                'indexes': [models.Index(fields=['status', 'data_atualizacao'], name='paginas_upl_status_d7fdaa_idx')],
+            },
+        ),
+    ]
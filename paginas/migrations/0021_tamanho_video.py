@@ -0,0 +1,61 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:34
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+from django.db.models import Q, Sum
+
+
+def _tamanho(nome):
+    if not nome:
+        return 0
+    try:
+        return default_storage.size(nome)
+    except OSError:
+        # Arquivo ausente: o reconciliar_videos lista a aula em 'ausentes'
+        return 0
+
+
+def medir_videos(apps, schema_editor):
+    """
+    Só os tamanhos (um stat por arquivo); o checksum lê o vídeo inteiro e
+    fica para o reconciliar_videos --corrigir --checksum.
+    """
+    Aula = apps.get_model('paginas', 'Aula')
+    VersaoVideo = apps.get_model('paginas', 'VersaoVideo')
+    versoes = dict(
+        VersaoVideo.objects.order_by().values('aula_id').annotate(total=Sum('tamanho_bytes')).values_list('aula_id', 'total')
+    )
+    # Lido de uma vez para não gravar com o cursor de leitura aberto
+    for pk, video, poster in list(Aula.objects.filter(Q(video__gt='') | Q(video_poster__gt='')).values_list(
+        'pk', 'video', 'video_poster'
+    )):
+        Aula.objects.filter(pk=pk).update(
+            video_tamanho=_tamanho(video),
+            video_tamanho_processados=(versoes.get(pk) or 0) + _tamanho(poster),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paginas', '0020_upload_video'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aula',
+            name='video_checksum',
+            field=models.CharField(blank=True, help_text='SHA-256 do vídeo original', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='aula',
+            name='video_tamanho',
+            field=models.BigIntegerField(default=0, help_text='Tamanho do vídeo original, em bytes'),
+        ),
+        migrations.AddField(
+            model_name='aula',
+            name='video_tamanho_processados',
+            field=models.BigIntegerField(default=0, help_text='Bytes das versões geradas e do poster'),
+        ),
+        migrations.RunPython(medir_videos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paginas', '0021_tamanho_video'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aula',
+            name='video_ultima_visualizacao',
+            field=models.DateTimeField(blank=True, help_text='Último acesso ao vídeo (retenção por LRU, paginas.retencao)', null=True),
+        ),
+    ]
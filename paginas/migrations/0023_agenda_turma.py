@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paginas', '0022_ultima_visualizacao_video'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='turma',
+            name='agenda_atualizada_em',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, help_text='Versão do feed iCal da turma; trocada pelos sinais e por gerar_aulas (paginas.ical)'),
+        ),
+    ]
@@ -2,24 +2,42 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator, FileExtensionValidator
 from django.core.exceptions import ValidationError
+from django.urls import reverse
 from django.utils import timezone
 from django.db.models import Sum
 from calendario.models import GoogleCalendarCredential, GoogleCalendarEvent
+import hashlib
 import os
+import uuid
 
 
 # Create your models here.
 
+# Limites dos vídeos das aulas (formulário do admin e upload em partes, paginas.uploads)
+VIDEO_TAMANHO_MAXIMO_MB = 50
+VIDEO_EXTENSOES = ['mp4', 'webm', 'avi', 'mov']
+
+def validar_tamanho_video(tamanho):
+    """Levanta ValidationError se `tamanho` (bytes) passar do limite dos vídeos"""
+    if tamanho > VIDEO_TAMANHO_MAXIMO_MB * 1024 * 1024:
+        raise ValidationError(
+            f'O tamanho máximo do arquivo é {VIDEO_TAMANHO_MAXIMO_MB}MB. Seu arquivo tem {tamanho / 1024 / 1024:.2f}MB.'
+        )
+
 def validate_video_size(value):
     """Valida o tamanho do arquivo de vídeo (máximo 50MB)"""
-    filesize = value.size
-    max_size_mb = 50
-    max_size_bytes = max_size_mb * 1024 * 1024  # 50MB em bytes
-    
-    if filesize > max_size_bytes:
-        raise ValidationError(f'O tamanho máximo do arquivo é {max_size_mb}MB. Seu arquivo tem {filesize / 1024 / 1024:.2f}MB.')
+    validar_tamanho_video(value.size)
     return value
 
+def medir_arquivo(arquivo):
+    """(tamanho em bytes, sha256 em hexadecimal) lendo o arquivo em blocos"""
+    soma = hashlib.sha256()
+    tamanho = 0
+    for bloco in arquivo.chunks():
+        soma.update(bloco)
+        tamanho += len(bloco)
+    return tamanho, soma.hexdigest()
+
 def video_upload_path(instance, filename):
     """Define o caminho de upload dos vídeos organizados por turma e data"""
     # Remove caracteres especiais do nome da turma
@@ -59,6 +77,10 @@ class Turma(models.Model):
     descricao = models.TextField(blank=True)
     data_inicio = models.DateField(null=True, blank=True)
     data_fim = models.DateField(null=True, blank=True)
+    agenda_atualizada_em = models.DateTimeField(
+        default=timezone.now, editable=False,
+        help_text='Versão do feed iCal da turma; trocada pelos sinais e por gerar_aulas (paginas.ical)'
+    )
     
     class Meta:
         verbose_name = 'Turma'
@@ -95,11 +117,15 @@ class Aluno(models.Model):
     ativo = models.BooleanField(default=True)
     observacoes = models.TextField(blank=True)
     foto = models.ImageField(upload_to='alunos/', blank=True, null=True)
+    data_atualizacao = models.DateTimeField(auto_now=True, help_text='Usado na sincronização incremental')
     
     class Meta:
         verbose_name = 'Aluno'
         verbose_name_plural = 'Alunos'
         ordering = ['usuario__first_name', 'usuario__last_name']
+        indexes = [
+            models.Index(fields=['data_atualizacao', 'id']),
+        ]
     
     def __str__(self):
         nome = self.usuario.get_full_name() or self.usuario.username
@@ -163,17 +189,43 @@ class Aula(models.Model):
         null=True,
         validators=[
             validate_video_size,
-            FileExtensionValidator(allowed_extensions=['mp4', 'webm', 'avi', 'mov'])
+            FileExtensionValidator(allowed_extensions=VIDEO_EXTENSOES)
         ],
         help_text='Vídeo da aula (máximo 50MB). Formatos: MP4, WebM, AVI, MOV'
     )
     data_upload_video = models.DateTimeField(blank=True, null=True, help_text='Data do upload do vídeo')
+    # Medidos no upload: o espaço usado sai de um SUM, sem stat no disco (paginas.armazenamento)
+    video_tamanho = models.BigIntegerField(default=0, help_text='Tamanho do vídeo original, em bytes')
+    video_checksum = models.CharField(max_length=64, blank=True, help_text='SHA-256 do vídeo original')
+    video_tamanho_processados = models.BigIntegerField(
+        default=0, help_text='Bytes das versões geradas e do poster'
+    )
+    video_ultima_visualizacao = models.DateTimeField(
+        blank=True, null=True, help_text='Último acesso ao vídeo (retenção por LRU, paginas.retencao)'
+    )
+    
+    # Processamento do vídeo em segundo plano (paginas.videos)
+    VIDEO_STATUS_CHOICES = [
+        ('PENDENTE', 'Na fila'),
+        ('PROCESSANDO', 'Processando'),
+        ('PRONTO', 'Pronto'),
+        ('ERRO', 'Erro'),
+    ]
+    video_status = models.CharField(max_length=20, choices=VIDEO_STATUS_CHOICES, blank=True)
+    video_poster = models.FileField(upload_to='aulas/processados/', blank=True, null=True, help_text='Miniatura do vídeo')
+    video_tentativas = models.PositiveSmallIntegerField(default=0)
+    video_proxima_tentativa = models.DateTimeField(blank=True, null=True)
+    video_erro = models.TextField(blank=True)
     
     class Meta:
         verbose_name = 'Aula'
         verbose_name_plural = 'Aulas'
         ordering = ['-data', '-hora_inicio']
         unique_together = ['turma', 'data', 'hora_inicio']
+        indexes = [
+            # Fila de processamento de vídeos
+            models.Index(fields=['video_status', 'video_proxima_tentativa']),
+        ]
     
     def __str__(self):
         return f"{self.turma.nome} - {self.data.strftime('%d/%m/%Y')}"
@@ -182,13 +234,17 @@ class Aula(models.Model):
         # Atualiza a data de upload do vídeo se um novo vídeo foi adicionado
         if self.video and not self.data_upload_video:
             self.data_upload_video = timezone.now()
-        aula_nova = self.pk is None 
+        # Tamanho e checksum são medidos uma vez, quando o arquivo chega
+        if self.video and not self.video._committed:
+            self.video_tamanho, self.video_checksum = medir_arquivo(self.video)
+            self.data_upload_video = timezone.now()
+        elif not self.video:
+            self.video_tamanho, self.video_checksum = 0, ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'video' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'video_tamanho', 'video_checksum'}
+        # A agenda dos alunos é sincronizada em segundo plano (calendario.signals)
         super().save(*args, **kwargs)
-        if aula_nova:  
-            from calendario.views import criar_evento_google        
-            criar_evento_google(self)
-        
-        
     
     def delete(self, *args, **kwargs):
         # Deleta o arquivo de vídeo do storage quando a aula for deletada
@@ -198,13 +254,33 @@ class Aula(models.Model):
         super().delete(*args, **kwargs)
     
     def get_video_size_mb(self):
-        """Retorna o tamanho do vídeo em MB, se o arquivo existir"""
-        if self.video and hasattr(self.video, 'path') and os.path.isfile(self.video.path):
-            try:
-                return os.path.getsize(self.video.path) / 1024 / 1024
-            except Exception:
-                return 0
-        return 0
+        """Retorna o tamanho do vídeo em MB (medido no upload, sem acessar o disco)"""
+        return self.video_tamanho / 1024 / 1024 if self.video else 0
+    
+    def url_video(self, versao='original'):
+        """URL protegida (login e Range) do vídeo, do poster ou de uma versão"""
+        if versao == 'original':
+            return reverse('paginas:video_aula', args=[self.pk])
+        return reverse('paginas:video_aula_versao', args=[self.pk, versao])
+    
+    def url_poster(self):
+        return self.url_video('poster') if self.video_poster else ''
+    
+    def fontes_video(self):
+        """
+        [(url, media)] para as tags <source> do player. Com o vídeo processado,
+        as versões menores vêm antes (com media query da largura) e a 'web' por
+        último; antes disso, o arquivo original. Usa o prefetch de versoes_video.
+        """
+        if not self.video:
+            return []
+        versoes = sorted(self.versoes_video.all(), key=lambda versao: versao.altura)
+        if self.video_status != 'PRONTO' or not versoes:
+            return [(self.url_video(), '')]
+        return [
+            (self.url_video(versao.nome), '' if versao.nome == 'web' else f'(max-width: {versao.largura}px)')
+            for versao in versoes
+        ]
     
     def dias_desde_upload(self):
         """Retorna quantos dias se passaram desde o upload do vídeo"""
@@ -213,6 +289,88 @@ class Aula(models.Model):
         return None
 
 
+class VersaoVideo(models.Model):
+    """
+    Arquivo gerado a partir do vídeo enviado de uma aula: o MP4 otimizado
+    para web ('web') e as versões com bitrate menor para o celular.
+    """
+    aula = models.ForeignKey(Aula, on_delete=models.CASCADE, related_name='versoes_video')
+    nome = models.CharField(max_length=20, help_text="'web' ou a altura da versão (ex.: 480p)")
+    arquivo = models.FileField(upload_to='aulas/processados/')
+    largura = models.PositiveIntegerField(default=0)
+    altura = models.PositiveIntegerField(default=0)
+    bitrate_kbps = models.PositiveIntegerField(default=0)
+    tamanho_bytes = models.BigIntegerField(default=0)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Versão de Vídeo'
+        verbose_name_plural = 'Versões de Vídeo'
+        ordering = ['aula', '-altura']
+        unique_together = ['aula', 'nome']
+    
+    def __str__(self):
+        return f"{self.aula} - {self.nome}"
+    
+    def tamanho_mb(self):
+        return self.tamanho_bytes / 1024 / 1024
+
+
+class UploadVideo(models.Model):
+    """
+    Envio em partes (retomável) do vídeo de uma aula. As partes vão direto
+    para um arquivo em disco; `recebido` é quantos bytes já chegaram.
+    """
+    STATUS_CHOICES = [
+        ('ABERTO', 'Recebendo'),
+        ('CONCLUIDO', 'Concluído'),
+        ('CANCELADO', 'Cancelado'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    aula = models.ForeignKey(Aula, on_delete=models.CASCADE, related_name='uploads_video')
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploads_video')
+    nome_arquivo = models.CharField(max_length=255)
+    tamanho = models.BigIntegerField(help_text='Tamanho total anunciado, em bytes')
+    recebido = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ABERTO')
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_atualizacao = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Upload de Vídeo'
+        verbose_name_plural = 'Uploads de Vídeo'
+        ordering = ['-data_criacao']
+        indexes = [
+            models.Index(fields=['status', 'data_atualizacao']),
+        ]
+    
+    def __str__(self):
+        return f"{self.aula} - {self.nome_arquivo} ({self.recebido}/{self.tamanho})"
+
+
+class DiaSemAula(models.Model):
+    """Feriados e recessos: a geração automática de aulas pula estas datas"""
+    data = models.DateField()
+    turma = models.ForeignKey(
+        Turma, on_delete=models.CASCADE, null=True, blank=True, related_name='dias_sem_aula',
+        help_text='Deixe em branco para valer para todas as turmas'
+    )
+    motivo = models.CharField(max_length=200, blank=True)
+    
+    class Meta:
+        verbose_name = 'Dia sem Aula'
+        verbose_name_plural = 'Dias sem Aula'
+        ordering = ['data']
+        indexes = [
+            models.Index(fields=['data']),
+        ]
+    
+    def __str__(self):
+        alcance = self.turma.nome if self.turma_id else 'Todas as turmas'
+        return f"{self.data.strftime('%d/%m/%Y')} - {alcance}"
+
+
 class Frequencia(models.Model):
     """Modelo para registrar a frequência dos alunos"""
     STATUS_CHOICES = [
@@ -238,6 +396,33 @@ class Frequencia(models.Model):
         return f"{self.aluno.usuario.get_full_name()} - {self.aula} - {self.get_status_display()}"
 
 
+class ResumoFrequenciaMensal(models.Model):
+    """
+    Frequência de cada aluno agregada por mês da aula. Mantido pelos sinais
+    de Frequencia/Aula e por paginas.frequencias; o gráfico, o painel e a
+    exportação leem daqui em vez de percorrer as frequências uma a uma.
+    """
+    aluno = models.ForeignKey(Aluno, on_delete=models.CASCADE, related_name='resumos_frequencia')
+    mes = models.DateField(help_text='Primeiro dia do mês')
+    presencas = models.PositiveIntegerField(default=0)
+    faltas = models.PositiveIntegerField(default=0)
+    justificadas = models.PositiveIntegerField(default=0, help_text='Faltas justificadas e atestados')
+    total = models.PositiveIntegerField(default=0)
+    data_atualizacao = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Resumo de Frequência Mensal'
+        verbose_name_plural = 'Resumos de Frequência Mensal'
+        ordering = ['aluno', 'mes']
+        unique_together = ['aluno', 'mes']
+    
+    def __str__(self):
+        return f"{self.aluno} - {self.mes.strftime('%m/%Y')}"
+    
+    def percentual_presenca(self):
+        return round(self.presencas / self.total * 100, 1) if self.total else 0
+
+
 class Aviso(models.Model):
     """Modelo para avisos e comunicados"""
     TIPO_CHOICES = [
@@ -263,6 +448,10 @@ class Aviso(models.Model):
         verbose_name = 'Aviso'
         verbose_name_plural = 'Avisos'
         ordering = ['-importante', '-data_criacao']
+        indexes = [
+            # Paginação por chave da lista de avisos do aluno
+            models.Index(fields=['ativo', '-importante', '-data_criacao', '-id']),
+        ]
     
     def __str__(self):
         return f"{self.titulo} - {self.get_tipo_display()}"
@@ -287,12 +476,18 @@ class Mensalidade(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDENTE')
     forma_pagamento = models.CharField(max_length=50, blank=True)
     observacoes = models.TextField(blank=True)
+    data_atualizacao = models.DateTimeField(auto_now=True, help_text='Usado na sincronização incremental')
     
     class Meta:
         verbose_name = 'Mensalidade'
         verbose_name_plural = 'Mensalidades'
         ordering = ['-mes_referencia']
         unique_together = ['aluno', 'mes_referencia']
+        indexes = [
+            models.Index(fields=['data_atualizacao', 'id']),
+            # Lista de atrasadas do dashboard administrativo
+            models.Index(fields=['status', 'data_vencimento', 'id']),
+        ]
     
     def clean(self):
         """Validação customizada"""
@@ -312,11 +507,16 @@ class Mensalidade(models.Model):
         if self.valor is not None and self.valor_desconto is not None:
             self.valor_final = self.valor - self.valor_desconto
         
-        # Atualiza status para ATRASADO se vencida
+        # Mensalidade PENDENTE salva já vencida (criada assim ou com o
+        # vencimento mudado para trás) vira ATRASADO aqui: a marca d'água do
+        # comando atualizar_mensalidades (paginas.mensalidades) não volta para
+        # datas já verificadas. As que vencem depois são tratadas em lote pelo
+        # comando. A validação (clean) fica a cargo dos formulários e do admin.
         if self.status == 'PENDENTE' and self.data_vencimento < timezone.now().date():
             self.status = 'ATRASADO'
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'status'}
         
-        self.full_clean()
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -487,6 +687,10 @@ class VendaIngresso(models.Model):
         verbose_name = 'Venda de Ingresso'
         verbose_name_plural = 'Vendas de Ingressos'
         ordering = ['-data_venda', '-data_registro']
+        indexes = [
+            # Histórico paginado de "Minhas vendas"
+            models.Index(fields=['vendedor', '-data_venda', '-id']),
+        ]
     
     def __str__(self):
         return f"{self.vendedor.get_full_name() or self.vendedor.username} - {self.evento.nome} ({self.quantidade} ingressos)"
@@ -570,6 +774,13 @@ class ResultadoFinanceiroMensal(models.Model):
         related_name='resultados_financeiros_criados'
     )
     
+    calculado_em = models.DateTimeField(
+        verbose_name="Calculado em",
+        null=True,
+        blank=True,
+        help_text="Preenchido quando os valores vêm do cálculo automático (paginas.financeiro)"
+    )
+    
     class Meta:
         verbose_name = "Resultado Financeiro Mensal"
         verbose_name_plural = "Resultados Financeiros Mensais"
@@ -1057,7 +1268,7 @@ class DespesaAdministrativa(models.Model):
         verbose_name_plural = "Despesas Administrativas"
         ordering = ['-data_vencimento', '-data_criacao']
         indexes = [
-            models.Index(fields=['-data_vencimento']),
+            models.Index(fields=['-data_vencimento', '-id']),
             models.Index(fields=['status']),
             models.Index(fields=['categoria']),
             models.Index(fields=['tipo_pagamento']),
@@ -1450,6 +1661,135 @@ class EntradaFinanceira(models.Model):
         return "-"
 
 
+class RegistroExcluido(models.Model):
+    """
+    Lápide (tombstone) de registros excluídos.
+    Permite que a sincronização incremental das APIs de exportação
+    informe ao consumidor quais linhas deixaram de existir.
+    """
+    MODELO_CHOICES = [
+        ('ALUNO', 'Aluno'),
+        ('MENSALIDADE', 'Mensalidade'),
+    ]
+    
+    modelo = models.CharField(max_length=20, choices=MODELO_CHOICES)
+    objeto_id = models.BigIntegerField()
+    data_exclusao = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name = 'Registro Excluído'
+        verbose_name_plural = 'Registros Excluídos'
+        ordering = ['data_exclusao', 'id']
+        indexes = [
+            models.Index(fields=['modelo', 'data_exclusao', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_modelo_display()} #{self.objeto_id} excluído em {self.data_exclusao:%d/%m/%Y %H:%M}"
 
 
+class MesFinanceiroPendente(models.Model):
+    """
+    Fila de meses cujo ResultadoFinanceiroMensal precisa ser recalculado.
+    Os sinais marcam os meses tocados por mensalidades, vendas, entradas e
+    despesas; paginas.financeiro.processar_meses_pendentes() esvazia a fila.
+    """
+    mes = models.DateField(unique=True, help_text='Primeiro dia do mês')
+    data_marcacao = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Mês Financeiro Pendente'
+        verbose_name_plural = 'Meses Financeiros Pendentes'
+        ordering = ['mes']
+    
+    def __str__(self):
+        return self.mes.strftime('%m/%Y')
 
+
+class RegistroTransicaoMensalidades(models.Model):
+    """
+    Auditoria de cada execução do comando atualizar_mensalidades.
+    A data de referência da última execução serve de marca d'água (--since)
+    para a próxima verificar só as mensalidades que venceram depois dela.
+    """
+    data_execucao = models.DateTimeField(auto_now_add=True)
+    data_referencia = models.DateField(help_text='Mensalidades vencidas antes desta data foram verificadas')
+    desde = models.DateField(null=True, blank=True, help_text='Marca d\'água usada (vazio = verificação completa)')
+    total_atualizadas = models.PositiveIntegerField(default=0)
+    total_notificacoes = models.PositiveIntegerField(default=0)
+    lotes = models.PositiveIntegerField(default=0)
+    duracao_segundos = models.FloatField(default=0)
+    
+    class Meta:
+        verbose_name = 'Registro de Transição de Mensalidades'
+        verbose_name_plural = 'Registros de Transição de Mensalidades'
+        ordering = ['-data_execucao']
+    
+    def __str__(self):
+        return f"{self.data_execucao:%d/%m/%Y %H:%M} - {self.total_atualizadas} mensalidade(s) para ATRASADO"
+
+
+class EventoWebhook(models.Model):
+    """
+    Caixa de entrada dos webhooks do Mercado Pago.
+    O evento bruto é gravado e confirmado na hora; o processamento (consulta
+    ao pagamento e baixa da mensalidade) fica com o comando processar_webhooks.
+    Há uma linha por recurso (ex.: id do pagamento): notificações repetidas
+    só reabrem o evento.
+    """
+    STATUS_CHOICES = [
+        ('PENDENTE', 'Pendente'),
+        ('PROCESSANDO', 'Processando'),
+        ('PROCESSADO', 'Processado'),
+        ('ERRO', 'Erro'),
+        ('IGNORADO', 'Ignorado'),
+    ]
+    
+    tipo = models.CharField(max_length=50, help_text='Tipo da notificação (ex: payment)')
+    recurso_id = models.CharField(max_length=100, help_text='ID do recurso notificado (ex: id do pagamento)')
+    corpo = models.JSONField(default=dict, help_text='Último corpo recebido')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDENTE')
+    recebimentos = models.PositiveIntegerField(default=1, help_text='Quantas vezes o gateway enviou este evento')
+    tentativas = models.PositiveIntegerField(default=0)
+    proxima_tentativa = models.DateTimeField(default=timezone.now)
+    ultimo_erro = models.TextField(blank=True)
+    resultado = models.CharField(max_length=100, blank=True)
+    data_recebimento = models.DateTimeField(auto_now_add=True)
+    data_processamento = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Evento de Webhook'
+        verbose_name_plural = 'Eventos de Webhook'
+        ordering = ['-data_recebimento']
+        constraints = [
+            models.UniqueConstraint(fields=['tipo', 'recurso_id'], name='evento_webhook_unico_por_recurso'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'proxima_tentativa']),
+        ]
+    
+    def __str__(self):
+        return f"{self.tipo} {self.recurso_id} - {self.get_status_display()}"
+
+
+class PreferenciaPagamento(models.Model):
+    """
+    Preferência de checkout do Mercado Pago já criada para uma mensalidade.
+    Reaproveitada enquanto o valor for o mesmo e ela não expirar; é apagada
+    quando a mensalidade muda de valor ou é paga (paginas/signals.py).
+    """
+    mensalidade = models.ForeignKey(Mensalidade, on_delete=models.CASCADE, related_name='preferencias_pagamento')
+    valor = models.DecimalField(max_digits=10, decimal_places=2, help_text='valor_final usado na preferência')
+    preference_id = models.CharField(max_length=100)
+    expira_em = models.DateTimeField()
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Preferência de Pagamento'
+        verbose_name_plural = 'Preferências de Pagamento'
+        constraints = [
+            models.UniqueConstraint(fields=['mensalidade', 'valor'], name='preferencia_unica_por_valor'),
+        ]
+    
+    def __str__(self):
+        return f"{self.mensalidade_id} - R$ {self.valor} - {self.preference_id}"
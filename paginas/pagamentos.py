@@ -0,0 +1,300 @@
+"""
+Pagamentos de mensalidades pelo Mercado Pago.
+
+Webhook (caixa de entrada):
+    A view só chama registrar_evento(), que grava o corpo bruto em
+    EventoWebhook e responde 200 na hora, sem falar com o gateway. Há uma
+    linha por pagamento: notificações repetidas só incrementam o contador
+    (ou reabrem o evento, se ele já tinha sido processado).
+
+    O comando processar_webhooks chama processar_eventos_pendentes(), que
+    distribui os eventos entre threads. Cada evento é reservado com um
+    UPDATE condicional, consulta o pagamento na API e aplica o resultado na
+    mensalidade. Falhas voltam para a fila com backoff exponencial (com
+    jitter) até MAX_TENTATIVAS. As chamadas ao gateway passam pelo cliente
+    compartilhado de paginas.gateway_mp (pool, timeouts e disjuntor).
+
+aplicar_pagamento() é idempotente: a mensalidade só é baixada e o aluno só
+é notificado na primeira vez que o pagamento aprovado é visto.
+
+Preferências de checkout (pagar_mensalidade):
+    A preferência criada para uma mensalidade fica em PreferenciaPagamento,
+    por (mensalidade, valor_final), e é reaproveitada até perto de expirar.
+    Reabrir o modal de pagamento não chama o gateway de novo.
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import close_old_connections, connection, transaction
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .filas import calcular_backoff
+from .gateway_mp import ErroGateway, obter_cliente
+from .models import EventoWebhook, Mensalidade, Notificacao, PreferenciaPagamento
+
+MAX_TENTATIVAS = 8
+BACKOFF_BASE_SEGUNDOS = 30
+BACKOFF_MAXIMO_SEGUNDOS = 60 * 60
+# Tempo que um evento fica reservado por um worker antes de poder ser retomado
+TEMPO_RESERVA_SEGUNDOS = 5 * 60
+# Preferência perto de expirar não é reaproveitada: o aluno precisa de tempo para pagar
+MARGEM_PREFERENCIA = timedelta(minutes=15)
+
+
+class MercadoPagoAPI:
+    """Consultas ao Mercado Pago usadas pelo processamento dos webhooks"""
+
+    def buscar_pagamento(self, payment_id):
+        """Dados do pagamento, ou None se ele não existir"""
+        # Cliente do processo: as threads compartilham o pool de conexões e o disjuntor
+        return obter_cliente().buscar_pagamento(payment_id)
+
+
+# ---------------------------------------------------------
+# PREFERÊNCIAS DE CHECKOUT
+# ---------------------------------------------------------
+
+def dados_preferencia(mensalidade, expira_em):
+    """Corpo da preferência de checkout de uma mensalidade"""
+    return {
+        "items": [
+            {
+                "title": f"Mensalidade {mensalidade.mes_referencia.strftime('%m/%Y')}",
+                "quantity": 1,
+                "currency_id": "BRL",
+                "unit_price": float(mensalidade.valor_final),
+            }
+        ],
+        "metadata": {
+            "mensalidade_id": str(mensalidade.id)
+        },
+        "statement_descriptor": "GIRO DNC",
+        "external_reference": f"MENS-{mensalidade.id}",
+        # Expira no gateway junto com o registro local
+        "expires": True,
+        "expiration_date_to": timezone.localtime(expira_em).isoformat(timespec='milliseconds'),
+    }
+
+
+def preferencia_da_mensalidade(mensalidade):
+    """
+    preference_id para pagar a mensalidade.
+
+    Reaproveita a preferência já criada para o mesmo valor_final enquanto
+    ela não estiver perto de expirar; senão cria uma nova no Mercado Pago.
+    Levanta ErroGateway se o gateway recusar a criação.
+    """
+    agora = timezone.now()
+    existente = PreferenciaPagamento.objects.filter(
+        mensalidade=mensalidade,
+        valor=mensalidade.valor_final,
+        expira_em__gt=agora + MARGEM_PREFERENCIA,
+    ).values_list('preference_id', flat=True).first()
+    if existente:
+        return existente
+
+    expira_em = agora + timedelta(hours=getattr(settings, 'MP_PREFERENCIA_VALIDADE_HORAS', 24))
+    resposta = obter_cliente().criar_preferencia(dados_preferencia(mensalidade, expira_em))
+    if resposta['status'] != 201:
+        mensagem = (resposta.get('response') or {}).get('message', 'Erro desconhecido')
+        raise ErroGateway(f'Erro ao criar preferência: {mensagem}')
+
+    preference_id = resposta['response']['id']
+    # Dois cliques ao mesmo tempo: fica a última preferência criada
+    PreferenciaPagamento.objects.bulk_create(
+        [PreferenciaPagamento(
+            mensalidade=mensalidade, valor=mensalidade.valor_final,
+            preference_id=preference_id, expira_em=expira_em,
+        )],
+        update_conflicts=True,
+        unique_fields=['mensalidade', 'valor'],
+        update_fields=['preference_id', 'expira_em'],
+    )
+    return preference_id
+
+
+# ---------------------------------------------------------
+# APLICAÇÃO DO PAGAMENTO NA MENSALIDADE
+# ---------------------------------------------------------
+
+def mensalidade_do_pagamento(pagamento):
+    """ID da mensalidade no metadata ou no external_reference ("MENS-<id>")"""
+    mensalidade_id = (pagamento.get('metadata') or {}).get('mensalidade_id')
+    if not mensalidade_id:
+        referencia = pagamento.get('external_reference') or ''
+        if referencia.startswith('MENS-'):
+            mensalidade_id = referencia[len('MENS-'):]
+    try:
+        return int(mensalidade_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def aplicar_pagamento(pagamento):
+    """
+    Atualiza a mensalidade conforme o status do pagamento.
+
+    Retorna um código curto com o que aconteceu: PAGO, JA_PAGO, PENDENTE,
+    SEM_MENSALIDADE ou STATUS_<status do gateway>.
+    """
+    mensalidade_id = mensalidade_do_pagamento(pagamento)
+    if mensalidade_id is None:
+        return 'SEM_MENSALIDADE'
+
+    status = pagamento.get('status')
+    with transaction.atomic():
+        mensalidade = Mensalidade.objects.select_for_update(of=('self',)).select_related('aluno').filter(
+            pk=mensalidade_id
+        ).first()
+        if mensalidade is None:
+            return 'SEM_MENSALIDADE'
+
+        if status == 'approved':
+            if mensalidade.status == 'PAGO':
+                return 'JA_PAGO'
+            mensalidade.status = 'PAGO'
+            mensalidade.data_pagamento = timezone.localdate()
+            mensalidade.save()
+
+            # Criar notificação para o aluno
+            Notificacao.objects.create(
+                usuario_id=mensalidade.aluno.usuario_id,
+                tipo='PAGAMENTO',
+                titulo='Pagamento Aprovado',
+                mensagem=f'Sua mensalidade de {mensalidade.mes_referencia.strftime("%m/%Y")} foi aprovada!'
+            )
+            return 'PAGO'
+
+        if status in ('pending', 'in_process'):
+            if mensalidade.status != 'PAGO':
+                mensalidade.observacoes = f"Pagamento pendente - {pagamento.get('status_detail')}"
+                mensalidade.save()
+            return 'PENDENTE'
+
+    return f'STATUS_{status}'.upper()
+
+
+# ---------------------------------------------------------
+# CAIXA DE ENTRADA DO WEBHOOK
+# ---------------------------------------------------------
+
+def extrair_notificacao(request):
+    """
+    (tipo, recurso_id, corpo) de uma notificação do Mercado Pago.
+
+    Aceita o formato novo (JSON com type e data.id) e o antigo por query
+    string (?topic=payment&id=...). Levanta ValueError se o corpo não for JSON.
+    """
+    corpo = json.loads(request.body) if request.body else {}
+    if not isinstance(corpo, dict):
+        raise ValueError('Corpo do webhook não é um objeto JSON')
+    tipo = corpo.get('type') or request.GET.get('type') or request.GET.get('topic') or ''
+    recurso_id = (corpo.get('data') or {}).get('id') or request.GET.get('data.id') or request.GET.get('id')
+    return tipo, str(recurso_id) if recurso_id else None, corpo
+
+
+def registrar_evento(tipo, recurso_id, corpo):
+    """Grava (ou reabre) o evento na caixa de entrada; retorna (evento, criado)"""
+    with transaction.atomic():
+        evento, criado = EventoWebhook.objects.select_for_update().get_or_create(
+            tipo=tipo, recurso_id=recurso_id, defaults={'corpo': corpo}
+        )
+        if not criado:
+            campos = {'corpo': corpo, 'recebimentos': F('recebimentos') + 1}
+            # Já resolvido: o pagamento pode ter mudado de status, processa de novo.
+            # PENDENTE/PROCESSANDO: já está na fila, a repetição é descartada.
+            if evento.status in ('PROCESSADO', 'ERRO', 'IGNORADO'):
+                campos.update(status='PENDENTE', tentativas=0, proxima_tentativa=timezone.now())
+            EventoWebhook.objects.filter(pk=evento.pk).update(**campos)
+    return evento, criado
+
+
+def _disponiveis(agora):
+    # PROCESSANDO com a reserva vencida: o worker que o pegou morreu
+    return EventoWebhook.objects.filter(
+        Q(status='PENDENTE') | Q(status='PROCESSANDO'),
+        proxima_tentativa__lte=agora,
+    )
+
+
+def processar_evento(evento, api):
+    """Consulta o pagamento do evento e aplica na mensalidade; retorna (status, resultado)"""
+    if evento.tipo != 'payment':
+        return 'IGNORADO', f'Tipo {evento.tipo} não tratado'
+    pagamento = api.buscar_pagamento(evento.recurso_id)
+    if pagamento is None:
+        return 'IGNORADO', 'Pagamento não encontrado'
+    resultado = aplicar_pagamento(pagamento)
+    return ('IGNORADO' if resultado == 'SEM_MENSALIDADE' else 'PROCESSADO'), resultado
+
+
+def processar_evento_por_id(evento_id, api):
+    """Reserva, processa e finaliza um evento. Retorna o status final ou None se outro worker o pegou"""
+    agora = timezone.now()
+    reservado = _disponiveis(agora).filter(pk=evento_id).update(
+        status='PROCESSANDO',
+        tentativas=F('tentativas') + 1,
+        proxima_tentativa=agora + timedelta(seconds=TEMPO_RESERVA_SEGUNDOS),
+    )
+    if not reservado:
+        return None
+
+    evento = EventoWebhook.objects.get(pk=evento_id)
+    try:
+        status, resultado = processar_evento(evento, api)
+    except Exception as e:
+        falhou = evento.tentativas >= MAX_TENTATIVAS
+        EventoWebhook.objects.filter(pk=evento_id).update(
+            status='ERRO' if falhou else 'PENDENTE',
+            proxima_tentativa=timezone.now() + calcular_backoff(
+                evento.tentativas, BACKOFF_BASE_SEGUNDOS, BACKOFF_MAXIMO_SEGUNDOS
+            ),
+            ultimo_erro=f'{type(e).__name__}: {e}',
+        )
+        return 'ERRO' if falhou else 'PENDENTE'
+
+    finalizado = EventoWebhook.objects.filter(pk=evento_id, recebimentos=evento.recebimentos).update(
+        status=status, resultado=resultado, ultimo_erro='', data_processamento=timezone.now()
+    )
+    if not finalizado:
+        # Chegou outra notificação durante o processamento: processa de novo
+        EventoWebhook.objects.filter(pk=evento_id).update(
+            status='PENDENTE', resultado=resultado, proxima_tentativa=timezone.now()
+        )
+        return 'PENDENTE'
+    return status
+
+
+def _em_thread(evento_id, api):
+    close_old_connections()
+    try:
+        return processar_evento_por_id(evento_id, api)
+    finally:
+        connection.close()
+
+
+def processar_eventos_pendentes(api=None, workers=4, limite=200):
+    """
+    Processa até `limite` eventos disponíveis com um pool de `workers` threads.
+
+    Com workers=1 roda na thread atual (usado nos testes). Retorna um dict
+    {status_final: quantidade}.
+    """
+    api = api or MercadoPagoAPI()
+    ids = list(
+        _disponiveis(timezone.now()).order_by('proxima_tentativa', 'id').values_list('id', flat=True)[:limite]
+    )
+    if workers <= 1:
+        finais = [processar_evento_por_id(evento_id, api) for evento_id in ids]
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='webhook-mp') as pool:
+            finais = list(pool.map(lambda evento_id: _em_thread(evento_id, api), ids))
+
+    contagem = {}
+    for status in finais:
+        if status:
+            contagem[status] = contagem.get(status, 0) + 1
+    return contagem
@@ -0,0 +1,150 @@
+"""
+Paginação por chave (keyset / seek) para as listagens longas.
+
+Em vez de OFFSET, cada página continua a partir dos valores de ordenação
+do último item da página anterior, então o custo de abrir a página N não
+cresce com N. A ordenação sempre termina em "id" para ser estável.
+
+Uso:
+    pagina = paginar_keyset(request, queryset, ['-data_criacao', '-id'], por_pagina=20)
+    pagina.itens          -> lista de objetos da página
+    pagina.url_proxima    -> link da próxima página (None se acabou)
+    pagina.url_primeira   -> link da primeira página (None se já está nela)
+"""
+import base64
+import datetime
+import json
+
+from django.db.models import F, Q
+
+PARAMETRO_CURSOR = 'cursor'
+
+
+def _campos(ordenacao):
+    """['-data_criacao', 'id'] -> [('data_criacao', True), ('id', False)]"""
+    return [(campo.lstrip('-'), campo.startswith('-')) for campo in ordenacao]
+
+
+def _order_by(campos):
+    # NULLs sempre no fim, nos dois sentidos, para o predicado abaixo ser simples
+    return [
+        F(nome).desc(nulls_last=True) if desc else F(nome).asc(nulls_last=True)
+        for nome, desc in campos
+    ]
+
+
+def _depois_de(campos, valores):
+    """
+    Predicado "vem depois de (valores)" para a ordenação dada.
+
+    Para cada campo: estritamente depois nele, ou igual nele e depois nos
+    seguintes. Com NULLs no fim, qualquer valor não nulo é seguido pelos nulos.
+    """
+    (nome, desc), *resto = campos
+    valor, *valores_resto = valores
+
+    if valor is None:
+        depois = Q(pk__in=[])
+        igual = Q(**{f'{nome}__isnull': True})
+    else:
+        depois = Q(**{f'{nome}__lt' if desc else f'{nome}__gt': valor}) | Q(**{f'{nome}__isnull': True})
+        igual = Q(**{nome: valor})
+
+    if not resto:
+        return depois
+    return depois | (igual & _depois_de(resto, valores_resto))
+
+
+def _para_json(valor):
+    # isoformat() completo: o DjangoJSONEncoder corta os microssegundos e
+    # o cursor pularia linhas criadas no mesmo milissegundo
+    if isinstance(valor, (datetime.date, datetime.time)):
+        return valor.isoformat()
+    return str(valor)
+
+
+def _codificar(valores):
+    return base64.urlsafe_b64encode(json.dumps(valores, default=_para_json).encode()).decode()
+
+
+def _decodificar(model, campos, cursor):
+    """Converte o cursor de volta para valores Python; None se for inválido"""
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        if len(valores) != len(campos):
+            return None
+        return [
+            None if valor is None else model._meta.get_field(nome).to_python(valor)
+            for (nome, _), valor in zip(campos, valores)
+        ]
+    except Exception:
+        return None
+
+
+class PaginaKeyset:
+    """Uma página de resultados e os links de navegação"""
+
+    def __init__(self, request, itens, proximo_cursor, cursor_atual, parametro):
+        self.itens = itens
+        self.proximo_cursor = proximo_cursor
+        self.cursor_atual = cursor_atual
+        self._request = request
+        self._parametro = parametro
+
+    def __iter__(self):
+        return iter(self.itens)
+
+    def __len__(self):
+        return len(self.itens)
+
+    def __bool__(self):
+        return bool(self.itens)
+
+    @property
+    def tem_proxima(self):
+        return self.proximo_cursor is not None
+
+    def _url(self, cursor):
+        params = self._request.GET.copy()
+        params.pop(self._parametro, None)
+        if cursor:
+            params[self._parametro] = cursor
+        query = params.urlencode()
+        return f'{self._request.path}?{query}' if query else self._request.path
+
+    @property
+    def url_proxima(self):
+        return self._url(self.proximo_cursor) if self.tem_proxima else None
+
+    @property
+    def url_primeira(self):
+        return self._url(None) if self.cursor_atual else None
+
+
+def paginar_keyset(request, queryset, ordenacao, por_pagina=20, parametro=PARAMETRO_CURSOR):
+    """
+    Pagina o queryset por chave usando a ordenação informada.
+
+    A ordenação deve identificar unicamente cada linha (termine com 'id' ou
+    '-id'). Um cursor inválido volta para a primeira página.
+    """
+    campos = _campos(ordenacao)
+    nomes = [nome for nome, _ in campos]
+    qs = queryset.order_by(*_order_by(campos))
+
+    cursor = request.GET.get(parametro)
+    valores = _decodificar(queryset.model, campos, cursor) if cursor else None
+    if valores is not None:
+        qs = qs.filter(_depois_de(campos, valores))
+    else:
+        cursor = None
+
+    # Um item a mais indica se existe próxima página
+    itens = list(qs[:por_pagina + 1])
+    proximo_cursor = None
+    if len(itens) > por_pagina:
+        itens = itens[:por_pagina]
+        ultimo = itens[-1]
+        proximo_cursor = _codificar([getattr(ultimo, nome) for nome in nomes])
+
+    return PaginaKeyset(request, itens, proximo_cursor, cursor, parametro)
@@ -0,0 +1,112 @@
+"""
+Cache do contexto do painel do aluno.
+
+Cada seção do painel (dashboard, horários, minhas aulas) é guardada por
+aluno no cache padrão do Django, então funciona com LocMemCache,
+FileBasedCache ou DatabaseCache sem depender de Redis.
+
+As chaves são indexadas pelo id do usuário do aluno (relação 1:1), o que
+permite responder a uma visita repetida sem nenhuma consulta ao ORM. A
+invalidação é feita pelos sinais em paginas/signals.py.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+SECOES = ('index', 'horarios', 'minhas_aulas')
+
+CHAVE_GERACAO = 'painel:geracao'
+CHAVE_HITS = 'painel:stats:hits'
+CHAVE_MISSES = 'painel:stats:misses'
+
+
+def _timeout():
+    return getattr(settings, 'PAINEL_CACHE_TIMEOUT', 60 * 60)
+
+
+def _geracao():
+    """Número da geração atual; incrementá-lo invalida o painel de todos os alunos"""
+    geracao = cache.get(CHAVE_GERACAO)
+    if geracao is None:
+        # Começa de um valor baseado no relógio para não reaproveitar
+        # entradas antigas caso o contador tenha sido despejado do cache.
+        cache.add(CHAVE_GERACAO, int(time.time()), None)
+        geracao = cache.get(CHAVE_GERACAO)
+    return geracao
+
+
+def _chave(secao, usuario_id, geracao):
+    # A data entra na chave porque o contexto depende de "hoje"
+    # (próximas aulas, dias até a aula, avisos dos últimos 7 dias).
+    hoje = timezone.localdate().isoformat()
+    return f'painel:{secao}:{usuario_id}:{geracao}:{hoje}'
+
+
+def _incrementar(chave):
+    try:
+        cache.incr(chave)
+    except ValueError:
+        # Chave ainda não existe (ou expirou) no backend
+        if not cache.add(chave, 1, None):
+            cache.incr(chave)
+
+
+def obter_contexto(secao, usuario, construir):
+    """
+    Retorna o contexto em cache da seção para o usuário.
+
+    Em caso de miss chama construir() e guarda o resultado. Exceções
+    (ex.: Aluno.DoesNotExist) não são cacheadas.
+    """
+    chave = _chave(secao, usuario.pk, _geracao())
+    contexto = cache.get(chave)
+    if contexto is not None:
+        _incrementar(CHAVE_HITS)
+        return contexto
+
+    _incrementar(CHAVE_MISSES)
+    contexto = construir()
+    cache.set(chave, contexto, _timeout())
+    return contexto
+
+
+def invalidar_usuarios(usuario_ids):
+    """Remove o painel em cache dos usuários (alunos) informados"""
+    usuario_ids = {uid for uid in usuario_ids if uid is not None}
+    if not usuario_ids:
+        return
+    geracao = _geracao()
+    cache.delete_many([
+        _chave(secao, uid, geracao)
+        for secao in SECOES
+        for uid in usuario_ids
+    ])
+
+
+def invalidar_todos():
+    """Invalida o painel de todos os alunos (ex.: aviso geral)"""
+    _geracao()
+    try:
+        cache.incr(CHAVE_GERACAO)
+    except ValueError:
+        cache.set(CHAVE_GERACAO, int(time.time()), None)
+
+
+def estatisticas():
+    """Contadores de hit/miss do cache do painel"""
+    valores = cache.get_many([CHAVE_HITS, CHAVE_MISSES])
+    hits = valores.get(CHAVE_HITS, 0)
+    misses = valores.get(CHAVE_MISSES, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'total': total,
+        'taxa_acerto': round(hits / total * 100, 1) if total else 0.0,
+    }
+
+
+def zerar_estatisticas():
+    cache.delete_many([CHAVE_HITS, CHAVE_MISSES])
@@ -0,0 +1,251 @@
+"""
+Retenção dos vídeos das aulas (comando limpar_videos_antigos).
+
+O comando antigo parava em um input(), percorria o queryset duas vezes e
+apagava um arquivo por aula.save(). Aqui a seleção é feita em memória
+sobre uma única consulta (values_list) e aplicada em lotes:
+
+Políticas (setting VIDEO_RETENCAO ou opções do comando; None desliga):
+    dias             vídeos enviados há mais de `dias` dias
+    cota_turma_mb    por turma, remove os vídeos menos vistos até caber
+    orcamento_mb     no total, remove os vídeos menos vistos até caber
+    manter_recentes  as N aulas mais recentes com vídeo de cada turma
+                     nunca são removidas, por nenhuma política
+
+"Menos visto" é a ordem LRU de video_ultima_visualizacao (gravada pela
+view video_aula, no máximo uma vez por INTERVALO_VISUALIZACAO), caindo
+para a data do upload em vídeos nunca assistidos.
+
+Aplicação: para cada lote de TAMANHO_LOTE aulas, um update() limpa os
+campos de vídeo e um delete() remove as VersaoVideo; depois os arquivos
+do lote são apagados em paralelo por um pool de threads. Nenhum
+Aula.save() é chamado. Um arquivo que não pôde ser apagado fica como
+órfão para o reconciliar_videos. O update() filtra pelo nome do vídeo
+lido na seleção: se a aula recebeu outro vídeo nesse meio tempo, ela é
+pulada e listada em 'ignorados' no relatório.
+
+O resultado é um relatório (dict serializável em JSON) com os bytes
+liberados por política e por turma, e em 'sem_tamanho' quantos vídeos
+ainda não foram medidos (video_tamanho=0): para as políticas de espaço
+eles valem 0 bytes até o reconciliar_videos --corrigir.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import painel_cache
+from .models import Aula, VersaoVideo
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_LOTE = 200
+INTERVALO_VISUALIZACAO = timedelta(hours=1)
+POLITICA_PADRAO = {
+    'dias': 30,
+    'cota_turma_mb': None,
+    'orcamento_mb': None,
+    'manter_recentes': 0,
+}
+MB = 1024 * 1024
+
+
+def politica_configurada(**sobrescritas):
+    """POLITICA_PADRAO + settings.VIDEO_RETENCAO + opções não nulas do comando"""
+    politica = {**POLITICA_PADRAO, **getattr(settings, 'VIDEO_RETENCAO', {})}
+    politica.update({chave: valor for chave, valor in sobrescritas.items() if valor is not None})
+    return politica
+
+
+def registrar_visualizacao(aula_id, agora=None):
+    """Marca o acesso ao vídeo; no máximo uma escrita por aula a cada INTERVALO_VISUALIZACAO"""
+    agora = agora or timezone.now()
+    Aula.objects.filter(pk=aula_id).filter(
+        Q(video_ultima_visualizacao__isnull=True) | Q(video_ultima_visualizacao__lt=agora - INTERVALO_VISUALIZACAO)
+    ).update(video_ultima_visualizacao=agora)
+
+
+# ---------------------------------------------------------
+# SELEÇÃO
+# ---------------------------------------------------------
+
+class _Video:
+    __slots__ = ('aula_id', 'video', 'turma_id', 'turma', 'data', 'upload', 'acesso', 'bytes', 'motivo')
+
+    def __init__(self, aula_id, video, turma_id, turma, data, upload, acesso, tamanho, processados):
+        self.aula_id = aula_id
+        # Nome do arquivo na seleção: só este vídeo pode ser removido
+        self.video = video
+        self.turma_id = turma_id
+        self.turma = turma
+        self.data = data
+        self.upload = upload
+        self.acesso = acesso or upload
+        self.bytes = tamanho + processados
+        self.motivo = None
+
+    def chave_lru(self):
+        # Nunca acessado e sem data de upload: primeiro da fila
+        return (self.acesso is not None, self.acesso or timezone.now(), self.aula_id)
+
+
+def _videos():
+    return [
+        _Video(*linha)
+        for linha in Aula.objects.filter(video__gt='').values_list(
+            'pk', 'video', 'turma_id', 'turma__nome', 'data', 'data_upload_video', 'video_ultima_visualizacao',
+            'video_tamanho', 'video_tamanho_processados',
+        ).iterator()
+    ]
+
+
+def selecionar(politica, agora=None):
+    """Vídeos a remover, cada um com o `motivo` (política que o escolheu)"""
+    agora = agora or timezone.now()
+    todos = _videos()
+
+    protegidos = set()
+    if politica.get('manter_recentes'):
+        por_turma = {}
+        for video in todos:
+            por_turma.setdefault(video.turma_id, []).append(video)
+        for videos in por_turma.values():
+            videos.sort(key=lambda video: (video.data, video.aula_id), reverse=True)
+            protegidos.update(video.aula_id for video in videos[:politica['manter_recentes']])
+    candidatos = sorted((video for video in todos if video.aula_id not in protegidos), key=_Video.chave_lru)
+
+    def remover(video, motivo):
+        if video.motivo is None:
+            video.motivo = motivo
+
+    if politica.get('dias') is not None:
+        limite = agora - timedelta(days=politica['dias'])
+        for video in candidatos:
+            if video.upload is not None and video.upload < limite:
+                remover(video, 'idade')
+
+    if politica.get('cota_turma_mb') is not None:
+        cota = politica['cota_turma_mb'] * MB
+        uso = {}
+        for video in todos:
+            if video.motivo is None:
+                uso[video.turma_id] = uso.get(video.turma_id, 0) + video.bytes
+        for video in candidatos:
+            if video.motivo is None and uso[video.turma_id] > cota:
+                remover(video, 'cota_turma')
+                uso[video.turma_id] -= video.bytes
+
+    if politica.get('orcamento_mb') is not None:
+        orcamento = politica['orcamento_mb'] * MB
+        uso = sum(video.bytes for video in todos if video.motivo is None)
+        for video in candidatos:
+            if uso <= orcamento:
+                break
+            if video.motivo is None:
+                remover(video, 'orcamento')
+                uso -= video.bytes
+
+    return [video for video in candidatos if video.motivo is not None]
+
+
+# ---------------------------------------------------------
+# APLICAÇÃO
+# ---------------------------------------------------------
+
+def _apagar_arquivo(nome):
+    try:
+        default_storage.delete(nome)
+        return None
+    except OSError as e:
+        return f'{nome}: {e}'
+
+
+def _limpar_lote(lote):
+    """
+    Limpa os campos de vídeo das aulas do lote que ainda têm o vídeo da
+    seleção. Retorna (aula_ids limpos, arquivos a apagar); uma aula que
+    recebeu outro vídeo depois da seleção fica de fora.
+    """
+    mesmo_video = Q(*[Q(pk=video.aula_id, video=video.video) for video in lote], _connector=Q.OR)
+    with transaction.atomic():
+        linhas = list(
+            Aula.objects.select_for_update().filter(mesmo_video).values_list('pk', 'video', 'video_poster')
+        )
+        aula_ids = [pk for pk, _, _ in linhas]
+        if not aula_ids:
+            return set(), []
+        versoes = VersaoVideo.objects.filter(aula_id__in=aula_ids)
+        arquivos = [nome for _, video, poster in linhas for nome in (video, poster) if nome]
+        arquivos += list(versoes.values_list('arquivo', flat=True))
+        Aula.objects.filter(mesmo_video).update(
+            video=None, video_poster=None, video_status='', video_erro='', video_proxima_tentativa=None,
+            video_tamanho=0, video_checksum='', video_tamanho_processados=0,
+        )
+        # Os arquivos vão para o pool; o sinal de VersaoVideo não apaga um por um
+        versoes.apagar_arquivos = False
+        versoes.delete()
+    return set(aula_ids), arquivos
+
+
+def aplicar(selecionados, workers=4, simular=False):
+    """Remove os vídeos selecionados e devolve o relatório"""
+    relatorio = {
+        'simulacao': simular,
+        'videos_removidos': 0,
+        'bytes_liberados': 0,
+        'por_politica': {},
+        'por_turma': {},
+        'erros': [],
+        'ignorados': [],
+        'aulas': [],
+    }
+    removidos = selecionados
+    if not simular and selecionados:
+        removidos = []
+        with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='retencao') as pool:
+            for inicio in range(0, len(selecionados), TAMANHO_LOTE):
+                lote = selecionados[inicio:inicio + TAMANHO_LOTE]
+                limpos, arquivos = _limpar_lote(lote)
+                for video in lote:
+                    if video.aula_id in limpos:
+                        removidos.append(video)
+                    else:
+                        # Vídeo trocado (ou removido) depois da seleção: fica como está
+                        relatorio['ignorados'].append(video.aula_id)
+                relatorio['erros'].extend(erro for erro in pool.map(_apagar_arquivo, arquivos) if erro)
+        for erro in relatorio['erros']:
+            logger.warning('Retenção de vídeos: não foi possível apagar %s', erro)
+        # update() não dispara os sinais do painel
+        painel_cache.invalidar_todos()
+
+    for video in removidos:
+        relatorio['videos_removidos'] += 1
+        relatorio['bytes_liberados'] += video.bytes
+        for grupo, chave in (('por_politica', video.motivo), ('por_turma', video.turma)):
+            soma = relatorio[grupo].setdefault(chave, {'videos': 0, 'bytes': 0})
+            soma['videos'] += 1
+            soma['bytes'] += video.bytes
+        relatorio['aulas'].append({
+            'aula_id': video.aula_id, 'turma': video.turma, 'data': video.data.isoformat(),
+            'motivo': video.motivo, 'bytes': video.bytes,
+        })
+    return relatorio
+
+
+def executar(politica=None, workers=4, simular=False, agora=None):
+    agora = agora or timezone.now()
+    politica = politica or politica_configurada()
+    # Vídeo sem tamanho medido conta como 0 bytes nas políticas de espaço
+    sem_tamanho = Aula.objects.filter(video__gt='', video_tamanho=0).count()
+    if sem_tamanho and (politica.get('cota_turma_mb') is not None or politica.get('orcamento_mb') is not None):
+        logger.warning(
+            'Retenção de vídeos: %s vídeo(s) sem tamanho medido contam como 0 bytes; '
+            'rode reconciliar_videos --corrigir', sem_tamanho,
+        )
+    relatorio = aplicar(selecionar(politica, agora), workers=workers, simular=simular)
+    return {'executado_em': agora.isoformat(), 'politica': politica, 'sem_tamanho': sem_tamanho, **relatorio}
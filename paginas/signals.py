@@ -0,0 +1,321 @@
+"""
+Sinais do app paginas.
+
+Mantêm o cache do painel do aluno (paginas.painel_cache) coerente com o
+banco: cada alteração invalida apenas os alunos afetados por ela. Também
+registram as exclusões e alterações indiretas usadas pela sincronização
+incremental das APIs de exportação, marcam os meses cujo resultado
+financeiro precisa ser recalculado, mantêm o resumo mensal de frequência
+a grade semanal compilada (paginas.grade) e a versão dos feeds iCal,
+colocam vídeos novos na fila de processamento (paginas.videos) e
+descartam preferências de pagamento que deixaram de valer.
+"""
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import financeiro, frequencias, grade, ical, painel_cache, videos
+from .models import (
+    Aluno, Aula, Aviso, Frequencia, HorarioAula, Mensagem, Mensalidade, Turma,
+    RegistroExcluido, Evento, PreferenciaPagamento, VersaoVideo,
+)
+
+
+def _usuarios_da_turma(turma_id):
+    return Aluno.objects.filter(turmas=turma_id).values_list('usuario_id', flat=True)
+
+
+def _usuario_do_aluno(aluno_id):
+    return Aluno.objects.filter(pk=aluno_id).values_list('usuario_id', flat=True)
+
+
+@receiver(post_save, sender=Aviso)
+@receiver(post_delete, sender=Aviso)
+def invalidar_painel_aviso(sender, instance, **kwargs):
+    if instance.aluno_id:
+        painel_cache.invalidar_usuarios(_usuario_do_aluno(instance.aluno_id))
+    elif instance.turma_id:
+        painel_cache.invalidar_usuarios(_usuarios_da_turma(instance.turma_id))
+    else:
+        # Aviso geral: aparece para todos os alunos
+        painel_cache.invalidar_todos()
+
+
+@receiver(post_save, sender=Aula)
+@receiver(post_delete, sender=Aula)
+@receiver(post_save, sender=HorarioAula)
+@receiver(post_delete, sender=HorarioAula)
+def invalidar_painel_turma(sender, instance, **kwargs):
+    painel_cache.invalidar_usuarios(_usuarios_da_turma(instance.turma_id))
+
+
+@receiver(post_save, sender=Turma)
+@receiver(post_delete, sender=Turma)
+def invalidar_painel_turma_alterada(sender, instance, **kwargs):
+    painel_cache.invalidar_usuarios(_usuarios_da_turma(instance.pk))
+
+
+@receiver(post_save, sender=Frequencia)
+@receiver(post_delete, sender=Frequencia)
+@receiver(post_save, sender=Mensalidade)
+@receiver(post_delete, sender=Mensalidade)
+def invalidar_painel_aluno(sender, instance, **kwargs):
+    painel_cache.invalidar_usuarios(_usuario_do_aluno(instance.aluno_id))
+
+
+@receiver(post_save, sender=Mensagem)
+@receiver(post_delete, sender=Mensagem)
+def invalidar_painel_mensagem(sender, instance, **kwargs):
+    painel_cache.invalidar_usuarios([instance.destinatario_id])
+
+
+@receiver(post_save, sender=Aluno)
+@receiver(post_delete, sender=Aluno)
+def invalidar_painel_cadastro_aluno(sender, instance, **kwargs):
+    painel_cache.invalidar_usuarios([instance.usuario_id])
+
+
+@receiver(post_save, sender=User)
+def invalidar_painel_usuario(sender, instance, created, update_fields=None, **kwargs):
+    # O painel mostra o nome do User; o login só grava last_login
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    painel_cache.invalidar_usuarios([instance.pk])
+
+
+@receiver(m2m_changed, sender=Aluno.turmas.through)
+def invalidar_painel_matricula(sender, instance, action, reverse, pk_set, **kwargs):
+    # pre_clear: depois do clear não há mais como saber quem estava matriculado
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        # instance é a Turma; pk_set são alunos (None no clear)
+        painel_cache.invalidar_usuarios(_usuarios_da_turma(instance.pk))
+        if pk_set:
+            painel_cache.invalidar_usuarios(
+                Aluno.objects.filter(pk__in=pk_set).values_list('usuario_id', flat=True)
+            )
+    else:
+        painel_cache.invalidar_usuarios([instance.usuario_id])
+
+
+# ==================== SINCRONIZAÇÃO INCREMENTAL ====================
+
+@receiver(post_delete, sender=Aluno)
+def registrar_exclusao_aluno(sender, instance, **kwargs):
+    RegistroExcluido.objects.create(modelo='ALUNO', objeto_id=instance.pk)
+
+
+@receiver(post_delete, sender=Mensalidade)
+def registrar_exclusao_mensalidade(sender, instance, **kwargs):
+    RegistroExcluido.objects.create(modelo='MENSALIDADE', objeto_id=instance.pk)
+
+
+@receiver(m2m_changed, sender=Aluno.turmas.through)
+def atualizar_aluno_matricula(sender, instance, action, reverse, pk_set, **kwargs):
+    """As turmas fazem parte da exportação do aluno, então marcam o aluno como alterado"""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        alunos = Aluno.objects.filter(turmas=instance) if pk_set is None else Aluno.objects.filter(pk__in=pk_set)
+    else:
+        alunos = Aluno.objects.filter(pk=instance.pk)
+    alunos.update(data_atualizacao=timezone.now())
+
+
+@receiver(post_save, sender=User)
+def atualizar_aluno_usuario(sender, instance, created, update_fields=None, **kwargs):
+    """O nome do aluno vem do User; alterações nele precisam aparecer na sincronização"""
+    if created:
+        return
+    # Ex.: login só atualiza last_login
+    if update_fields and not {'first_name', 'last_name'} & set(update_fields):
+        return
+    Aluno.objects.filter(usuario=instance).update(data_atualizacao=timezone.now())
+
+
+# ==================== GRADE SEMANAL ====================
+
+@receiver(post_init, sender=HorarioAula)
+def _guardar_turma_do_horario(sender, instance, **kwargs):
+    instance._turma_grade = instance.__dict__.get('turma_id')
+
+
+@receiver(post_save, sender=HorarioAula)
+@receiver(post_delete, sender=HorarioAula)
+def invalidar_grade_horario(sender, instance, **kwargs):
+    # Horário movido de turma: as duas grades mudam
+    turmas = {instance.turma_id, getattr(instance, '_turma_grade', None)}
+    grade.invalidar_turmas(turmas)
+    ical.invalidar_turmas(turmas)
+    instance._turma_grade = instance.turma_id
+
+
+@receiver(post_save, sender=Turma)
+@receiver(post_delete, sender=Turma)
+def invalidar_grade_turma(sender, instance, **kwargs):
+    """Nome, modalidade e professor fazem parte da grade compilada e do feed iCal"""
+    grade.invalidar_turmas([instance.pk])
+    # Um save() seguinte da mesma instância não pode regravar a versão antiga
+    instance.agenda_atualizada_em = ical.invalidar_turmas([instance.pk])
+
+
+@receiver(post_save, sender=User)
+def invalidar_grade_professor(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields and not {'first_name', 'last_name', 'username'} & set(update_fields)):
+        return
+    turmas = list(Turma.objects.filter(professor=instance).values_list('pk', flat=True))
+    grade.invalidar_turmas(turmas)
+    ical.invalidar_turmas(turmas)
+
+
+@receiver(post_init, sender=Aula)
+def _guardar_turma_da_aula(sender, instance, **kwargs):
+    instance._turma_ical = instance.__dict__.get('turma_id')
+
+
+@receiver(post_save, sender=Aula)
+@receiver(post_delete, sender=Aula)
+def invalidar_feed_aula(sender, instance, **kwargs):
+    ical.invalidar_turmas({instance.turma_id, getattr(instance, '_turma_ical', None)})
+    instance._turma_ical = instance.turma_id
+
+
+# ==================== RESULTADO FINANCEIRO MENSAL ====================
+
+MODELOS_FINANCEIROS = tuple(financeiro.CAMPOS_DE_DATA)
+
+
+def _guardar_meses_originais(sender, instance, **kwargs):
+    # Se a data mudar, o mês antigo também precisa ser recalculado
+    instance._meses_financeiros = financeiro.meses_do_registro(instance)
+
+
+def _marcar_meses_financeiros(sender, instance, **kwargs):
+    meses = financeiro.meses_do_registro(instance) | getattr(instance, '_meses_financeiros', set())
+    financeiro.marcar_meses(meses)
+    instance._meses_financeiros = financeiro.meses_do_registro(instance)
+
+
+for _modelo in MODELOS_FINANCEIROS:
+    post_init.connect(_guardar_meses_originais, sender=_modelo, dispatch_uid=f'meses_originais_{_modelo.__name__}')
+    post_save.connect(_marcar_meses_financeiros, sender=_modelo, dispatch_uid=f'marcar_meses_save_{_modelo.__name__}')
+    post_delete.connect(_marcar_meses_financeiros, sender=_modelo, dispatch_uid=f'marcar_meses_delete_{_modelo.__name__}')
+
+
+@receiver(post_save, sender=Evento)
+def marcar_meses_evento(sender, instance, created, **kwargs):
+    """O valor do ingresso entra na receita de todas as vendas do evento"""
+    if not created:
+        financeiro.marcar_meses(instance.vendas.filter(confirmado=True).dates('data_venda', 'month'))
+
+
+# ==================== PREFERÊNCIAS DE PAGAMENTO ====================
+
+@receiver(post_save, sender=Mensalidade)
+def invalidar_preferencias_pagamento(sender, instance, created, **kwargs):
+    """Paga/cancelada: nenhuma preferência vale mais; valor alterado: só a do valor atual"""
+    if created:
+        return
+    preferencias = PreferenciaPagamento.objects.filter(mensalidade=instance)
+    if instance.status not in ('PAGO', 'CANCELADO'):
+        preferencias = preferencias.exclude(valor=instance.valor_final)
+    preferencias.delete()
+
+
+# ==================== RESUMO MENSAL DE FREQUÊNCIA ====================
+
+@receiver(post_init, sender=Frequencia)
+def _guardar_frequencia_original(sender, instance, **kwargs):
+    # Se aluno ou aula mudarem, o resumo antigo também precisa ser recalculado
+    instance._chave_resumo = (instance.__dict__.get('aluno_id'), instance.__dict__.get('aula_id'))
+
+
+@receiver(post_save, sender=Frequencia)
+@receiver(post_delete, sender=Frequencia)
+def atualizar_resumo_frequencia(sender, instance, **kwargs):
+    origem = kwargs.get('origin')
+    if origem is not None and getattr(origem, 'model', type(origem)) is not Frequencia:
+        # Exclusão em cascata (aula, turma, aluno): tratada pelos sinais de Aula
+        # ou pelo CASCADE do próprio resumo
+        return
+    frequencias.atualizar_resumos_das_aulas({
+        (instance.aluno_id, instance.aula_id), getattr(instance, '_chave_resumo', (None, None)),
+    })
+    instance._chave_resumo = (instance.aluno_id, instance.aula_id)
+
+
+@receiver(post_init, sender=Aula)
+def _guardar_data_aula(sender, instance, **kwargs):
+    instance._data_resumo = instance.__dict__.get('data')
+
+
+@receiver(post_save, sender=Aula)
+def atualizar_resumo_aula_remarcada(sender, instance, created, **kwargs):
+    """Aula mudou de mês: as frequências dela saem de um resumo e entram em outro"""
+    anterior = getattr(instance, '_data_resumo', None)
+    instance._data_resumo = instance.data
+    if created or not anterior or anterior.replace(day=1) == instance.data.replace(day=1):
+        return
+    alunos = list(Frequencia.objects.filter(aula=instance).values_list('aluno_id', flat=True))
+    frequencias.atualizar_resumos(
+        [(aluno_id, anterior) for aluno_id in alunos] + [(aluno_id, instance.data) for aluno_id in alunos]
+    )
+
+
+@receiver(pre_delete, sender=Aula)
+def _guardar_alunos_da_aula(sender, instance, **kwargs):
+    instance._alunos_resumo = list(Frequencia.objects.filter(aula=instance).values_list('aluno_id', flat=True))
+
+
+@receiver(post_delete, sender=Aula)
+def atualizar_resumo_aula_excluida(sender, instance, **kwargs):
+    frequencias.atualizar_resumos(
+        (aluno_id, instance.data) for aluno_id in getattr(instance, '_alunos_resumo', ())
+    )
+
+
+# ==================== PROCESSAMENTO DE VÍDEOS ====================
+
+def _nome_do_video(valor):
+    return getattr(valor, 'name', valor) or ''
+
+
+@receiver(post_init, sender=Aula)
+def _guardar_video_original(sender, instance, **kwargs):
+    instance._video_original = _nome_do_video(instance.__dict__.get('video'))
+
+
+@receiver(post_save, sender=Aula)
+def enfileirar_video_novo(sender, instance, **kwargs):
+    """Vídeo novo vai para a fila; vídeo removido leva junto as versões geradas"""
+    atual = _nome_do_video(instance.video)
+    if atual == getattr(instance, '_video_original', ''):
+        return
+    instance._video_original = atual
+    if atual:
+        videos.enfileirar([instance.pk])
+        return
+    videos.apagar_processados(instance.pk)
+    if instance.video_poster:
+        instance.video_poster.delete(save=False)
+    Aula.objects.filter(pk=instance.pk).update(
+        video_status='', video_poster=None, video_erro='', video_proxima_tentativa=None, video_tamanho_processados=0
+    )
+
+
+@receiver(post_delete, sender=Aula)
+def apagar_poster_da_aula(sender, instance, **kwargs):
+    if instance.video_poster:
+        instance.video_poster.delete(save=False)
+
+
+@receiver(post_delete, sender=VersaoVideo)
+def apagar_arquivo_da_versao(sender, instance, origin=None, **kwargs):
+    # Também cobre a exclusão em cascata da aula. A retenção (paginas.retencao)
+    # marca o queryset com apagar_arquivos=False e apaga os arquivos em paralelo.
+    if not getattr(origin, 'apagar_arquivos', True):
+        return
+    if instance.arquivo:
+        instance.arquivo.delete(save=False)
@@ -0,0 +1,171 @@
+"""
+Entrega dos vídeos das aulas com controle de acesso e Range (206).
+
+Os vídeos eram servidos direto de MEDIA_ROOT: qualquer um com a URL
+baixava, e avançar o vídeo no celular podia baixar o arquivo inteiro.
+A view video_aula (paginas/views.py) confere se o usuário pode ver a aula
+e responde aqui, de um destes modos (setting VIDEO_ENTREGA):
+
+    'django'      o próprio Django envia o arquivo. Sem Range vai o
+                  FileResponse com o arquivo aberto (o servidor WSGI usa
+                  wsgi.file_wrapper/sendfile); com Range, só o trecho
+                  pedido é lido, em blocos de BLOCO bytes.
+    'x-accel'     resposta vazia com X-Accel-Redirect para a location
+                  interna do nginx (VIDEO_X_ACCEL_PREFIXO + caminho do
+                  arquivo); o nginx faz o Range e o sendfile.
+    'x-sendfile'  o mesmo com X-Sendfile e o caminho absoluto (Apache
+                  mod_xsendfile, lighttpd).
+
+MEDIA_ROOT/aulas/ (originais e versões) e MEDIA_ROOT/uploads_parciais/
+nunca são públicos: a rota de mídia do DEBUG (giro_dance/urls.py) os
+ignora e, em produção, o proxy não pode servi-los pelo MEDIA_URL. No
+nginx a árvore fica só atrás de uma location `internal`:
+
+    location /media/aulas/            { return 404; }
+    location /media/uploads_parciais/ { return 404; }
+    location /protegido/ {
+        internal;
+        alias /caminho/para/media/;
+    }
+
+Só um intervalo por requisição: os players pedem "bytes=inicio-" e
+multipart/byteranges não vale o custo aqui.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+BLOCO = 512 * 1024
+MODOS = ('django', 'x-accel', 'x-sendfile')
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeInvalido(Exception):
+    """Intervalo fora do arquivo: vira 416"""
+
+
+def _modo():
+    modo = getattr(settings, 'VIDEO_ENTREGA', 'django')
+    if modo not in MODOS:
+        raise ValueError(f'VIDEO_ENTREGA deve ser um de {MODOS}, não {modo!r}')
+    return modo
+
+
+def interpretar_range(cabecalho, tamanho):
+    """
+    (inicio, fim) inclusivos do cabeçalho Range, ou None para enviar o
+    arquivo inteiro (sem Range, formato desconhecido ou vários intervalos).
+    """
+    if not cabecalho:
+        return None
+    combinacao = _RANGE.match(cabecalho.strip())
+    if not combinacao:
+        return None
+    inicio, fim = combinacao.groups()
+    if not inicio and not fim:
+        return None
+    if not inicio:
+        # bytes=-N: os últimos N bytes
+        sufixo = int(fim)
+        if sufixo == 0:
+            raise RangeInvalido
+        return max(tamanho - sufixo, 0), tamanho - 1
+    inicio = int(inicio)
+    fim = min(int(fim), tamanho - 1) if fim else tamanho - 1
+    if inicio >= tamanho or fim < inicio:
+        raise RangeInvalido
+    return inicio, fim
+
+
+def etag_arquivo(estado):
+    return quote_etag(f'{int(estado.st_mtime):x}-{estado.st_size:x}')
+
+
+def _range_vale(request, etag, modificado):
+    """If-Range: o Range só vale se o cliente ainda tem esta versão do arquivo"""
+    condicao = request.META.get('HTTP_IF_RANGE')
+    if not condicao:
+        return True
+    if condicao.startswith('"') or condicao.startswith('W/'):
+        return condicao == etag
+    data = parse_http_date_safe(condicao)
+    return data is not None and int(modificado) <= data
+
+
+def _trecho(arquivo, inicio, tamanho):
+    try:
+        arquivo.seek(inicio)
+        while tamanho > 0:
+            dados = arquivo.read(min(BLOCO, tamanho))
+            if not dados:
+                break
+            tamanho -= len(dados)
+            yield dados
+    finally:
+        arquivo.close()
+
+
+def resposta_arquivo(request, caminho, nome_relativo, download=False):
+    """
+    Resposta para o arquivo `caminho` (absoluto, em MEDIA_ROOT) segundo
+    VIDEO_ENTREGA. `nome_relativo` é o nome no storage, usado no X-Accel-Redirect.
+    """
+    try:
+        estado = os.stat(caminho)
+    except OSError:
+        return HttpResponse(status=404)
+
+    etag = etag_arquivo(estado)
+    content_type = mimetypes.guess_type(caminho)[0] or 'application/octet-stream'
+    modo = _modo()
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(estado.st_mtime))
+    if response is None:
+        if modo == 'x-accel':
+            response = HttpResponse(content_type=content_type)
+            prefixo = getattr(settings, 'VIDEO_X_ACCEL_PREFIXO', '/protegido/').rstrip('/')
+            response['X-Accel-Redirect'] = f'{prefixo}/{quote(nome_relativo)}'
+        elif modo == 'x-sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = caminho
+        else:
+            response = _resposta_django(request, caminho, estado, etag, content_type)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(estado.st_mtime)
+    if modo == 'django':
+        response['Accept-Ranges'] = 'bytes'
+    if download:
+        response['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(os.path.basename(caminho))}"
+    # Conteúdo por usuário: nada de cache compartilhado
+    patch_cache_control(response, private=True, max_age=3600)
+    return response
+
+
+def _resposta_django(request, caminho, estado, etag, content_type):
+    tamanho = estado.st_size
+    intervalo = None
+    if _range_vale(request, etag, estado.st_mtime):
+        try:
+            intervalo = interpretar_range(request.META.get('HTTP_RANGE'), tamanho)
+        except RangeInvalido:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{tamanho}'
+            return response
+
+    if intervalo is None:
+        # Arquivo inteiro: o FileResponse deixa o servidor usar sendfile
+        return FileResponse(open(caminho, 'rb'), content_type=content_type)
+
+    inicio, fim = intervalo
+    arquivo = open(caminho, 'rb')
+    response = FileResponse(_trecho(arquivo, inicio, fim - inicio + 1), status=206, content_type=content_type)
+    response['Content-Length'] = str(fim - inicio + 1)
+    response['Content-Range'] = f'bytes {inicio}-{fim}/{tamanho}'
+    return response
@@ -1,3 +1,1494 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from datetime import date, time, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from giro_dance import urls as urls_do_projeto
+
+from . import api_views, armazenamento, grade, ical, painel_cache, retencao, videos
+from .dashboard import dados_painel_aluno
+from . import financeiro
+from .financeiro import serie_receita
+from .cronograma import gerar_aulas
+from .frequencias import recalcular_todos_resumos, registrar_frequencias
+from .mensalidades import gerar_mensalidades_do_mes, transicionar_mensalidades_vencidas
+from .gateway_mp import (
+    ClienteMercadoPago, Disjuntor, GatewayIndisponivel, MercadoPagoFake, configurar_cliente, metricas,
+)
+from .pagamentos import ErroGateway, preferencia_da_mensalidade, processar_eventos_pendentes
+from .models import (
+    Aluno, Aula, Aviso, DespesaAdministrativa, DiaSemAula, Evento, EventoWebhook, Frequencia, HorarioAula,
+    Mensagem, Mensalidade,
+    MesFinanceiroPendente, Notificacao, PreferenciaPagamento, ResultadoFinanceiroMensal, ResumoFrequenciaMensal,
+    Turma, UploadVideo, VendaIngresso, VersaoVideo,
+)
+from .paginacao import paginar_keyset
+
+
+class PainelAlunoTestCase(TestCase):
+    """Base com um aluno matriculado em uma turma ativa"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('aluno', password='senha123', first_name='Ana')
+        cls.professor = User.objects.create_user('professor', password='senha123')
+        cls.turma = Turma.objects.create(
+            nome='Ballet Iniciante', modalidade='BALLET', nivel='INICIANTE', professor=cls.professor
+        )
+        cls.aluno = Aluno.objects.create(
+            usuario=cls.usuario, cpf='000.000.000-00', data_nascimento=date(2000, 1, 1),
+            telefone='0', telefone_emergencia='0', endereco='Rua A'
+        )
+        cls.aluno.turmas.add(cls.turma)
+
+    def setUp(self):
+        cache.clear()
+
+
+class DashboardAlunoTests(PainelAlunoTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        hoje = timezone.now().date()
+        status = ['PRESENTE', 'PRESENTE', 'PRESENTE', 'FALTA', 'ATESTADO']
+        for dias, st in enumerate(status, start=1):
+            aula = Aula.objects.create(
+                turma=cls.turma, data=hoje - timedelta(days=dias),
+                hora_inicio=time(18, 0), hora_fim=time(19, 0), realizada=True
+            )
+            Frequencia.objects.create(aluno=cls.aluno, aula=aula, status=st)
+        Aula.objects.create(turma=cls.turma, data=hoje + timedelta(days=2), hora_inicio=time(18, 0), hora_fim=time(19, 0))
+        Aviso.objects.create(titulo='Geral', conteudo='...', tipo='GERAL')
+        Aviso.objects.create(titulo='Turma', conteudo='...', tipo='TURMA', turma=cls.turma)
+        Mensalidade.objects.create(
+            aluno=cls.aluno, mes_referencia=hoje.replace(day=1), valor=Decimal('150.00'),
+            valor_final=Decimal('150.00'), data_vencimento=hoje + timedelta(days=5)
+        )
+        Mensagem.objects.create(remetente=cls.professor, destinatario=cls.usuario, conteudo='Oi')
+        Mensagem.objects.create(remetente=cls.professor, destinatario=cls.usuario, conteudo='Lida', lida=True)
+
+    def test_estatisticas(self):
+        dados = dados_painel_aluno(self.usuario)
+        self.assertEqual(dados['total_aulas'], 5)
+        self.assertEqual(dados['presencas'], 3)
+        self.assertEqual(dados['faltas'], 1)
+        self.assertEqual(dados['percentual_presenca'], 60.0)
+        self.assertEqual(dados['mensagens_nao_lidas'], 1)
+        self.assertEqual(len(dados['avisos_recentes']), 2)
+        self.assertEqual(len(dados['proximas_aulas']), 1)
+        self.assertEqual(len(dados['mensalidades_pendentes']), 1)
+
+    def test_numero_de_consultas(self):
+        # Regressão: aluno+estatísticas, avisos, próximas aulas e mensalidades
+        with self.assertNumQueries(4):
+            dados_painel_aluno(self.usuario)
+
+    def test_view_painel(self):
+        self.client.force_login(self.usuario)
+        response = self.client.get(reverse('paginas:painel_index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('erro', response.context)
+        self.assertEqual(response.context['presencas'], 3)
+
+
+class PainelCacheTests(PainelAlunoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.usuario)
+
+    def test_visita_repetida_nao_consulta_o_orm(self):
+        dados = lambda: dados_painel_aluno(self.usuario)
+        painel_cache.obter_contexto('index', self.usuario, dados)
+        with self.assertNumQueries(0):
+            painel_cache.obter_contexto('index', self.usuario, dados)
+        self.assertEqual(painel_cache.estatisticas()['hits'], 1)
+        self.assertEqual(painel_cache.estatisticas()['misses'], 1)
+
+    def test_invalidacao_por_frequencia(self):
+        url = reverse('paginas:painel_index')
+        self.assertEqual(self.client.get(url).context['total_aulas'], 0)
+        aula = Aula.objects.create(
+            turma=self.turma, data=date(2025, 1, 6), hora_inicio=time(18, 0), hora_fim=time(19, 0)
+        )
+        Frequencia.objects.create(aluno=self.aluno, aula=aula, status='PRESENTE')
+        self.assertEqual(self.client.get(url).context['total_aulas'], 1)
+
+    def test_invalidacao_por_aviso_geral(self):
+        url = reverse('paginas:painel_index')
+        self.assertEqual(self.client.get(url).context['avisos_recentes'], [])
+        Aviso.objects.create(titulo='Recesso', conteudo='...', tipo='GERAL')
+        self.assertEqual(len(self.client.get(url).context['avisos_recentes']), 1)
+
+    def test_contadores_so_zeram_por_post(self):
+        painel_cache.obter_contexto('index', self.usuario, lambda: {'aluno': 'cache'})
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@x.com', 'senha123'))
+        url = reverse('admin:paginas_aluno_changelist')
+        self.assertContains(self.client.get(url), 'name="zerar_cache_painel"')
+        self.client.get(url, {'zerar_cache_painel': '1'})
+        self.assertEqual(painel_cache.estatisticas()['misses'], 1)
+
+        self.assertRedirects(self.client.post(url, {'zerar_cache_painel': '1'}), url)
+        self.assertEqual(painel_cache.estatisticas()['total'], 0)
+
+    def test_invalidacao_por_cadastro_e_usuario(self):
+        painel_cache.obter_contexto('index', self.usuario, lambda: {'aluno': 'cache'})
+        self.aluno.telefone = '9999'
+        self.aluno.save()
+        self.assertEqual(
+            painel_cache.obter_contexto('index', self.usuario, lambda: {'aluno': 'telefone'}), {'aluno': 'telefone'}
+        )
+
+        # Login não invalida; mudar o nome sim
+        self.usuario.last_login = timezone.now()
+        self.usuario.save(update_fields=['last_login'])
+        self.assertEqual(
+            painel_cache.obter_contexto('index', self.usuario, lambda: {'aluno': 'login'}), {'aluno': 'telefone'}
+        )
+        self.usuario.first_name = 'Renomeada'
+        self.usuario.save()
+        self.assertEqual(
+            painel_cache.obter_contexto('index', self.usuario, lambda: {'aluno': 'nome'}), {'aluno': 'nome'}
+        )
+
+    def test_outro_aluno_nao_e_invalidado(self):
+        outro = User.objects.create_user('outro')
+        painel_cache.obter_contexto('index', self.usuario, lambda: {'aluno': 'cache'})
+        Mensagem.objects.create(remetente=self.usuario, destinatario=outro, conteudo='Oi')
+        self.assertEqual(
+            painel_cache.obter_contexto('index', self.usuario, lambda: {'aluno': 'novo'}),
+            {'aluno': 'cache'}
+        )
+
+
+@mock.patch.object(api_views, 'API_TOKEN', 'token-teste')
+class ExportacaoStreamingTests(PainelAlunoTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(1, 4):
+            usuario = User.objects.create_user(f'aluno{i}')
+            aluno = Aluno.objects.create(
+                usuario=usuario, cpf=f'111.111.111-0{i}', data_nascimento=date(2001, 1, 1),
+                telefone='0', telefone_emergencia='0', endereco='Rua B'
+            )
+            aluno.turmas.add(cls.turma)
+            Mensalidade.objects.create(
+                aluno=aluno, mes_referencia=date(2025, 1, 1), valor=Decimal('100.00'),
+                valor_final=Decimal('100.00'), data_vencimento=date(2025, 1, 10)
+            )
+
+    def _conteudo(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_token_obrigatorio(self):
+        response = self.client.get('/api/exportar-alunos/', {'token': 'errado'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_alunos_array_json_sem_n_mais_1(self):
+        response = self.client.get('/api/exportar-alunos/', {'token': 'token-teste'})
+        # alunos + usuários (JOIN) e uma consulta de turmas por bloco do iterator
+        with self.assertNumQueries(2):
+            dados = json.loads(self._conteudo(response))
+        self.assertEqual(len(dados), 4)
+        self.assertEqual(dados[0]['turmas'], ['Ballet Iniciante'])
+
+    def test_mensalidades_json_lines(self):
+        response = self.client.get('/api/exportar-mensalidades/', {'token': 'token-teste', 'formato': 'jsonl'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        linhas = [json.loads(linha) for linha in self._conteudo(response).splitlines()]
+        self.assertEqual(len(linhas), 3)
+        self.assertEqual(linhas[0]['status'], 'ATRASADO')
+        self.assertGreater(linhas[0]['dias_em_atraso'], 0)
+
+    def test_sincronizacao_incremental_por_cursor(self):
+        url = '/api/exportar-mensalidades/'
+        primeira = self.client.get(url, {'token': 'token-teste', 'updated_since': '2000-01-01T00:00:00', 'limit': 2}).json()
+        self.assertEqual(len(primeira['dados']), 2)
+        self.assertTrue(primeira['tem_mais'])
+
+        segunda = self.client.get(url, {'token': 'token-teste', 'cursor': primeira['proximo_cursor'], 'limit': 2}).json()
+        self.assertEqual(len(segunda['dados']), 1)
+        self.assertFalse(segunda['tem_mais'])
+
+        # Sem alterações: página vazia e o mesmo cursor
+        vazia = self.client.get(url, {'token': 'token-teste', 'cursor': segunda['proximo_cursor']}).json()
+        self.assertEqual(vazia['dados'], [])
+        self.assertEqual(vazia['proximo_cursor'], segunda['proximo_cursor'])
+
+        # Alteração e exclusão aparecem na próxima sincronização
+        alterada, excluida = Mensalidade.objects.order_by('id')[:2]
+        alterada.observacoes = 'Negociada'
+        alterada.save()
+        excluida_id = excluida.id
+        excluida.delete()
+        delta = self.client.get(url, {'token': 'token-teste', 'cursor': segunda['proximo_cursor']}).json()
+        self.assertEqual([d['id'] for d in delta['dados']], [alterada.id])
+        self.assertEqual(delta['excluidos'], [excluida_id])
+
+    def test_cursor_invalido(self):
+        response = self.client.get('/api/exportar-alunos/', {'token': 'token-teste', 'cursor': 'xyz'})
+        self.assertEqual(response.status_code, 400)
+
+
+class PaginacaoKeysetTests(PainelAlunoTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Datas repetidas e um aviso importante para exercitar o desempate por id
+        for i in range(7):
+            Aviso.objects.create(titulo=f'Aviso {i}', conteudo='...', tipo='GERAL', importante=(i == 3))
+
+    def _percorrer(self, por_pagina):
+        fabrica = RequestFactory()
+        qs = Aviso.objects.filter(ativo=True)
+        ordenacao = ['-importante', '-data_criacao', '-id']
+        ids, params = [], {'filtro': 'x'}
+        while True:
+            pagina = paginar_keyset(fabrica.get('/avisos/', params), qs, ordenacao, por_pagina=por_pagina)
+            ids.extend(a.id for a in pagina)
+            if not pagina.tem_proxima:
+                return ids
+            self.assertIn('filtro=x', pagina.url_proxima)
+            params = {'filtro': 'x', 'cursor': pagina.proximo_cursor}
+
+    def test_percorre_todas_as_paginas_sem_repetir(self):
+        esperado = list(Aviso.objects.order_by('-importante', '-data_criacao', '-id').values_list('id', flat=True))
+        self.assertEqual(self._percorrer(por_pagina=3), esperado)
+
+    def test_datas_nulas_ficam_no_fim(self):
+        for dia in [None, 5, None, 5, 1]:
+            DespesaAdministrativa.objects.create(
+                valor_total=Decimal('10.00'), data_vencimento=date(2025, 1, dia) if dia else None
+            )
+        fabrica = RequestFactory()
+        qs = DespesaAdministrativa.objects.all()
+        ids, params = [], {}
+        while True:
+            pagina = paginar_keyset(fabrica.get('/', params), qs, ['-data_vencimento', '-id'], por_pagina=2)
+            ids.extend(d.id for d in pagina)
+            if not pagina.tem_proxima:
+                break
+            params = {'cursor': pagina.proximo_cursor}
+        datas = [DespesaAdministrativa.objects.get(id=i).data_vencimento for i in ids]
+        self.assertEqual(len(set(ids)), 5)
+        self.assertEqual(datas, [date(2025, 1, 5), date(2025, 1, 5), date(2025, 1, 1), None, None])
+
+    def test_view_avisos_paginada(self):
+        self.client.force_login(self.usuario)
+        response = self.client.get(reverse('paginas:painel_avisos'), {'cursor': 'invalido'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['avisos']), 7)
+        self.assertIsNone(response.context['avisos'].url_primeira)
+
+
+class SerieReceitaTests(PainelAlunoTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        dados = [
+            # mes_referencia, data_pagamento, valor, status
+            (date(2025, 5, 1), date(2025, 6, 3), '100.00', 'PAGO'),
+            (date(2025, 6, 1), date(2025, 6, 10), '150.00', 'PAGO'),
+            (date(2025, 7, 1), None, '150.00', 'PENDENTE'),
+            (date(2024, 1, 1), date(2025, 7, 2), '80.00', 'PAGO'),
+        ]
+        for mes, pagamento, valor, status in dados:
+            Mensalidade.objects.create(
+                aluno=cls.aluno, mes_referencia=mes, valor=Decimal(valor), valor_final=Decimal(valor),
+                data_vencimento=date(2030, 1, 1), data_pagamento=pagamento, status=status
+            )
+
+    def test_por_data_de_pagamento(self):
+        serie = serie_receita('data_pagamento', 6, hoje=date(2025, 7, 15))
+        self.assertEqual(serie['labels'], ['Fev/25', 'Mar/25', 'Abr/25', 'Mai/25', 'Jun/25', 'Jul/25'])
+        self.assertEqual(serie['valores'], [0, 0, 0, 0, 250.0, 80.0])
+        self.assertEqual(serie['receita_mes'], Decimal('80.00'))
+        self.assertEqual(serie['mens_pendentes'], 1)
+        self.assertEqual(serie['mens_pagas'], 0)
+
+    def test_por_mes_de_referencia(self):
+        serie = serie_receita('mes_referencia', 6, hoje=date(2025, 7, 15))
+        self.assertEqual(serie['valores'], [0, 0, 0, 100.0, 150.0, 0])
+
+    def test_janela_nao_aumenta_consultas(self):
+        for meses in (6, 12, 24):
+            with self.assertNumQueries(1):
+                serie = serie_receita('data_pagamento', meses, hoje=date(2025, 7, 15))
+            self.assertEqual(len(serie['valores']), meses)
+
+
+class ResultadoFinanceiroTests(PainelAlunoTestCase):
+
+    def _mensalidade(self, mes, **kwargs):
+        return Mensalidade.objects.create(
+            aluno=self.aluno, mes_referencia=mes, valor=Decimal('150.00'),
+            valor_final=Decimal('150.00'), data_vencimento=date(2030, mes.month, 10), **kwargs
+        )
+
+    def test_consolida_fontes_do_mes(self):
+        self._mensalidade(date(2025, 3, 1), status='PAGO', data_pagamento=date(2025, 3, 5))
+        DespesaAdministrativa.objects.create(
+            valor_total=Decimal('80.00'), valor_pago=Decimal('50.00'), data_vencimento=date(2025, 3, 20)
+        )
+        evento = Evento.objects.create(
+            nome='Show', data_evento=date(2025, 3, 30), local='Teatro', valor_ingresso=Decimal('20.00'), meta_vendas=10
+        )
+        VendaIngresso.objects.create(
+            evento=evento, vendedor=self.usuario, quantidade=2, data_venda=date(2025, 3, 8), confirmado=True
+        )
+        financeiro.processar_meses_pendentes()
+
+        resultado = ResultadoFinanceiroMensal.objects.get(mes=date(2025, 3, 1))
+        self.assertEqual(resultado.lucro_total, Decimal('190.00'))
+        self.assertEqual(resultado.gasto_total, Decimal('50.00') + VendaIngresso.objects.get().valor_comissao)
+        self.assertIsNotNone(resultado.calculado_em)
+        self.assertFalse(MesFinanceiroPendente.objects.exists())
+
+    def test_so_recalcula_meses_tocados(self):
+        mensalidade = self._mensalidade(date(2025, 4, 1), status='PAGO', data_pagamento=date(2025, 4, 2))
+        financeiro.processar_meses_pendentes()
+
+        # Pagamento movido para maio: abril e maio voltam para a fila
+        mensalidade.data_pagamento = date(2025, 5, 2)
+        mensalidade.save()
+        self.assertEqual(
+            set(MesFinanceiroPendente.objects.values_list('mes', flat=True)),
+            {date(2025, 4, 1), date(2025, 5, 1), date(2030, 4, 1)}
+        )
+        financeiro.processar_meses_pendentes()
+        self.assertEqual(ResultadoFinanceiroMensal.objects.get(mes=date(2025, 4, 1)).lucro_total, 0)
+        self.assertEqual(ResultadoFinanceiroMensal.objects.get(mes=date(2025, 5, 1)).lucro_total, Decimal('150.00'))
+
+    def test_api_le_resultados_atualizados(self):
+        self._mensalidade(date(2025, 6, 1), status='PAGO', data_pagamento=date(2025, 6, 1))
+        dados = self.client.get(reverse('paginas:exportar_resultados_json'), {'mes': '2025-06'}).json()
+        self.assertEqual(dados['resultados'][0]['lucro_total'], 150.0)
+
+
+class TransicaoMensalidadesTests(PainelAlunoTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Vencimentos no futuro para nascerem PENDENTE
+        for mes in range(1, 6):
+            Mensalidade.objects.create(
+                aluno=cls.aluno, mes_referencia=date(2040, mes, 1), valor=Decimal('100.00'),
+                valor_final=Decimal('100.00'), data_vencimento=date(2040, mes, 10)
+            )
+
+    def test_transicao_em_lotes_com_notificacoes(self):
+        registro = transicionar_mensalidades_vencidas(hoje=date(2040, 3, 15), tamanho_lote=2)
+        self.assertEqual(registro.total_atualizadas, 3)
+        self.assertEqual(registro.total_notificacoes, 3)
+        self.assertEqual(registro.lotes, 2)
+        self.assertEqual(Mensalidade.objects.filter(status='ATRASADO').count(), 3)
+        self.assertEqual(Notificacao.objects.filter(usuario=self.usuario, tipo='ALERTA').count(), 3)
+
+    def test_marca_dagua_ignora_vencimentos_ja_verificados(self):
+        transicionar_mensalidades_vencidas(hoje=date(2040, 2, 15))
+        # Simula uma mensalidade antiga que voltou a PENDENTE depois da execução
+        Mensalidade.objects.filter(mes_referencia=date(2040, 1, 1)).update(status='PENDENTE')
+        registro = transicionar_mensalidades_vencidas(hoje=date(2040, 4, 15), desde=date(2040, 2, 15))
+        self.assertEqual(registro.total_atualizadas, 2)
+        self.assertEqual(Mensalidade.objects.get(mes_referencia=date(2040, 1, 1)).status, 'PENDENTE')
+
+    def test_vencimento_movido_para_tras_vira_atrasado_no_save(self):
+        # Abaixo da marca d'água: o comando não olharia esta mensalidade de novo
+        mensalidade = Mensalidade.objects.get(mes_referencia=date(2040, 5, 1))
+        mensalidade.data_vencimento = date(2020, 5, 10)
+        mensalidade.save(update_fields=['data_vencimento'])
+        self.assertEqual(Mensalidade.objects.get(pk=mensalidade.pk).status, 'ATRASADO')
+
+        paga = Mensalidade.objects.get(mes_referencia=date(2040, 4, 1))
+        paga.status, paga.data_pagamento, paga.data_vencimento = 'PAGO', date(2020, 4, 1), date(2020, 4, 10)
+        paga.save()
+        self.assertEqual(Mensalidade.objects.get(pk=paga.pk).status, 'PAGO')
+
+    def test_consultas_nao_dependem_do_numero_de_linhas(self):
+        # Um lote com as 5 linhas (select, update, bulk_create) e o registro de
+        # auditoria. O savepoint e o release vêm da transação externa do TestCase.
+        with self.assertNumQueries(3 + 1 + 2):
+            transicionar_mensalidades_vencidas(hoje=date(2041, 1, 1), tamanho_lote=10)
+
+
+class GeracaoMensalidadesTests(PainelAlunoTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Mensalidade.objects.create(
+            aluno=cls.aluno, mes_referencia=date(2040, 1, 1), valor=Decimal('150.00'),
+            valor_desconto=Decimal('20.00'), valor_final=Decimal('130.00'), data_vencimento=date(2040, 1, 10)
+        )
+        outro = User.objects.create_user('sem_turma')
+        cls.sem_turma = Aluno.objects.create(
+            usuario=outro, cpf='222.222.222-22', data_nascimento=date(2001, 1, 1),
+            telefone='0', telefone_emergencia='0', endereco='Rua C'
+        )
+
+    def test_repete_valor_anterior_e_e_idempotente(self):
+        resultado = gerar_mensalidades_do_mes(date(2040, 2, 1), dia_vencimento=31)
+        self.assertEqual(resultado, {'criadas': 1, 'sem_valor': 1, 'desconto_maior': 0})
+        gerada = Mensalidade.objects.get(aluno=self.aluno, mes_referencia=date(2040, 2, 1))
+        self.assertEqual(gerada.valor_final, Decimal('130.00'))
+        self.assertEqual(gerada.data_vencimento, date(2040, 2, 29))
+        self.assertEqual(gerada.status, 'PENDENTE')
+        self.assertEqual(gerar_mensalidades_do_mes(date(2040, 2, 1))['criadas'], 0)
+
+    def test_valor_fixo_por_turma(self):
+        resultado = gerar_mensalidades_do_mes(date(2040, 3, 1), valor=Decimal('99.90'), turma=self.turma)
+        self.assertEqual(resultado['criadas'], 1)
+        self.assertFalse(Mensalidade.objects.filter(aluno=self.sem_turma).exists())
+        self.assertEqual(
+            Mensalidade.objects.get(aluno=self.aluno, mes_referencia=date(2040, 3, 1)).valor_final,
+            Decimal('79.90')
+        )
+
+    def test_desconto_maior_que_o_valor(self):
+        with self.assertRaises(ValidationError):
+            gerar_mensalidades_do_mes(date(2040, 3, 1), valor=Decimal('50.00'), valor_desconto=Decimal('80.00'))
+
+        # Desconto herdado (80) maior que o valor novo: o aluno fica de fora, nada negativo é gravado
+        Mensalidade.objects.filter(aluno=self.aluno).update(valor_desconto=Decimal('80.00'))
+        resultado = gerar_mensalidades_do_mes(date(2040, 3, 1), valor=Decimal('50.00'))
+        self.assertEqual(resultado, {'criadas': 1, 'sem_valor': 0, 'desconto_maior': 1})
+        self.assertFalse(Mensalidade.objects.filter(aluno=self.aluno, mes_referencia=date(2040, 3, 1)).exists())
+        self.assertFalse(Mensalidade.objects.filter(valor_final__lt=0).exists())
+
+        with self.assertRaises(CommandError):
+            call_command('gerar_mensalidades', '--mes', '2040-03', '--valor', '50', '--desconto', '80', stdout=io.StringIO())
+
+
+class FakeMercadoPagoAPI:
+    """API do Mercado Pago em memória: pagamentos por id e falhas programadas"""
+
+    def __init__(self, pagamentos=None, falhas=0):
+        self.pagamentos = pagamentos or {}
+        self.falhas = falhas
+        self.chamadas = []
+
+    def buscar_pagamento(self, payment_id):
+        self.chamadas.append(payment_id)
+        if self.falhas:
+            self.falhas -= 1
+            raise ErroGateway('timeout simulado')
+        return self.pagamentos.get(str(payment_id))
+
+
+class WebhookMercadoPagoTests(PainelAlunoTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.mensalidade = Mensalidade.objects.create(
+            aluno=cls.aluno, mes_referencia=date(2040, 1, 1), valor=Decimal('150.00'),
+            valor_final=Decimal('150.00'), data_vencimento=date(2040, 1, 10)
+        )
+
+    def _notificar(self, payment_id='123'):
+        return self.client.post(
+            reverse('paginas:webhook_mercadopago'),
+            data=json.dumps({'type': 'payment', 'data': {'id': payment_id}}),
+            content_type='application/json',
+        )
+
+    def _api(self, **kwargs):
+        return FakeMercadoPagoAPI({'123': {
+            'id': 123, 'status': 'approved', 'metadata': {'mensalidade_id': str(self.mensalidade.id)}
+        }}, **kwargs)
+
+    def test_webhook_so_registra_e_deduplica(self):
+        with mock.patch('paginas.pagamentos.MercadoPagoAPI.buscar_pagamento') as buscar:
+            for _ in range(3):
+                self.assertEqual(self._notificar().status_code, 200)
+        buscar.assert_not_called()
+        evento = EventoWebhook.objects.get()
+        self.assertEqual((evento.status, evento.recebimentos), ('PENDENTE', 3))
+
+    def test_processamento_idempotente(self):
+        self._notificar()
+        api = self._api()
+        self.assertEqual(processar_eventos_pendentes(api=api, workers=1), {'PROCESSADO': 1})
+        self.mensalidade.refresh_from_db()
+        self.assertEqual(self.mensalidade.status, 'PAGO')
+
+        # Reenvio do gateway depois de processado: consulta de novo, mas não baixa nem notifica outra vez
+        self._notificar()
+        processar_eventos_pendentes(api=api, workers=1)
+        self.assertEqual(EventoWebhook.objects.get().resultado, 'JA_PAGO')
+        self.assertEqual(Notificacao.objects.filter(titulo='Pagamento Aprovado').count(), 1)
+
+    def test_falha_volta_para_fila_com_backoff(self):
+        self._notificar()
+        api = self._api(falhas=1)
+        self.assertEqual(processar_eventos_pendentes(api=api, workers=1), {'PENDENTE': 1})
+        evento = EventoWebhook.objects.get()
+        self.assertEqual(evento.tentativas, 1)
+        self.assertGreater(evento.proxima_tentativa, timezone.now())
+        self.assertIn('timeout simulado', evento.ultimo_erro)
+
+        # Ainda no backoff: nada a fazer
+        self.assertEqual(processar_eventos_pendentes(api=api, workers=1), {})
+        EventoWebhook.objects.update(proxima_tentativa=timezone.now())
+        self.assertEqual(processar_eventos_pendentes(api=api, workers=1), {'PROCESSADO': 1})
+
+
+class ClienteMercadoPagoTests(TestCase):
+
+    def setUp(self):
+        metricas.zerar()
+        self.fake = MercadoPagoFake()
+        self.cliente = ClienteMercadoPago(sdk=self.fake, tentativas=3, dormir=lambda segundos: None)
+
+    def tearDown(self):
+        configurar_cliente(None)
+
+    def test_repete_falhas_temporarias_e_registra_metricas(self):
+        self.fake.falhar(1, status=503)
+        self.fake.falhar(1, status=None)
+        resposta = self.cliente.criar_preferencia({'items': []})
+        self.assertEqual(resposta['status'], 201)
+        self.assertEqual(len(self.fake.chamadas), 3)
+        self.assertEqual(metricas.resumo()['preferencia.criar']['chamadas'], 3)
+        self.assertEqual(metricas.resumo()['preferencia.criar']['erros'], 2)
+
+    def test_pagamento_sem_chave_de_idempotencia_nao_repete(self):
+        self.fake.falhar(1, status=None)
+        with self.assertRaises(ErroGateway):
+            self.cliente.criar_pagamento({'transaction_amount': 10})
+        self.assertEqual(len(self.fake.chamadas), 1)
+
+        resposta = self.cliente.criar_pagamento({'transaction_amount': 10}, chave_idempotencia='MENS-1-tok')
+        self.assertEqual(self.cliente.buscar_pagamento(resposta['response']['id'])['status'], 'approved')
+        self.assertIsNone(self.cliente.buscar_pagamento('999'))
+
+    def test_disjuntor_abre_e_fecha(self):
+        agora = [0]
+        self.cliente.disjuntor = Disjuntor(limite_falhas=2, tempo_aberto=30, relogio=lambda: agora[0])
+        self.fake.falhar(3, status=500)
+        with self.assertRaises(GatewayIndisponivel):
+            self.cliente.buscar_pagamento('1')
+        self.assertEqual(self.cliente.disjuntor.estado, 'ABERTO')
+
+        # Aberto: falha na hora, sem chamar o gateway
+        chamadas = len(self.fake.chamadas)
+        with self.assertRaises(GatewayIndisponivel):
+            self.cliente.criar_preferencia({'items': []})
+        self.assertEqual(len(self.fake.chamadas), chamadas)
+
+        # Passado o tempo, a chamada de teste falha e reabre; a seguinte fecha
+        agora[0] = 31
+        with self.assertRaises(GatewayIndisponivel):
+            self.cliente.buscar_pagamento('1')
+        self.assertEqual(self.cliente.disjuntor.estado, 'ABERTO')
+        agora[0] = 62
+        self.assertEqual(self.cliente.criar_preferencia({'items': []})['status'], 201)
+        self.assertEqual(self.cliente.disjuntor.estado, 'FECHADO')
+
+    def test_views_usam_o_cliente_do_processo(self):
+        configurar_cliente(self.cliente)
+        usuario = User.objects.create_user('pagante', password='senha123')
+        aluno = Aluno.objects.create(usuario=usuario, cpf='999.999.999-99', data_nascimento=date(2000, 1, 1))
+        mensalidade = Mensalidade.objects.create(
+            aluno=aluno, mes_referencia=date(2040, 2, 1), valor=Decimal('120.00'),
+            valor_final=Decimal('120.00'), data_vencimento=date(2040, 2, 10)
+        )
+        self.client.force_login(usuario)
+        resposta = self.client.get(
+            reverse('paginas:pagar_mensalidade', args=[mensalidade.id]), HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertEqual(resposta.json()['preference_id'], 'fake-pref-1')
+
+        resposta = self.client.post(reverse('paginas:processar_pagamento'), data=json.dumps({
+            'mensalidade_id': mensalidade.id, 'transaction_amount': 120, 'token': 'tok',
+            'payment_method_id': 'visa',
+        }), content_type='application/json')
+        self.assertEqual(resposta.json()['status'], 'approved')
+        mensalidade.refresh_from_db()
+        self.assertEqual(mensalidade.status, 'PAGO')
+
+
+class PreferenciaPagamentoTests(PainelAlunoTestCase):
+
+    def setUp(self):
+        self.fake = MercadoPagoFake()
+        configurar_cliente(ClienteMercadoPago(sdk=self.fake, dormir=lambda segundos: None))
+        self.mensalidade = Mensalidade.objects.create(
+            aluno=self.aluno, mes_referencia=date(2040, 4, 1), valor=Decimal('100.00'),
+            valor_final=Decimal('100.00'), data_vencimento=date(2040, 4, 10)
+        )
+
+    def tearDown(self):
+        configurar_cliente(None)
+
+    def test_reaproveita_ate_o_valor_mudar(self):
+        primeira = preferencia_da_mensalidade(self.mensalidade)
+        with self.assertNumQueries(1):
+            self.assertEqual(preferencia_da_mensalidade(self.mensalidade), primeira)
+        self.assertEqual(len(self.fake.chamadas), 1)
+
+        self.mensalidade.valor_desconto = Decimal('10.00')
+        self.mensalidade.save()
+        self.assertFalse(PreferenciaPagamento.objects.exists())
+        self.assertNotEqual(preferencia_da_mensalidade(self.mensalidade), primeira)
+        self.assertEqual(self.fake.preferencias[PreferenciaPagamento.objects.get().preference_id]['items'][0]['unit_price'], 90.0)
+
+    def test_expirada_ou_paga_nao_e_reaproveitada(self):
+        primeira = preferencia_da_mensalidade(self.mensalidade)
+        PreferenciaPagamento.objects.update(expira_em=timezone.now() + timedelta(minutes=5))
+        segunda = preferencia_da_mensalidade(self.mensalidade)
+        self.assertNotEqual(segunda, primeira)
+        self.assertEqual(PreferenciaPagamento.objects.get().preference_id, segunda)
+
+        self.mensalidade.status = 'PAGO'
+        self.mensalidade.data_pagamento = date(2040, 4, 5)
+        self.mensalidade.save()
+        self.assertFalse(PreferenciaPagamento.objects.exists())
+
+
+class CronogramaTests(PainelAlunoTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        HorarioAula.objects.create(turma=cls.turma, dia_semana='SEG', hora_inicio=time(18, 0), hora_fim=time(19, 0))
+        HorarioAula.objects.create(turma=cls.turma, dia_semana='QUA', hora_inicio=time(18, 0), hora_fim=time(19, 0))
+
+    def test_gera_semanas_pulando_feriados_e_sem_duplicar(self):
+        from calendario.models import TarefaCalendario
+
+        # Março/2040: segundas 5, 12, 19, 26 e quartas 7, 14, 21, 28
+        DiaSemAula.objects.create(data=date(2040, 3, 12), motivo='Feriado')
+        Aula.objects.create(turma=self.turma, data=date(2040, 3, 5), hora_inicio=time(18, 0), hora_fim=time(19, 0))
+
+        resultado = gerar_aulas(date(2040, 3, 1), date(2040, 3, 31), excluir=[date(2040, 3, 28)])
+        self.assertEqual(resultado, {'criadas': 5, 'existentes': 1, 'puladas': 2})
+        self.assertEqual(
+            sorted(Aula.objects.filter(data__month=3).values_list('data__day', flat=True)),
+            [5, 7, 14, 19, 21, 26]
+        )
+        # Google Agenda: uma tarefa por aula criada, nenhuma chamada no INSERT
+        self.assertEqual(TarefaCalendario.objects.filter(acao='SINCRONIZAR').count(), 6)
+
+        self.assertEqual(gerar_aulas(date(2040, 3, 1), date(2040, 3, 31))['criadas'], 1)
+        self.assertEqual(gerar_aulas(date(2040, 3, 1), date(2040, 3, 31))['criadas'], 0)
+
+    def test_respeita_periodo_da_turma(self):
+        Turma.objects.filter(pk=self.turma.pk).update(data_fim=date(2040, 3, 10))
+        # Inclui o update da versão do feed iCal das turmas
+        with self.assertNumQueries(8):
+            resultado = gerar_aulas(date(2040, 3, 1), date(2040, 6, 30), turmas=[self.turma.pk])
+        self.assertEqual(resultado['criadas'], 2)
+
+
+class RegistroFrequenciaTests(PainelAlunoTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.aula = Aula.objects.create(turma=cls.turma, data=date(2040, 3, 5), hora_inicio=time(18, 0), hora_fim=time(19, 0))
+        cls.outros = []
+        for i in range(29):
+            usuario = User.objects.create_user(f'colega{i}')
+            aluno = Aluno.objects.create(usuario=usuario, cpf=f'111.111.111-{i:02d}', data_nascimento=date(2000, 1, 1))
+            aluno.turmas.add(cls.turma)
+            cls.outros.append(aluno)
+        cls.admin = User.objects.create_superuser('admin', 'admin@x.com', 'senha123')
+
+    def test_admin_grava_a_turma_em_poucas_consultas(self):
+        Frequencia.objects.create(aluno=self.aluno, aula=self.aula, status='PRESENTE', justificativa='Chegou atrasada')
+        self.client.force_login(self.admin)
+        url = reverse('admin:registrar_frequencia_aula', args=[self.aula.id])
+        dados = {f'faltou_{aluno.id}': 'on' for aluno in self.outros[:3]}
+        dados[f'faltou_{self.aluno.id}'] = 'on'
+
+        # Independe do tamanho da turma (antes eram ~2 consultas por aluno),
+        # incluindo o recálculo do resumo mensal
+        with self.assertNumQueries(11):
+            self.client.post(url, dados)
+        self.assertEqual(Frequencia.objects.filter(aula=self.aula).count(), 30)
+        self.assertEqual(Frequencia.objects.filter(aula=self.aula, status='FALTA').count(), 4)
+        self.assertEqual(Frequencia.objects.get(aluno=self.aluno, aula=self.aula).justificativa, 'Chegou atrasada')
+
+    def test_api_do_tablet(self):
+        url = reverse('paginas:frequencias_aula', args=[self.aula.id])
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(self.professor)
+        self.assertEqual(len(self.client.get(url).json()['alunos']), 30)
+
+        corpo = {'frequencias': [{'aluno_id': aluno.id, 'status': 'PRESENTE'} for aluno in self.outros]}
+        corpo['frequencias'].append({'aluno_id': self.aluno.id, 'status': 'ATESTADO', 'justificativa': 'Médico'})
+        resposta = self.client.post(url, json.dumps(corpo), content_type='application/json')
+        self.assertEqual(resposta.json()['registradas'], 30)
+        self.assertEqual(Frequencia.objects.get(aluno=self.aluno, aula=self.aula).justificativa, 'Médico')
+
+        # Inválido: nada é gravado
+        corpo = {'frequencias': [{'aluno_id': self.aluno.id, 'status': 'FALTA'}, {'aluno_id': 99999, 'status': 'FALTA'}]}
+        resposta = self.client.post(url, json.dumps(corpo), content_type='application/json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(Frequencia.objects.get(aluno=self.aluno, aula=self.aula).status, 'ATESTADO')
+
+    def test_api_do_tablet_justificativa_nula_ou_invalida(self):
+        url = reverse('paginas:frequencias_aula', args=[self.aula.id])
+        self.client.force_login(self.professor)
+
+        corpo = {'frequencias': [{'aluno_id': self.aluno.id, 'status': 'FALTA', 'justificativa': None}]}
+        resposta = self.client.post(url, json.dumps(corpo), content_type='application/json')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(Frequencia.objects.get(aluno=self.aluno, aula=self.aula).justificativa, '')
+
+        corpo['frequencias'][0]['justificativa'] = ['Médico']
+        resposta = self.client.post(url, json.dumps(corpo), content_type='application/json')
+        self.assertEqual(resposta.status_code, 400)
+
+
+@mock.patch.object(api_views, 'API_TOKEN', 'token-teste')
+class ResumoFrequenciaTests(PainelAlunoTestCase):
+
+    def _aula(self, dia):
+        return Aula.objects.create(turma=self.turma, data=dia, hora_inicio=time(18, 0), hora_fim=time(19, 0))
+
+    def _resumo(self, mes):
+        return ResumoFrequenciaMensal.objects.filter(aluno=self.aluno, mes=mes).values_list(
+            'total', 'presencas', 'faltas', 'justificadas'
+        ).first()
+
+    def test_sinais_mantem_o_resumo(self):
+        marco, abril = date(2040, 3, 1), date(2040, 4, 1)
+        primeira, segunda = self._aula(date(2040, 3, 5)), self._aula(date(2040, 3, 12))
+        frequencia = Frequencia.objects.create(aluno=self.aluno, aula=primeira, status='PRESENTE')
+        Frequencia.objects.create(aluno=self.aluno, aula=segunda, status='ATESTADO')
+        self.assertEqual(self._resumo(marco), (2, 1, 0, 1))
+
+        frequencia.status = 'FALTA'
+        frequencia.save()
+        self.assertEqual(self._resumo(marco), (2, 0, 1, 1))
+
+        # Aula remarcada para outro mês leva a frequência junto
+        segunda.data = date(2040, 4, 2)
+        segunda.save()
+        self.assertEqual(self._resumo(marco), (1, 0, 1, 0))
+        self.assertEqual(self._resumo(abril), (1, 0, 0, 1))
+
+        frequencia.delete()
+        self.assertIsNone(self._resumo(marco))
+        segunda.delete()
+        self.assertFalse(ResumoFrequenciaMensal.objects.exists())
+
+    def test_registro_em_lote_e_recalculo(self):
+        aula = self._aula(date(2040, 3, 5))
+        registrar_frequencias(aula, {self.aluno.id: 'PRESENTE'})
+        self.assertEqual(self._resumo(date(2040, 3, 1)), (1, 1, 0, 0))
+        registrar_frequencias(aula, {self.aluno.id: 'FALTA_JUSTIFICADA'})
+        self.assertEqual(self._resumo(date(2040, 3, 1)), (1, 0, 0, 1))
+
+        ResumoFrequenciaMensal.objects.all().delete()
+        self.assertEqual(recalcular_todos_resumos(), 1)
+        self.assertEqual(self._resumo(date(2040, 3, 1)), (1, 0, 0, 1))
+
+    def test_grafico_e_exportacao_leem_o_resumo(self):
+        hoje = timezone.now().date()
+        for dia, status in ((1, 'PRESENTE'), (2, 'PRESENTE'), (3, 'PRESENTE'), (4, 'FALTA')):
+            Frequencia.objects.create(aluno=self.aluno, aula=self._aula(hoje.replace(day=dia)), status=status)
+
+        self.client.force_login(self.usuario)
+        with self.assertNumQueries(5):  # sessão, usuário, aluno, versão e resumos
+            dados = self.client.get(reverse('paginas:grafico_frequencia')).json()
+        self.assertNotIn('aluno', dados)
+        self.assertEqual((dados['presencas'], dados['faltas'], dados['total']), ([75.0], [25.0], [4]))
+
+        response = self.client.get('/api/exportar-frequencias/', {'token': 'token-teste', 'aluno_id': self.aluno.id})
+        linhas = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(linhas), 1)
+        self.assertEqual((linhas[0]['total'], linhas[0]['percentual_presenca']), (4, 75.0))
+        self.assertEqual(self.client.get('/api/exportar-frequencias/').status_code, 401)
+
+    def test_grafico_por_turma_e_revalidacao(self):
+        hoje = timezone.now().date()
+        outra = Turma.objects.create(nome='Jazz', modalidade='JAZZ', nivel='INICIANTE', professor=self.professor)
+        self.aluno.turmas.add(outra)
+        Frequencia.objects.create(aluno=self.aluno, aula=self._aula(hoje.replace(day=1)), status='PRESENTE')
+        Frequencia.objects.create(aluno=self.aluno, status='FALTA', aula=Aula.objects.create(
+            turma=outra, data=hoje.replace(day=2), hora_inicio=time(18, 0), hora_fim=time(19, 0)
+        ))
+        url = reverse('paginas:grafico_frequencia')
+        self.client.force_login(self.usuario)
+
+        response = self.client.get(url, {'meses': 12, 'por_turma': 1})
+        dados = response.json()
+        self.assertEqual(dados['presencas'], [50.0])
+        self.assertEqual(
+            [(t['nome'], t['presencas'], t['faltas']) for t in dados['turmas']],
+            [('Ballet Iniciante', [100.0], [0]), ('Jazz', [0], [100.0])],
+        )
+
+        # Nada mudou: 304 sem montar a série
+        with self.assertNumQueries(4):
+            repetida = self.client.get(url, {'meses': 12, 'por_turma': 1}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repetida.status_code, 304)
+        # Outra janela ou sem a quebra por turma é outra representação
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+        Frequencia.objects.filter(aula__turma=outra).get().delete()
+        atualizada = self.client.get(url, {'meses': 12, 'por_turma': 1}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(atualizada.status_code, 200)
+        self.assertEqual(atualizada.json()['presencas'], [100.0])
+
+
+class GradeSemanalTests(PainelAlunoTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.professor.first_name = 'Bia'
+        cls.professor.save()
+        for dia, hora in (('SEX', 18), ('SEG', 19), ('SEG', 18)):
+            HorarioAula.objects.create(turma=cls.turma, dia_semana=dia, hora_inicio=time(hora, 0), hora_fim=time(hora, 50))
+
+    def test_grade_compilada_e_reaproveitada(self):
+        with self.assertNumQueries(2):
+            compilada = grade.grade_da_turma(self.turma.pk)
+        self.assertEqual(compilada['horarios'], ((0, 1080, 1130, ''), (0, 1140, 1190, ''), (4, 1080, 1130, '')))
+        self.assertEqual(compilada['professor'], 'Bia')
+        with self.assertNumQueries(0):
+            grade.grades_das_turmas([self.turma.pk])
+        self.assertEqual(grade.resumo_da_grade(compilada), 'Seg 18:00-18:50, Seg 19:00-19:50, Sex 18:00-18:50')
+
+        HorarioAula.objects.create(turma=self.turma, dia_semana='QUA', hora_inicio=time(8, 0), hora_fim=time(9, 0))
+        self.assertEqual(len(grade.grade_da_turma(self.turma.pk)['horarios']), 4)
+        self.professor.first_name = 'Beatriz'
+        self.professor.save()
+        self.assertEqual(grade.grade_da_turma(self.turma.pk)['professor'], 'Beatriz')
+
+    def test_painel_de_horarios_na_ordem_da_semana(self):
+        self.client.force_login(self.usuario)
+        response = self.client.get(reverse('paginas:painel_horarios'))
+        self.assertEqual(response.context['dias_semana'], ['Segunda-feira', 'Sexta-feira'])
+        segunda = response.context['horarios_por_dia']['Segunda-feira']
+        self.assertEqual([h.hora_inicio for h in segunda], [time(18, 0), time(19, 0)])
+        self.assertContains(response, 'com Bia')
+
+    def test_admin_de_turmas(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@x.com', 'senha123'))
+        response = self.client.get(reverse('admin:paginas_turma_changelist'))
+        self.assertContains(response, 'Seg 18:00-18:50')
+
+
+class FeedIcalTests(PainelAlunoTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        HorarioAula.objects.create(turma=cls.turma, dia_semana='QUA', hora_inicio=time(18, 0), hora_fim=time(19, 0), sala='Sala 1')
+        hoje = timezone.localdate()
+        cls.aula = Aula.objects.create(
+            turma=cls.turma, data=hoje + timedelta(days=1), hora_inicio=time(18, 0), hora_fim=time(19, 0), tema='Giros, saltos'
+        )
+
+    def _conteudo(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_feed_do_aluno_com_aulas_e_rotina(self):
+        url = ical.caminho_feed('aluno', self.aluno.pk)
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        conteudo = self._conteudo(response)
+        self.assertTrue(conteudo.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertIn(f'UID:aula-{self.aula.pk}@giro-dance', conteudo)
+        self.assertIn('SUMMARY:Ballet Iniciante (Ballet) - Giros\\, saltos', conteudo)
+        self.assertIn('RRULE:FREQ=WEEKLY', conteudo)
+        self.assertIn('LOCATION:Sala 1', conteudo)
+        self.assertEqual(self.client.get(url.replace('.ics', 'x.ics')).status_code, 404)
+
+    def test_fuso_declarado_e_until_em_utc(self):
+        fim = timezone.localdate() + timedelta(days=60)
+        self.turma.data_fim = fim
+        self.turma.save()
+        conteudo = self._conteudo(self.client.get(ical.caminho_feed('turma', self.turma.pk)))
+        # VTIMEZONE antes dos eventos que usam o TZID
+        self.assertLess(conteudo.index('TZID:America/Sao_Paulo\r\n'), conteudo.index('BEGIN:VEVENT'))
+        self.assertIn('TZOFFSETTO:-0300', conteudo)
+        # 23:59:59 em São Paulo (UTC-3) é 02:59:59Z do dia seguinte
+        self.assertIn(f'RRULE:FREQ=WEEKLY;UNTIL={fim + timedelta(days=1):%Y%m%d}T025959Z', conteudo)
+
+    def test_etag_forte_ate_a_proxima_mudanca(self):
+        url = ical.caminho_feed('turma', self.turma.pk)
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        corpo = self._conteudo(response)
+
+        # Feed da turma: 304 só com a consulta da versão
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Mesma versão, mesmos bytes (agora vindos do cache)
+        with self.assertNumQueries(1):
+            self.assertEqual(self._conteudo(self.client.get(url)), corpo)
+        # Outro worker (cache vazio) responde com o mesmo ETag e os mesmos bytes
+        cache.clear()
+        response = self.client.get(url)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self._conteudo(response), corpo)
+
+        self.aula.tema = 'Piruetas'
+        self.aula.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Piruetas', self._conteudo(response))
+
+    def test_gerar_aulas_em_outro_processo_troca_o_etag(self):
+        url = ical.caminho_feed('aluno', self.aluno.pk)
+        etag = self.client.get(url)['ETag']
+        # gerar_aulas roda no cron, sem a memória do worker: só o banco liga os dois
+        with mock.patch.object(ical, 'cache', mock.Mock()):
+            gerar_aulas(timezone.localdate() + timedelta(days=7), timezone.localdate() + timedelta(days=14))
+        self.assertTrue(Aula.objects.filter(turma=self.turma, data__gt=self.aula.data).exists())
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+def transcodificar_fake(origem, pasta):
+    """Simula o ffmpeg: uma versão 'web', uma 360p e o poster"""
+    saidas = []
+    for nome, altura, tamanho in (('web', 720, 300), ('360p', 360, 100)):
+        caminho = os.path.join(pasta, f'{nome}.mp4')
+        with open(caminho, 'wb') as arquivo:
+            arquivo.write(b'v' * tamanho)
+        saidas.append((nome, caminho, altura * 16 // 9, altura, 700 if nome == '360p' else 0))
+    poster = os.path.join(pasta, 'poster.jpg')
+    with open(poster, 'wb') as arquivo:
+        arquivo.write(b'jpg')
+    return saidas, poster
+
+
+class MidiaTemporariaTestCase(PainelAlunoTestCase):
+    """PainelAlunoTestCase com MEDIA_ROOT em uma pasta temporária (self.media)"""
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        configuracao = override_settings(MEDIA_ROOT=self.media)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+
+class ProcessamentoVideoTests(MidiaTemporariaTestCase):
+
+    def _aula_com_video(self, conteudo=b'original'):
+        return Aula.objects.create(
+            turma=self.turma, data=date(2025, 3, 10), hora_inicio=time(18, 0), hora_fim=time(19, 0),
+            video=SimpleUploadedFile('aula.mp4', conteudo, content_type='video/mp4'),
+        )
+
+    def test_video_novo_entra_na_fila_e_fica_pronto(self):
+        aula = self._aula_com_video()
+        aula.refresh_from_db()
+        self.assertEqual(aula.video_status, 'PENDENTE')
+        self.assertEqual(aula.fontes_video(), [(f'/aulas/{aula.pk}/video/', '')])
+
+        self.assertEqual(videos.processar_videos_pendentes(workers=1, transcodificar=transcodificar_fake), {'PRONTO': 1})
+        aula.refresh_from_db()
+        self.assertEqual(aula.video_status, 'PRONTO')
+        self.assertTrue(aula.video_poster.storage.exists(aula.video_poster.name))
+        self.assertEqual(
+            dict(aula.versoes_video.values_list('nome', 'tamanho_bytes')), {'web': 300, '360p': 100}
+        )
+        fontes = aula.fontes_video()
+        self.assertEqual(fontes[0][1], '(max-width: 640px)')
+        self.assertEqual(fontes[-1][1], '')
+        # Nada mais na fila
+        self.assertEqual(videos.processar_videos_pendentes(workers=1, transcodificar=transcodificar_fake), {})
+
+        # Remover o vídeo apaga as versões e os arquivos gerados
+        arquivos = list(aula.versoes_video.values_list('arquivo', flat=True)) + [aula.video_poster.name]
+        aula.video = None
+        aula.save()
+        aula.refresh_from_db()
+        self.assertEqual(aula.video_status, '')
+        self.assertFalse(VersaoVideo.objects.filter(aula=aula).exists())
+        self.assertFalse(any(os.path.exists(os.path.join(self.media, nome)) for nome in arquivos))
+
+    def test_video_pronto_ou_com_erro_invalida_o_painel(self):
+        aula = self._aula_com_video()
+        painel_cache.obter_contexto('minhas_aulas', self.usuario, lambda: {'aulas': 'PENDENTE'})
+        with self.captureOnCommitCallbacks(execute=True):
+            videos.processar_videos_pendentes(workers=1, transcodificar=transcodificar_fake)
+        self.assertEqual(
+            painel_cache.obter_contexto('minhas_aulas', self.usuario, lambda: {'aulas': 'PRONTO'}), {'aulas': 'PRONTO'}
+        )
+
+        def falhar(origem, pasta):
+            raise videos.ErroTranscodificacao('codec desconhecido')
+
+        videos.enfileirar([aula.pk])
+        Aula.objects.filter(pk=aula.pk).update(video_tentativas=videos.MAX_TENTATIVAS - 1)
+        painel_cache.obter_contexto('minhas_aulas', self.usuario, lambda: {'aulas': 'PRONTO'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(videos.processar_videos_pendentes(workers=1, transcodificar=falhar), {'ERRO': 1})
+        self.assertEqual(
+            painel_cache.obter_contexto('minhas_aulas', self.usuario, lambda: {'aulas': 'ERRO'}), {'aulas': 'ERRO'}
+        )
+
+    def test_falha_volta_para_a_fila_com_backoff(self):
+        aula = self._aula_com_video()
+
+        def falhar(origem, pasta):
+            raise videos.ErroTranscodificacao('codec desconhecido')
+
+        self.assertEqual(videos.processar_videos_pendentes(workers=1, transcodificar=falhar), {'PENDENTE': 1})
+        aula.refresh_from_db()
+        self.assertEqual(aula.video_tentativas, 1)
+        self.assertIn('codec desconhecido', aula.video_erro)
+        self.assertGreater(aula.video_proxima_tentativa, timezone.now())
+        # Ainda no backoff: não é pega de novo
+        self.assertEqual(videos.processar_videos_pendentes(workers=1, transcodificar=falhar), {})
+
+        Aula.objects.filter(pk=aula.pk).update(video_tentativas=videos.MAX_TENTATIVAS - 1, video_proxima_tentativa=None)
+        self.assertEqual(videos.processar_videos_pendentes(workers=1, transcodificar=falhar), {'ERRO': 1})
+
+    def test_video_trocado_durante_o_processamento_e_descartado(self):
+        aula = self._aula_com_video()
+
+        def trocar_no_meio(origem, pasta):
+            Aula.objects.filter(pk=aula.pk).update(video='aulas/videos/outro.mp4')
+            return transcodificar_fake(origem, pasta)
+
+        self.assertEqual(
+            videos.processar_videos_pendentes(workers=1, transcodificar=trocar_no_meio), {'DESCARTADO': 1}
+        )
+        self.assertFalse(VersaoVideo.objects.filter(aula=aula).exists())
+        pasta = os.path.join(self.media, videos.PASTA_PROCESSADOS, str(aula.pk))
+        self.assertEqual(os.listdir(pasta) if os.path.isdir(pasta) else [], [])
+
+    def test_falha_depois_de_guardar_as_versoes_nao_deixa_arquivos(self):
+        aula = self._aula_com_video()
+
+        def sem_poster(origem, pasta):
+            saidas, poster = transcodificar_fake(origem, pasta)
+            os.remove(poster)
+            return saidas, poster
+
+        self.assertEqual(videos.processar_videos_pendentes(workers=1, transcodificar=sem_poster), {'PENDENTE': 1})
+        self.assertFalse(VersaoVideo.objects.filter(aula=aula).exists())
+        pasta = os.path.join(self.media, videos.PASTA_PROCESSADOS, str(aula.pk))
+        self.assertEqual(os.listdir(pasta) if os.path.isdir(pasta) else [], [])
+
+    @override_settings(VIDEO_TIMEOUT_SEGUNDOS=40 * 60)
+    def test_reserva_cobre_as_tres_execucoes_do_ffmpeg(self):
+        aula = self._aula_com_video()
+        antes = timezone.now()
+        [(_, _, _, reserva)] = videos._reservar(1)
+        self.assertGreaterEqual(reserva - antes, timedelta(minutes=3 * 40))
+        self.assertFalse(videos._disponiveis(antes + timedelta(minutes=3 * 40)).filter(pk=aula.pk).exists())
+
+    def test_comando_unico_com_versoes_menores_que_o_original(self):
+        comando, saidas = videos.comando_transcodificacao('in.mov', '/tmp/x', 1280, 720)
+        self.assertEqual(comando.count('-i'), 1)
+        self.assertEqual([saida[0] for saida in saidas], ['web', '480p', '360p'])
+        self.assertEqual(saidas[1][2:4], (854, 480))
+        self.assertIn('+faststart', comando)
+
+    @unittest.skipUnless(shutil.which('ffmpeg') and shutil.which('ffprobe'), 'ffmpeg não instalado')
+    def test_transcodificacao_real(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            origem = os.path.join(pasta, 'clipe.mp4')
+            subprocess.run([
+                'ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc=size=640x480:rate=10:duration=2',
+                '-pix_fmt', 'yuv420p', origem,
+            ], check=True)
+            saidas, poster = videos.transcodificar(origem, pasta)
+            self.assertEqual([saida[0] for saida in saidas], ['web', '360p'])
+            self.assertTrue(all(os.path.getsize(saida[1]) > 0 for saida in saidas))
+            self.assertTrue(os.path.getsize(poster) > 0)
+
+
+class VideoAulaStreamingTests(MidiaTemporariaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.conteudo = bytes(range(256)) * 40
+        self.aula = Aula.objects.create(
+            turma=self.turma, data=date(2025, 3, 10), hora_inicio=time(18, 0), hora_fim=time(19, 0),
+            video=SimpleUploadedFile('ensaio.mp4', self.conteudo, content_type='video/mp4'),
+        )
+        self.url = self.aula.url_video()
+        self.client.force_login(self.usuario)
+
+    def test_arquivo_inteiro_e_trecho(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(response.streaming_content), self.conteudo)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.conteudo)}')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(b''.join(response.streaming_content), self.conteudo[100:200])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.conteudo[-10:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.conteudo)}-')
+        self.assertEqual(response.status_code, 416)
+
+        # If-Range com versão antiga: arquivo inteiro
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"outra"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_so_alunos_da_turma(self):
+        outro = User.objects.create_user('outro', password='senha123')
+        self.client.force_login(outro)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+        self.client.force_login(self.professor)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-0').status_code, 206)
+
+    def test_rota_de_midia_do_debug_nao_serve_videos(self):
+        class UrlsComMidia:
+            urlpatterns = urls_do_projeto.urlpatterns + urls_do_projeto.rotas_de_midia()
+
+        os.makedirs(os.path.join(self.media, 'avisos'))
+        with open(os.path.join(self.media, 'avisos', 'cartaz.txt'), 'wb') as arquivo:
+            arquivo.write(b'publico')
+        self.client.logout()
+        with override_settings(ROOT_URLCONF=UrlsComMidia):
+            self.assertEqual(self.client.get('/media/avisos/cartaz.txt').status_code, 200)
+            self.assertEqual(self.client.get(f'/media/{self.aula.video.name}').status_code, 404)
+            self.assertEqual(self.client.get(f'/media/avisos/../{self.aula.video.name}').status_code, 404)
+            self.assertEqual(self.client.get('/media/uploads_parciais/x.part').status_code, 404)
+
+    @override_settings(VIDEO_ENTREGA='x-accel', VIDEO_X_ACCEL_PREFIXO='/protegido/')
+    def test_modo_x_accel(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-99')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protegido/{self.aula.video.name}')
+        self.assertEqual(response.content, b'')
+
+
+@override_settings(VIDEO_UPLOAD_TAMANHO_PARTE=1024)
+class UploadVideoEmPartesTests(MidiaTemporariaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.aula = Aula.objects.create(
+            turma=self.turma, data=date(2025, 3, 10), hora_inicio=time(18, 0), hora_fim=time(19, 0), tema='Ensaio'
+        )
+        self.video = b'\x00\x00\x00\x18ftypmp42' + bytes(range(256)) * 10
+        self.client.force_login(self.professor)
+
+    def _iniciar(self, nome='ensaio.mp4', tamanho=None):
+        return self.client.post(
+            reverse('paginas:iniciar_upload_video', args=[self.aula.pk]),
+            json.dumps({'nome': nome, 'tamanho': len(self.video) if tamanho is None else tamanho}),
+            content_type='application/json',
+        )
+
+    def _parte(self, url, offset, dados):
+        return self.client.patch(url, dados, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_upload_retomado_e_montado(self):
+        response = self._iniciar()
+        self.assertEqual(response.status_code, 201)
+        url = reverse('paginas:parte_upload_video', args=[response.json()['upload_id']])
+
+        self.assertEqual(self._parte(url, 0, self.video[:1024]).json()['recebido'], 1024)
+        # Conexão caiu: o cliente pergunta onde parou e reenvia dali
+        self.assertEqual(self.client.get(url)['Upload-Offset'], '1024')
+        response = self._parte(url, 0, self.video[:1024])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['recebido'], 1024)
+
+        self._parte(url, 1024, self.video[1024:2048])
+        response = self._parte(url, 2048, self.video[2048:])
+        self.assertEqual(response.json()['status'], 'CONCLUIDO')
+
+        self.aula.refresh_from_db()
+        self.assertTrue(self.aula.video.name.startswith('aulas/videos/Ballet_Iniciante/2025-03-10_Ensaio'))
+        with self.aula.video.open('rb') as arquivo:
+            self.assertEqual(arquivo.read(), self.video)
+        self.assertEqual(self.aula.video_status, 'PENDENTE')
+        self.assertEqual(os.listdir(os.path.join(self.media, 'uploads_parciais')), [])
+
+    def test_parte_reservada_so_volta_depois_do_prazo(self):
+        upload_id = self._iniciar().json()['upload_id']
+        url = reverse('paginas:parte_upload_video', args=[upload_id])
+        # Outra requisição reservou a primeira parte e ainda está copiando
+        UploadVideo.objects.filter(pk=upload_id).update(recebido=1024, data_atualizacao=timezone.now())
+        self.assertEqual(self.client.get(url).json()['recebido'], 1024)
+        self.assertEqual(self._parte(url, 0, self.video[:1024]).status_code, 409)
+
+        # Reserva vencida: o processo caiu antes de anexar, vale o disco
+        UploadVideo.objects.filter(pk=upload_id).update(data_atualizacao=timezone.now() - timedelta(minutes=10))
+        self.assertEqual(self.client.get(url).json()['recebido'], 0)
+        self.assertEqual(self._parte(url, 0, self.video[:1024]).json()['recebido'], 1024)
+
+    def test_validacao_incremental(self):
+        self.assertEqual(self._iniciar(nome='ensaio.exe').status_code, 400)
+        self.assertEqual(self._iniciar(tamanho=51 * 1024 * 1024).status_code, 400)
+
+        url = reverse('paginas:parte_upload_video', args=[self._iniciar().json()['upload_id']])
+        # Conteúdo que não é MP4
+        self.assertEqual(self._parte(url, 0, b'MZ' + b'\x00' * 100).status_code, 400)
+        self.assertEqual(self._parte(url, 0, self.video[:2000]).status_code, 413)
+        self.assertEqual(self.client.get(url).json()['recebido'], 0)
+
+        # Só o professor da turma (ou a equipe)
+        self.client.force_login(self.usuario)
+        self.assertEqual(self._iniciar().status_code, 403)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_abandonados_sao_cancelados(self):
+        upload_id = self._iniciar().json()['upload_id']
+        UploadVideo.objects.filter(pk=upload_id).update(data_atualizacao=timezone.now() - timedelta(days=2))
+        call_command('limpar_uploads_video', stdout=io.StringIO())
+        self.assertEqual(UploadVideo.objects.get(pk=upload_id).status, 'CANCELADO')
+        self.assertFalse(os.path.exists(os.path.join(self.media, 'uploads_parciais', f'{upload_id}.part')))
+
+
+class ArmazenamentoVideoTests(MidiaTemporariaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.outra = Turma.objects.create(nome='Jazz', modalidade='JAZZ', nivel='INICIANTE', professor=self.professor)
+
+    def _aula(self, turma, dia, conteudo):
+        return Aula.objects.create(
+            turma=turma, data=date(2025, 3, dia), hora_inicio=time(18, 0), hora_fim=time(19, 0),
+            video=SimpleUploadedFile(f'aula{dia}.mp4', conteudo, content_type='video/mp4'),
+        )
+
+    def test_tamanho_medido_no_upload_e_somado_no_banco(self):
+        aula = self._aula(self.turma, 10, b'a' * 300)
+        self._aula(self.turma, 11, b'b' * 200)
+        self._aula(self.outra, 12, b'c' * 50)
+        aula.refresh_from_db()
+        self.assertEqual(aula.video_tamanho, 300)
+        self.assertEqual(aula.video_checksum, hashlib.sha256(b'a' * 300).hexdigest())
+
+        videos.processar_videos_pendentes(limite=1, workers=1, transcodificar=transcodificar_fake)
+        with self.assertNumQueries(1):
+            uso = armazenamento.uso_por_turma()
+        self.assertEqual(
+            [(linha['turma__nome'], linha['videos'], linha['bytes_originais']) for linha in uso],
+            [('Ballet Iniciante', 2, 500), ('Jazz', 1, 50)],
+        )
+        # Versões 'web' + '360p' + poster do transcodificador fake
+        self.assertEqual(uso[0]['bytes_processados'], 403)
+        mes = armazenamento.uso_por_mes()
+        self.assertEqual([(linha['mes'], linha['bytes_total']) for linha in mes], [(timezone.localdate().replace(day=1), 953)])
+
+    def test_reconciliacao_detecta_e_corrige_divergencias(self):
+        aula = self._aula(self.turma, 10, b'a' * 300)
+        sumida = self._aula(self.turma, 11, b'b' * 200)
+        Aula.objects.filter(pk=aula.pk).update(video_tamanho=0, video_checksum='')
+        os.remove(os.path.join(self.media, sumida.video.name))
+        orfao = os.path.join(self.media, 'aulas', 'videos', 'esquecido.mp4')
+        with open(orfao, 'wb') as arquivo:
+            arquivo.write(b'x')
+
+        relatorio = armazenamento.reconciliar(corrigir=True)
+        self.assertEqual(relatorio['divergentes'], [aula.pk])
+        self.assertEqual(relatorio['ausentes'], [sumida.pk])
+        self.assertEqual(relatorio['orfaos'], ['aulas/videos/esquecido.mp4'])
+        aula.refresh_from_db()
+        self.assertEqual((aula.video_tamanho, aula.video_checksum), (300, hashlib.sha256(b'a' * 300).hexdigest()))
+
+        with open(os.path.join(self.media, aula.video.name), 'wb') as arquivo:
+            arquivo.write(b'z' * 300)
+        self.assertEqual(armazenamento.reconciliar(checksum=True)['corrompidos'], [aula.pk])
+
+
+class RetencaoVideosTests(MidiaTemporariaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.outra = Turma.objects.create(nome='Jazz', modalidade='JAZZ', nivel='INICIANTE', professor=self.professor)
+        self.agora = timezone.now()
+
+    def _aula(self, turma, dia, mb, dias_upload, visto_ha=None):
+        aula = Aula.objects.create(
+            turma=turma, data=date(2025, 3, dia), hora_inicio=time(18, 0), hora_fim=time(19, 0),
+            video=SimpleUploadedFile(f'aula{dia}.mp4', b'v', content_type='video/mp4'),
+        )
+        Aula.objects.filter(pk=aula.pk).update(
+            video_tamanho=mb * retencao.MB, data_upload_video=self.agora - timedelta(days=dias_upload),
+            video_ultima_visualizacao=self.agora - timedelta(days=visto_ha) if visto_ha is not None else None,
+        )
+        return aula
+
+    def _selecionados(self, **politica):
+        politica = {**retencao.POLITICA_PADRAO, 'dias': None, **politica}
+        return {video.aula_id: video.motivo for video in retencao.selecionar(politica, self.agora)}
+
+    def test_politicas(self):
+        antiga = self._aula(self.turma, 1, 10, dias_upload=40)
+        pouco_vista = self._aula(self.turma, 2, 10, dias_upload=5, visto_ha=4)
+        vista = self._aula(self.turma, 3, 10, dias_upload=5, visto_ha=0)
+        jazz = self._aula(self.outra, 4, 15, dias_upload=5, visto_ha=1)
+
+        self.assertEqual(self._selecionados(dias=30), {antiga.pk: 'idade'})
+        # Manter a mais recente de cada turma protege de todas as políticas
+        self.assertEqual(self._selecionados(dias=1, manter_recentes=1), {antiga.pk: 'idade', pouco_vista.pk: 'idade'})
+        # Cota: sai o menos visto da turma (a antiga conta como vista no upload)
+        self.assertEqual(self._selecionados(cota_turma_mb=20), {antiga.pk: 'cota_turma'})
+        self.assertEqual(
+            self._selecionados(cota_turma_mb=10),
+            {antiga.pk: 'cota_turma', pouco_vista.pk: 'cota_turma', jazz.pk: 'cota_turma'},
+        )
+        # Orçamento global em ordem LRU, entre turmas
+        self.assertEqual(
+            self._selecionados(orcamento_mb=20), {antiga.pk: 'orcamento', pouco_vista.pk: 'orcamento', jazz.pk: 'orcamento'}
+        )
+        self.assertNotIn(vista.pk, self._selecionados(orcamento_mb=0, manter_recentes=1))
+
+    def test_comando_remove_em_lote_sem_interacao(self):
+        antiga = self._aula(self.turma, 1, 10, dias_upload=40)
+        recente = self._aula(self.turma, 2, 10, dias_upload=1)
+        videos.processar_videos_pendentes(workers=1, transcodificar=transcodificar_fake)
+        antiga.refresh_from_db()
+        arquivos = [antiga.video.name, antiga.video_poster.name] + list(antiga.versoes_video.values_list('arquivo', flat=True))
+
+        saida = io.StringIO()
+        with mock.patch('builtins.input', side_effect=AssertionError('interativo')):
+            call_command('limpar_videos_antigos', '--dias', '30', '--manter-recentes', '0', '--json', stdout=saida)
+        relatorio = json.loads(saida.getvalue())
+        self.assertEqual(relatorio['videos_removidos'], 1)
+        self.assertEqual(relatorio['por_politica']['idade']['videos'], 1)
+        self.assertEqual(relatorio['bytes_liberados'], 10 * retencao.MB + 403)
+        self.assertEqual(relatorio['erros'], [])
+
+        antiga.refresh_from_db()
+        self.assertFalse(antiga.video)
+        self.assertEqual((antiga.video_tamanho, antiga.video_status), (0, ''))
+        self.assertFalse(VersaoVideo.objects.filter(aula=antiga).exists())
+        self.assertFalse(any(os.path.exists(os.path.join(self.media, nome)) for nome in arquivos))
+        recente.refresh_from_db()
+        self.assertTrue(recente.video)
+
+    def test_video_trocado_depois_da_selecao_nao_e_removido(self):
+        antiga = self._aula(self.turma, 1, 10, dias_upload=40)
+        selecionados = retencao.selecionar({**retencao.POLITICA_PADRAO, 'dias': 30}, self.agora)
+        self.assertEqual([video.aula_id for video in selecionados], [antiga.pk])
+
+        # O professor envia um vídeo novo antes da retenção aplicar
+        antiga.video = SimpleUploadedFile('novo.mp4', b'novo', content_type='video/mp4')
+        antiga.save()
+        relatorio = retencao.aplicar(selecionados, workers=1)
+        self.assertEqual(relatorio['ignorados'], [antiga.pk])
+        self.assertEqual((relatorio['videos_removidos'], relatorio['bytes_liberados']), (0, 0))
+        antiga.refresh_from_db()
+        self.assertTrue(os.path.exists(os.path.join(self.media, antiga.video.name)))
+
+    def test_avisa_quando_ha_videos_sem_tamanho(self):
+        self._aula(self.turma, 1, 0, dias_upload=1)
+        self._aula(self.turma, 2, 10, dias_upload=1)
+        with self.assertLogs('paginas.retencao', 'WARNING') as logs:
+            relatorio = retencao.executar({**retencao.POLITICA_PADRAO, 'dias': None, 'orcamento_mb': 5}, workers=1, simular=True)
+        self.assertEqual(relatorio['sem_tamanho'], 1)
+        self.assertIn('reconciliar_videos', logs.output[0])
+
+    def test_visualizacao_registrada_no_maximo_uma_vez_por_hora(self):
+        aula = self._aula(self.turma, 1, 1, dias_upload=1)
+        self.client.force_login(self.usuario)
+        self.client.get(aula.url_video(), HTTP_RANGE='bytes=0-0')
+        aula.refresh_from_db()
+        primeira = aula.video_ultima_visualizacao
+        self.assertIsNotNone(primeira)
+        with self.assertNumQueries(1):
+            retencao.registrar_visualizacao(aula.pk)
+        aula.refresh_from_db()
+        self.assertEqual(aula.video_ultima_visualizacao, primeira)
+
+
+class MigracoesDeDadosTests(TransactionTestCase):
+    """Migrações que preenchem tabelas e campos novos a partir dos dados existentes"""
+
+    def _migrar(self, alvo):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([('paginas', alvo)])
+        return executor.loader.project_state([('paginas', alvo)]).apps
+
+    def tearDown(self):
+        call_command('migrate', 'paginas', verbosity=0)
+
+    def test_resumo_de_frequencia_preenchido_na_migracao(self):
+        apps = self._migrar('0017_dia_sem_aula')
+        usuario = apps.get_model('auth', 'User').objects.create(username='antiga')
+        turma = apps.get_model('paginas', 'Turma').objects.create(nome='Jazz', modalidade='JAZZ', nivel='INICIANTE')
+        aluno = apps.get_model('paginas', 'Aluno').objects.create(
+            usuario=usuario, cpf='333.333.333-33', data_nascimento=date(2000, 1, 1)
+        )
+        Aula = apps.get_model('paginas', 'Aula')
+        Frequencia = apps.get_model('paginas', 'Frequencia')
+        for dia, status in ((3, 'PRESENTE'), (10, 'FALTA'), (17, 'ATESTADO')):
+            aula = Aula.objects.create(turma=turma, data=date(2024, 5, dia), hora_inicio=time(18, 0), hora_fim=time(19, 0))
+            Frequencia.objects.create(aluno=aluno, aula=aula, status=status)
+
+        apps = self._migrar('0018_resumo_frequencia_mensal')
+        self.assertEqual(
+            list(apps.get_model('paginas', 'ResumoFrequenciaMensal').objects.values_list(
+                'aluno_id', 'mes', 'total', 'presencas', 'faltas', 'justificadas'
+            )),
+            [(aluno.pk, date(2024, 5, 1), 3, 1, 1, 1)]
+        )
+
+    def test_tamanho_dos_videos_medido_na_migracao(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        os.makedirs(os.path.join(media, 'aulas', 'processados', '1'))
+        for nome, tamanho in (('aulas/antigo.mp4', 1500), ('aulas/processados/1/poster.jpg', 30)):
+            with open(os.path.join(media, nome), 'wb') as arquivo:
+                arquivo.write(b'x' * tamanho)
+
+        apps = self._migrar('0020_upload_video')
+        turma = apps.get_model('paginas', 'Turma').objects.create(nome='Jazz', modalidade='JAZZ', nivel='INICIANTE')
+        Aula = apps.get_model('paginas', 'Aula')
+        aula = Aula.objects.create(
+            turma=turma, data=date(2024, 5, 3), hora_inicio=time(18, 0), hora_fim=time(19, 0),
+            video='aulas/antigo.mp4', video_poster='aulas/processados/1/poster.jpg',
+        )
+        sumido = Aula.objects.create(
+            turma=turma, data=date(2024, 5, 10), hora_inicio=time(18, 0), hora_fim=time(19, 0), video='aulas/sumido.mp4',
+        )
+        apps.get_model('paginas', 'VersaoVideo').objects.create(
+            aula=aula, nome='web', arquivo='aulas/processados/1/web.mp4', largura=1280, altura=720, tamanho_bytes=200,
+        )
+
+        with override_settings(MEDIA_ROOT=media):
+            apps = self._migrar('0021_tamanho_video')
+        medidas = dict(
+            (pk, (tamanho, processados)) for pk, tamanho, processados in apps.get_model('paginas', 'Aula').objects.values_list(
+                'pk', 'video_tamanho', 'video_tamanho_processados'
+            )
+        )
+        self.assertEqual(medidas, {aula.pk: (1500, 230), sumido.pk: (0, 0)})
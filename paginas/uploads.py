@@ -0,0 +1,224 @@
+"""
+Upload em partes, retomável, do vídeo das aulas.
+
+Com FILE_UPLOAD_MAX_MEMORY_SIZE e DATA_UPLOAD_MAX_MEMORY_SIZE em 50MB, um
+vídeo enviado pelo formulário ficava inteiro na memória do worker, e uma
+conexão que caía obrigava a enviar tudo de novo.
+
+Fluxo (views iniciar_upload_video / parte_upload_video):
+    1. POST com {nome, tamanho}: extensão e tamanho total são validados antes
+       de qualquer byte, e é criado um UploadVideo.
+    2. PATCH com a próxima parte no corpo e o cabeçalho Upload-Offset. A parte
+       é lida do request em blocos direto para o disco (nunca inteira na
+       memória) e só é anexada ao arquivo .part se o offset for o esperado.
+       Na primeira parte a assinatura do arquivo precisa bater com a extensão.
+    3. GET devolve quantos bytes já chegaram, para retomar de onde parou.
+
+Quando o último byte chega, o .part é movido (rename, mesma partição de
+MEDIA_ROOT) para o caminho final do vídeo e a Aula passa a apontar para ele
+com um save(update_fields=...), que dispara os sinais de sempre (fila de
+processamento, caches). Nenhum arquivo incompleto fica visível.
+
+Duas requisições com o mesmo offset: só a que avançar `recebido` com um
+UPDATE condicional anexa a parte; a outra recebe 409 com o offset atual.
+`recebido` só volta para o tamanho do .part quando a reserva venceu
+(prazo_reserva), nunca enquanto outra requisição ainda copia a parte.
+"""
+import os
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import (
+    Aula, UploadVideo, VIDEO_EXTENSOES, medir_arquivo, validar_tamanho_video, video_upload_path,
+)
+
+BLOCO_LEITURA = 64 * 1024
+
+
+class ConflitoOffset(Exception):
+    """A parte não começa onde o upload parou"""
+
+    def __init__(self, recebido):
+        super().__init__(f'O upload está em {recebido} bytes')
+        self.recebido = recebido
+
+
+def tamanho_maximo_parte():
+    return getattr(settings, 'VIDEO_UPLOAD_TAMANHO_PARTE', 5 * 1024 * 1024)
+
+
+def pasta_parciais():
+    return getattr(settings, 'VIDEO_UPLOAD_PASTA', None) or os.path.join(settings.MEDIA_ROOT, 'uploads_parciais')
+
+
+def caminho_parcial(upload):
+    return os.path.join(pasta_parciais(), f'{upload.pk}.part')
+
+
+def validar_extensao(nome):
+    extensao = os.path.splitext(nome)[1].lower().lstrip('.')
+    if extensao not in VIDEO_EXTENSOES:
+        raise ValidationError(f'Formato não suportado. Envie um destes: {", ".join(VIDEO_EXTENSOES).upper()}.')
+    return extensao
+
+
+def validar_assinatura(extensao, inicio):
+    """Confere os primeiros bytes do arquivo com a extensão declarada"""
+    if extensao in ('mp4', 'mov'):
+        valido = inicio[4:8] in (b'ftyp', b'moov', b'mdat', b'free', b'wide', b'skip')
+    elif extensao == 'webm':
+        valido = inicio[:4] == b'\x1a\x45\xdf\xa3'
+    else:
+        valido = inicio[:4] == b'RIFF' and inicio[8:12] == b'AVI '
+    if not valido:
+        raise ValidationError(f'O conteúdo do arquivo não é um vídeo {extensao.upper()}.')
+
+
+def iniciar(aula, usuario, nome, tamanho):
+    validar_extensao(nome)
+    if tamanho <= 0:
+        raise ValidationError('Tamanho do arquivo inválido.')
+    validar_tamanho_video(tamanho)
+    os.makedirs(pasta_parciais(), exist_ok=True)
+    upload = UploadVideo.objects.create(aula=aula, usuario=usuario, nome_arquivo=os.path.basename(nome), tamanho=tamanho)
+    open(caminho_parcial(upload), 'wb').close()
+    return upload
+
+
+def _bytes_no_disco(upload):
+    try:
+        return os.path.getsize(caminho_parcial(upload))
+    except OSError:
+        return 0
+
+
+def prazo_reserva():
+    """Tempo que uma parte reservada tem para ser anexada ao .part"""
+    return timedelta(seconds=getattr(settings, 'VIDEO_UPLOAD_RESERVA_SEGUNDOS', 5 * 60))
+
+
+def recebido(upload):
+    """
+    Bytes confirmados. Se o processo caiu entre reservar o offset e anexar a
+    parte, o arquivo fica menor que `recebido`: depois de prazo_reserva() sem
+    atividade, vale o que está no disco. Antes disso a parte ainda pode estar
+    sendo copiada (o cliente que reenviou depois de um timeout recebe 409).
+    """
+    no_disco = _bytes_no_disco(upload)
+    if no_disco < upload.recebido:
+        limite = timezone.now() - prazo_reserva()
+        if UploadVideo.objects.filter(
+            pk=upload.pk, recebido=upload.recebido, data_atualizacao__lt=limite
+        ).update(recebido=no_disco, data_atualizacao=timezone.now()):
+            upload.recebido = no_disco
+    return upload.recebido
+
+
+def receber_parte(upload, offset, stream, tamanho_parte):
+    """
+    Grava a parte lida de `stream` (tamanho_parte bytes) na posição `offset`.
+    Retorna o total recebido; conclui o upload no último byte.
+    """
+    if upload.status != 'ABERTO':
+        raise ValidationError('Este upload não está mais aberto.')
+    atual = recebido(upload)
+    if offset != atual:
+        raise ConflitoOffset(atual)
+    if tamanho_parte > tamanho_maximo_parte():
+        raise ValidationError(f'Cada parte pode ter no máximo {tamanho_maximo_parte() // (1024 * 1024)}MB.')
+    if offset + tamanho_parte > upload.tamanho:
+        raise ValidationError('A parte passa do tamanho anunciado do arquivo.')
+
+    # Lê a parte para um temporário: nada entra no .part antes de chegar inteira
+    with tempfile.NamedTemporaryFile(dir=pasta_parciais(), suffix='.parte') as temporario:
+        faltando = tamanho_parte
+        while faltando > 0:
+            dados = stream.read(min(BLOCO_LEITURA, faltando))
+            if not dados:
+                raise ValidationError('A conexão terminou antes do fim da parte.')
+            if offset == 0 and faltando == tamanho_parte:
+                validar_assinatura(validar_extensao(upload.nome_arquivo), dados[:12])
+            temporario.write(dados)
+            faltando -= len(dados)
+        temporario.flush()
+
+        # Reserva o intervalo: só uma requisição com este offset anexa
+        if not UploadVideo.objects.filter(pk=upload.pk, status='ABERTO', recebido=offset).update(
+            recebido=F('recebido') + tamanho_parte, data_atualizacao=timezone.now()
+        ):
+            upload.refresh_from_db(fields=['recebido', 'status'])
+            raise ConflitoOffset(upload.recebido)
+        temporario.seek(0)
+        with open(caminho_parcial(upload), 'r+b') as parcial:
+            parcial.seek(offset)
+            parcial.truncate()
+            while True:
+                dados = temporario.read(BLOCO_LEITURA)
+                if not dados:
+                    break
+                parcial.write(dados)
+    upload.recebido = offset + tamanho_parte
+
+    if upload.recebido == upload.tamanho:
+        concluir(upload)
+    return upload.recebido
+
+
+class _ArquivoMontado(File):
+    """Faz o FileSystemStorage mover o .part (rename) em vez de copiar"""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def concluir(upload):
+    """Move o arquivo montado para o lugar do vídeo e aponta a aula para ele"""
+    caminho = caminho_parcial(upload)
+    if _bytes_no_disco(upload) != upload.tamanho:
+        raise ValidationError('O arquivo montado não tem o tamanho anunciado.')
+
+    aula = Aula.objects.select_related('turma').get(pk=upload.aula_id)
+    with open(caminho, 'rb') as arquivo:
+        tamanho, checksum = medir_arquivo(File(arquivo))
+        nome = default_storage.save(video_upload_path(aula, upload.nome_arquivo), _ArquivoMontado(arquivo))
+
+    anterior = aula.video.name if aula.video else ''
+    with transaction.atomic():
+        if not UploadVideo.objects.filter(pk=upload.pk, status='ABERTO').update(status='CONCLUIDO'):
+            # Cancelado (ou concluído por outra requisição) enquanto isso
+            default_storage.delete(nome)
+            raise ValidationError('Este upload não está mais aberto.')
+        aula.video.name = nome
+        aula.video_tamanho, aula.video_checksum = tamanho, checksum
+        aula.data_upload_video = timezone.now()
+        aula.save(update_fields=['video', 'data_upload_video'])
+    upload.status = 'CONCLUIDO'
+    if os.path.exists(caminho):
+        os.remove(caminho)
+    if anterior and anterior != nome:
+        transaction.on_commit(lambda: default_storage.delete(anterior))
+    return aula
+
+
+def cancelar(upload):
+    UploadVideo.objects.filter(pk=upload.pk, status='ABERTO').update(status='CANCELADO')
+    upload.status = 'CANCELADO'
+    if os.path.exists(caminho_parcial(upload)):
+        os.remove(caminho_parcial(upload))
+
+
+def limpar_abandonados(horas=24):
+    """Cancela os uploads parados há mais de `horas` e apaga os .part. Retorna quantos"""
+    limite = timezone.now() - timedelta(hours=horas)
+    abandonados = list(UploadVideo.objects.filter(status='ABERTO', data_atualizacao__lt=limite))
+    for upload in abandonados:
+        cancelar(upload)
+    return len(abandonados)
@@ -85,6 +85,17 @@ urlpatterns = [
     # API Endpoints
     path('api/enviar-mensagem/', views.enviar_mensagem, name='enviar_mensagem'),
     path('api/grafico-frequencia/', views.grafico_frequencia, name='grafico_frequencia'),
+    path('api/aulas/<int:aula_id>/frequencias/', views.frequencias_aula, name='frequencias_aula'),
+    
+    # Vídeos das aulas (com login e Range)
+    path('aulas/<int:aula_id>/video/', views.video_aula, name='video_aula'),
+    path('aulas/<int:aula_id>/video/<str:versao>/', views.video_aula, name='video_aula_versao'),
+    path('api/aulas/<int:aula_id>/video/upload/', views.iniciar_upload_video, name='iniciar_upload_video'),
+    path('api/uploads-video/<uuid:upload_id>/', views.parte_upload_video, name='parte_upload_video'),
+    
+    # Feeds iCalendar (assinatura no lugar do login)
+    path('ical/aluno/<int:aluno_id>/<str:token>.ics', views.feed_ical_aluno, name='feed_ical_aluno'),
+    path('ical/turma/<int:turma_id>/<str:token>.ics', views.feed_ical_turma, name='feed_ical_turma'),
     path('api/notificacoes/', views.listar_notificacoes, name='listar_notificacoes'),
     path('api/notificacoes/<int:notificacao_id>/lida/', views.marcar_notificacao_lida, name='marcar_notificacao_lida'),
     path('api/contato-consultor/', views.contato_consultor, name='contato_consultor'),
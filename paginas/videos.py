@@ -0,0 +1,319 @@
+"""
+Processamento dos vídeos das aulas em segundo plano.
+
+O upload original (MP4/WebM/AVI/MOV de até 50MB) era servido como veio:
+download pesado no celular e, sem o moov no início, sem avanço rápido.
+
+Fila:
+    Salvar uma Aula com vídeo novo não processa nada. O sinal
+    (paginas/signals.py) só marca video_status='PENDENTE'; o comando
+    processar_videos reserva as aulas pendentes (reserva com prazo em
+    video_proxima_tentativa, como a fila do calendário, de três vezes
+    VIDEO_TIMEOUT_SEGUNDOS mais uma folga) e as processa em um
+    pool de threads. Falhas voltam para a fila com backoff exponencial e
+    jitter até MAX_TENTATIVAS.
+
+Processamento (ffmpeg local, FFMPEG_BIN/FFPROBE_BIN):
+    - uma única execução do ffmpeg decodifica o original uma vez e gera o
+      MP4 'web' (H.264/AAC, até 1080p, -movflags +faststart) e as versões
+      de VIDEO_RENDICOES menores que o original;
+    - uma segunda execução extrai a miniatura (poster) em JPEG.
+    Cada versão vira um VersaoVideo com tamanho, dimensões e bitrate. Se
+    algo falha depois de parte das saídas já estar no storage, elas são
+    apagadas antes de a aula voltar para a fila.
+
+Se o vídeo da aula for trocado durante o processamento, o resultado é
+descartado e a aula continua na fila para o vídeo novo.
+"""
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import painel_cache
+from .filas import calcular_backoff
+from .models import Aluno, Aula, VersaoVideo
+
+logger = logging.getLogger(__name__)
+
+MAX_TENTATIVAS = 4
+BACKOFF_BASE_SEGUNDOS = 60
+BACKOFF_MAXIMO_SEGUNDOS = 6 * 60 * 60
+# Folga da reserva além das três execuções (ffprobe, transcodificação, poster)
+MARGEM_RESERVA_SEGUNDOS = 10 * 60
+ALTURA_MAXIMA_WEB = 1080
+LARGURA_POSTER = 640
+PASTA_PROCESSADOS = 'aulas/processados'
+
+
+class ErroTranscodificacao(Exception):
+    pass
+
+
+def _ffmpeg():
+    return getattr(settings, 'FFMPEG_BIN', 'ffmpeg')
+
+
+def _ffprobe():
+    return getattr(settings, 'FFPROBE_BIN', 'ffprobe')
+
+
+def _timeout():
+    return getattr(settings, 'VIDEO_TIMEOUT_SEGUNDOS', 15 * 60)
+
+
+def _tempo_reserva():
+    # Cada execução do ffmpeg/ffprobe pode levar até _timeout(): a reserva
+    # não pode vencer com o worker ainda trabalhando
+    return timedelta(seconds=3 * _timeout() + MARGEM_RESERVA_SEGUNDOS)
+
+
+def _rendicoes():
+    # (nome, altura, bitrate de vídeo em kbps, bitrate de áudio em kbps)
+    return settings.VIDEO_RENDICOES
+
+
+# ---------------------------------------------------------
+# FFMPEG
+# ---------------------------------------------------------
+
+def executar(comando):
+    """Roda ffmpeg/ffprobe e devolve o stdout; erros viram ErroTranscodificacao"""
+    try:
+        resultado = subprocess.run(comando, capture_output=True, timeout=_timeout(), check=False)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise ErroTranscodificacao(f'{comando[0]}: {e}') from e
+    if resultado.returncode != 0:
+        erro = resultado.stderr.decode(errors='replace').strip().splitlines()[-5:]
+        raise ErroTranscodificacao(f'{comando[0]} saiu com {resultado.returncode}: ' + ' | '.join(erro))
+    return resultado.stdout
+
+
+def sondar(caminho, executar=executar):
+    """(largura, altura, duração em segundos) do primeiro stream de vídeo"""
+    saida = json.loads(executar([
+        _ffprobe(), '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height:format=duration', '-of', 'json', caminho,
+    ]) or b'{}')
+    streams = saida.get('streams') or []
+    if not streams:
+        raise ErroTranscodificacao('O arquivo não tem stream de vídeo')
+    duracao = float((saida.get('format') or {}).get('duration') or 0)
+    return int(streams[0]['width']), int(streams[0]['height']), duracao
+
+
+def _dimensoes(largura, altura, nova_altura):
+    # Largura par, como o scale=-2 do ffmpeg
+    nova_largura = round(largura * nova_altura / altura / 2) * 2
+    return nova_largura, nova_altura
+
+
+def comando_transcodificacao(origem, pasta, largura, altura):
+    """
+    Comando único do ffmpeg para a versão 'web' e as menores. Retorna
+    (comando, [(nome, caminho, largura, altura, bitrate_kbps), ...]).
+    """
+    comando = [_ffmpeg(), '-hide_banner', '-nostdin', '-y', '-i', origem]
+    saidas = []
+
+    altura_web = min(altura, ALTURA_MAXIMA_WEB)
+    caminho = os.path.join(pasta, 'web.mp4')
+    comando += [
+        '-map', '0:v:0', '-map', '0:a:0?',
+        '-vf', f'scale=-2:{altura_web}', '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23',
+        '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-b:a', '128k', '-movflags', '+faststart', caminho,
+    ]
+    saidas.append(('web', caminho, *_dimensoes(largura, altura, altura_web), 0))
+
+    for nome, altura_versao, video_kbps, audio_kbps in _rendicoes():
+        if altura_versao >= altura_web:
+            continue
+        caminho = os.path.join(pasta, f'{nome}.mp4')
+        comando += [
+            '-map', '0:v:0', '-map', '0:a:0?',
+            '-vf', f'scale=-2:{altura_versao}', '-c:v', 'libx264', '-preset', 'veryfast',
+            '-b:v', f'{video_kbps}k', '-maxrate', f'{video_kbps}k', '-bufsize', f'{video_kbps * 2}k',
+            '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-b:a', f'{audio_kbps}k', '-movflags', '+faststart', caminho,
+        ]
+        saidas.append((nome, caminho, *_dimensoes(largura, altura, altura_versao), video_kbps + audio_kbps))
+    return comando, saidas
+
+
+def comando_poster(origem, caminho, duracao):
+    # Um segundo depois do início, ou o meio de clipes muito curtos
+    instante = min(1.0, duracao / 2) if duracao else 0
+    return [
+        _ffmpeg(), '-hide_banner', '-nostdin', '-y', '-ss', f'{instante:.2f}', '-i', origem,
+        '-frames:v', '1', '-vf', f'scale={LARGURA_POSTER}:-2', caminho,
+    ]
+
+
+def transcodificar(origem, pasta, executar=executar):
+    """
+    Gera as versões e o poster de `origem` em `pasta`. Retorna
+    ([(nome, caminho, largura, altura, bitrate_kbps), ...], caminho_do_poster).
+    """
+    largura, altura, duracao = sondar(origem, executar)
+    comando, saidas = comando_transcodificacao(origem, pasta, largura, altura)
+    executar(comando)
+    poster = os.path.join(pasta, 'poster.jpg')
+    executar(comando_poster(origem, poster, duracao))
+    return saidas, poster
+
+
+# ---------------------------------------------------------
+# FILA
+# ---------------------------------------------------------
+
+def enfileirar(aula_ids):
+    """Coloca (ou recoloca) o vídeo das aulas na fila de processamento"""
+    return Aula.objects.filter(pk__in=list(aula_ids)).exclude(video='').exclude(video__isnull=True).update(
+        video_status='PENDENTE', video_tentativas=0, video_proxima_tentativa=None, video_erro='',
+    )
+
+
+def _disponiveis(agora):
+    # PROCESSANDO com a reserva vencida: o worker que a pegou morreu
+    return Aula.objects.filter(
+        Q(video_status='PENDENTE', video_proxima_tentativa__isnull=True) |
+        Q(video_status__in=['PENDENTE', 'PROCESSANDO'], video_proxima_tentativa__lte=agora)
+    )
+
+
+def _reservar(limite):
+    agora = timezone.now()
+    reserva = agora + _tempo_reserva()
+    ids = list(_disponiveis(agora).order_by('video_proxima_tentativa', 'id').values_list('id', flat=True)[:limite])
+    _disponiveis(agora).filter(pk__in=ids).update(
+        video_status='PROCESSANDO', video_tentativas=F('video_tentativas') + 1, video_proxima_tentativa=reserva
+    )
+    # A reserva serve de marca: aulas pegas por outro worker no meio tempo ficam de fora
+    return list(Aula.objects.filter(
+        pk__in=ids, video_status='PROCESSANDO', video_proxima_tentativa=reserva
+    ).values_list('pk', 'video', 'video_tentativas', 'video_proxima_tentativa'))
+
+
+def _invalidar_painel(aula_id):
+    """update()/bulk_create não disparam os sinais: o painel guarda status e versões"""
+    transaction.on_commit(lambda: painel_cache.invalidar_usuarios(
+        Aluno.objects.filter(turmas__aulas=aula_id).values_list('usuario_id', flat=True)
+    ))
+
+
+def apagar_processados(aula_id):
+    """Apaga as versões geradas da aula (o sinal de VersaoVideo remove os arquivos)"""
+    VersaoVideo.objects.filter(aula_id=aula_id).delete()
+
+
+def _guardar(pasta_destino, caminho):
+    with open(caminho, 'rb') as arquivo:
+        return default_storage.save(f'{pasta_destino}/{os.path.basename(caminho)}', File(arquivo))
+
+
+def processar_aula(aula_id, video, reserva, transcodificar=transcodificar):
+    """Processa o vídeo de uma aula reservada. Retorna o status final"""
+    salvos = []
+    try:
+        with tempfile.TemporaryDirectory(prefix='video-aula-') as pasta:
+            with default_storage.open(video, 'rb') as original:
+                # Cópia local: o storage pode não ser um disco (S3 etc.)
+                origem = os.path.join(pasta, 'original' + os.path.splitext(video)[1])
+                with open(origem, 'wb') as destino:
+                    shutil.copyfileobj(original, destino, 1024 * 1024)
+            saidas, poster = transcodificar(origem, pasta)
+
+            destino = f'{PASTA_PROCESSADOS}/{aula_id}'
+            versoes = []
+            for nome, caminho, largura, altura, bitrate in saidas:
+                salvos.append(_guardar(destino, caminho))
+                versoes.append(VersaoVideo(
+                    aula_id=aula_id, nome=nome, arquivo=salvos[-1], largura=largura,
+                    altura=altura, bitrate_kbps=bitrate, tamanho_bytes=os.path.getsize(caminho),
+                ))
+            salvos.append(_guardar(destino, poster))
+            nome_poster = salvos[-1]
+            tamanho_processados = sum(versao.tamanho_bytes for versao in versoes) + os.path.getsize(poster)
+    except Exception as e:
+        logger.warning('Falha ao processar o vídeo da aula %s: %s', aula_id, e)
+        # O que já foi para o storage não é de nenhuma VersaoVideo: ficaria órfão
+        for nome in salvos:
+            default_storage.delete(nome)
+        return _falhar(aula_id, video, reserva, str(e))
+
+    with transaction.atomic():
+        # Só vale se ninguém trocou o vídeo nem reservou a aula de novo
+        atual = Aula.objects.select_for_update().filter(
+            pk=aula_id, video=video, video_status='PROCESSANDO', video_proxima_tentativa=reserva
+        ).values_list('video_poster', flat=True).first()
+        if atual is None:
+            descartados = [versao.arquivo.name for versao in versoes] + [nome_poster]
+        else:
+            descartados = [atual] if atual else []
+            apagar_processados(aula_id)
+            VersaoVideo.objects.bulk_create(versoes)
+            Aula.objects.filter(pk=aula_id).update(
+                video_status='PRONTO', video_poster=nome_poster, video_proxima_tentativa=None, video_erro='',
+                video_tamanho_processados=tamanho_processados,
+            )
+            _invalidar_painel(aula_id)
+    for nome in descartados:
+        default_storage.delete(nome)
+    return 'PRONTO' if atual is not None else 'DESCARTADO'
+
+
+def _falhar(aula_id, video, reserva, erro):
+    aula = Aula.objects.filter(pk=aula_id, video=video, video_proxima_tentativa=reserva)
+    tentativas = aula.values_list('video_tentativas', flat=True).first()
+    if tentativas is None:
+        return 'DESCARTADO'
+    if tentativas >= MAX_TENTATIVAS:
+        aula.update(video_status='ERRO', video_erro=erro[:2000], video_proxima_tentativa=None)
+        _invalidar_painel(aula_id)
+        return 'ERRO'
+    aula.update(
+        video_status='PENDENTE', video_erro=erro[:2000],
+        video_proxima_tentativa=timezone.now() + calcular_backoff(
+            tentativas, BACKOFF_BASE_SEGUNDOS, BACKOFF_MAXIMO_SEGUNDOS
+        ),
+    )
+    return 'PENDENTE'
+
+
+def _processar_na_thread(aula_id, video, reserva, transcodificar):
+    try:
+        return processar_aula(aula_id, video, reserva, transcodificar)
+    finally:
+        # Cada thread do pool tem a própria conexão com o banco
+        close_old_connections()
+
+
+def processar_videos_pendentes(limite=4, workers=2, transcodificar=transcodificar):
+    """
+    Reserva até `limite` aulas e processa os vídeos com `workers` threads
+    (1 = na thread atual). Retorna um dict {status_final: quantidade}.
+    """
+    reservadas = _reservar(limite)
+    contagem = {}
+    if not reservadas:
+        return contagem
+
+    tarefas = [(aula_id, video, reserva, transcodificar) for aula_id, video, _, reserva in reservadas]
+    if workers <= 1:
+        resultados = [processar_aula(*tarefa) for tarefa in tarefas]
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='video') as pool:
+            resultados = list(pool.map(lambda tarefa: _processar_na_thread(*tarefa), tarefas))
+    for status in resultados:
+        contagem[status] = contagem.get(status, 0) + 1
+    return contagem
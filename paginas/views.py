@@ -5,9 +5,11 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth import logout as auth_logout
 from django.db.models import Q, Count, Prefetch, Sum
 from django.utils import timezone
-from django.http import JsonResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import PermissionDenied, ValidationError
 from django.contrib import messages
 from django.core.mail import send_mail, EmailMessage
 from django.conf import settings
@@ -17,12 +19,19 @@ from datetime import timedelta, datetime
 from .models import (
     Aluno, Turma, Aula, HorarioAula, Frequencia,
     Aviso, Mensalidade, Mensagem, Notificacao,
-    Evento, VendaIngresso, ResultadoFinanceiroMensal, DespesaAluno, DespesaAdministrativa, EntradaFinanceira
+    Evento, VendaIngresso, ResultadoFinanceiroMensal, DespesaAluno, DespesaAdministrativa, EntradaFinanceira,
+    UploadVideo, VersaoVideo,
 )
+from . import grade, ical, painel_cache, retencao, streaming, uploads
+from .dashboard import dados_painel_aluno, dados_horarios_aluno, dados_minhas_aulas_aluno
+from .paginacao import paginar_keyset
+from .financeiro import interpretar_janela, processar_meses_pendentes
+from .pagamentos import aplicar_pagamento, extrair_notificacao, preferencia_da_mensalidade, registrar_evento
+from .gateway_mp import ErroGateway, GatewayIndisponivel, obter_cliente
+from .frequencias import FrequenciaInvalida, registrar_frequencias, serie_frequencia, versao_serie
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from openpyxl.utils import get_column_letter
-import mercadopago
 from django.contrib.admin.views.decorators import staff_member_required
 
 # from chat.models import Room  # Comentado - módulo chat não existe
@@ -52,63 +61,12 @@ def painel_aluno_index(request):
     
 
     try:
-        # Usar select_related para otimizar queries
-        aluno = Aluno.objects.select_related('usuario').prefetch_related(
-            Prefetch('turmas', queryset=Turma.objects.filter(ativa=True))
-        ).get(usuario=request.user)
-        
-        turmas = aluno.turmas.filter(ativa=True)
-        
-        # Avisos recentes (últimos 7 dias)
-        data_limite = timezone.now() - timedelta(days=7)
-        avisos_recentes = Aviso.objects.filter(
-            Q(tipo='GERAL') | 
-            Q(turma__in=turmas) | 
-            Q(aluno=aluno),
-            ativo=True,
-            data_criacao__gte=data_limite
-        ).select_related('autor', 'turma').distinct().order_by('-importante', '-data_criacao')[:5]
-        
-        # Próximas aulas (próximos 7 dias)
-        hoje = timezone.now().date()
-        proximas_aulas = Aula.objects.filter(
-            turma__in=turmas,
-            data__gte=hoje,
-            data__lte=hoje + timedelta(days=7),
-            realizada=False
-        ).select_related('turma').order_by('data', 'hora_inicio')[:5]
-        
-        # Estatísticas de frequência
-        total_aulas = Frequencia.objects.filter(aluno=aluno).count()
-        presencas = Frequencia.objects.filter(aluno=aluno, status='PRESENTE').count()
-        faltas = Frequencia.objects.filter(aluno=aluno, status='FALTA').count()
-        percentual_presenca = (presencas / total_aulas * 100) if total_aulas > 0 else 0
-        
-        # Mensalidades pendentes
-        mensalidades_pendentes = Mensalidade.objects.filter(
-            aluno=aluno,
-            status__in=['PENDENTE', 'ATRASADO']
-        ).order_by('data_vencimento')[:3]
-        
-        # Mensagens não lidas
-        mensagens_nao_lidas = Mensagem.objects.filter(
-            destinatario=request.user,
-            lida=False
-        ).count()
-        
+        # Aluno, frequência e mensagens não lidas vêm de uma única consulta;
+        # visitas repetidas são servidas pelo cache do painel
         context = {
             'usuario': request.user,
             'username': request.user.get_full_name() or request.user.username,
-            'aluno': aluno,
-            'turmas': turmas,
-            'avisos_recentes': avisos_recentes,
-            'proximas_aulas': proximas_aulas,
-            'total_aulas': total_aulas,
-            'presencas': presencas,
-            'faltas': faltas,
-            'percentual_presenca': round(percentual_presenca, 1),
-            'mensalidades_pendentes': mensalidades_pendentes,
-            'mensagens_nao_lidas': mensagens_nao_lidas,
+            **painel_cache.obter_contexto('index', request.user, lambda: dados_painel_aluno(request.user)),
         }
     except Aluno.DoesNotExist:
         context['erro'] = 'Usuário não está cadastrado como aluno.'
@@ -135,12 +93,12 @@ def painel_aluno_avisos(request):
             Q(turma__in=turmas) | 
             Q(aluno=aluno),
             ativo=True
-        ).select_related('autor', 'turma', 'aluno').distinct().order_by('-importante', '-data_criacao')
+        ).select_related('autor', 'turma', 'aluno').distinct()
         
         context = {
             'usuario': request.user,
             'aluno': aluno,
-            'avisos': avisos_lista,
+            'avisos': paginar_keyset(request, avisos_lista, ['-importante', '-data_criacao', '-id']),
         }
     except Aluno.DoesNotExist:
         context['erro'] = 'Usuário não está cadastrado como aluno.'
@@ -155,47 +113,9 @@ def painel_aluno_horarios(request):
     context = {}
     
     try:
-        aluno = Aluno.objects.select_related('usuario').prefetch_related(
-            Prefetch('turmas', queryset=Turma.objects.filter(ativa=True))
-        ).get(usuario=request.user)
-        
-        turmas = aluno.turmas.filter(ativa=True)
-        
-        # Horários recorrentes (grade de horários)
-        horarios = HorarioAula.objects.filter(turma__in=turmas).select_related('turma').order_by('dia_semana', 'hora_inicio')
-        
-        # Organizar horários por dia da semana
-        horarios_por_dia = {}
-        for horario in horarios:
-            dia = horario.get_dia_semana_display()
-            if dia not in horarios_por_dia:
-                horarios_por_dia[dia] = []
-            
-            horarios_por_dia[dia].append(horario)
-        
-        # Próximas aulas (não realizadas e futuras)
-        hoje = timezone.now().date()
-        proximas_aulas = Aula.objects.filter(
-            turma__in=turmas,
-            data__gte=hoje,
-            realizada=False
-        ).select_related('turma').order_by('data', 'hora_inicio')[:10]
-        
-        # Últimas aulas realizadas COM vídeo (máximo 5)
-        aulas_com_video = Aula.objects.filter(
-            turma__in=turmas,
-            realizada=True,
-            video__isnull=False
-        ).exclude(video='').select_related('turma').order_by('-data', '-hora_inicio')[:5]
-        
         context = {
             'usuario': request.user,
-            'aluno': aluno,
-            'horarios': horarios,
-            'horarios_por_dia': horarios_por_dia,
-            'dias_semana': horarios_por_dia.keys(),
-            'proximas_aulas': proximas_aulas,
-            'aulas_com_video': aulas_com_video,
+            **painel_cache.obter_contexto('horarios', request.user, lambda: dados_horarios_aluno(request.user)),
         }
     except Aluno.DoesNotExist:
         context['erro'] = 'Usuário não está cadastrado como aluno.'
@@ -207,44 +127,12 @@ def painel_aluno_horarios(request):
 @login_required
 def painel_aluno_minhas_aulas(request):
     """Listar aulas do aluno com frequência"""
-    aulas_futuras = []
-    aulas_com_video = []
     context = {}
     
     try:
-        aluno = Aluno.objects.select_related('usuario').prefetch_related(
-            Prefetch('turmas', queryset=Turma.objects.filter(ativa=True))
-        ).get(usuario=request.user)
-        
-        turmas = aluno.turmas.filter(ativa=True)
-        
-        hoje = timezone.now().date()
-        
-        # Buscar aulas FUTURAS (próximos 30 dias)
-        data_limite_futuro = hoje + timedelta(days=30)
-        aulas_futuras_queryset = Aula.objects.filter(
-            turma__in=turmas,
-            data__gt=hoje,
-            data__lte=data_limite_futuro
-        ).select_related('turma').order_by('data', 'hora_inicio')
-        
-        # Adicionar dias até a aula
-        for aula in aulas_futuras_queryset:
-            dias_ate = (aula.data - hoje).days
-            aula.dias_ate_aula = dias_ate if dias_ate > 0 else 0
-            aulas_futuras.append(aula)
-        
-        # Buscar aulas COM VÍDEO (ordenadas por data decrescente)
-        aulas_com_video = Aula.objects.filter(
-            turma__in=turmas,
-            video__isnull=False
-        ).exclude(video='').select_related('turma').order_by('-data', '-hora_inicio')[:12]  # Últimas 12 aulas com vídeo
-        
         context = {
             'usuario': request.user,
-            'aluno': aluno,
-            'aulas_futuras': aulas_futuras,
-            'aulas_com_video': aulas_com_video,
+            **painel_cache.obter_contexto('minhas_aulas', request.user, lambda: dados_minhas_aulas_aluno(request.user)),
         }
     except Aluno.DoesNotExist:
         context['erro'] = 'Usuário não está cadastrado como aluno.'
@@ -352,44 +240,24 @@ def pagar_mensalidade(request, mensalidade_id):
         
         print(f"MP_ACCESS_TOKEN: {MP_ACCESS_TOKEN[:20]}...")
         print(f"MP_PUBLIC_KEY: {MP_PUBLIC_KEY[:20]}...")
-        
-        sdk = mercadopago.SDK(MP_ACCESS_TOKEN)
 
-        preference_data = {
-            "items": [
-                {
-                    "title": f"Mensalidade {mensalidade.mes_referencia.strftime('%m/%Y')}",
-                    "quantity": 1,
-                    "currency_id": "BRL",
-                    "unit_price": float(mensalidade.valor_final),
-                }
-            ],
-            "metadata": {
-                "mensalidade_id": str(mensalidade.id)
-            },
-            "statement_descriptor": "GIRO DNC",
-            "external_reference": f"MENS-{mensalidade.id}"
-        }
-
-        print(f"Criando preferência com dados: {preference_data}")
-        preference = sdk.preference().create(preference_data)
-        print(f"Resposta do MP: Status={preference.get('status')}")
-        
-        # Verificar se houve erro na criação
-        if preference["status"] != 201:
-            error_msg = preference.get("response", {}).get("message", "Erro desconhecido")
-            print(f"ERRO ao criar preferência: {error_msg}")
+        # Reaproveita a preferência já criada para este valor (sem ir ao gateway)
+        try:
+            preference_id = preferencia_da_mensalidade(mensalidade)
+        except GatewayIndisponivel:
+            raise
+        except ErroGateway as e:
+            print(f"ERRO ao criar preferência: {e}")
             
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({
-                    "error": f"Erro ao criar preferência: {error_msg}"
+                    "error": str(e)
                 }, status=500)
             else:
                 messages.error(request, "Erro ao processar pagamento. Tente novamente.")
                 return redirect('paginas:financeiro_mensalidades')
         
-        preference_id = preference["response"]["id"]
-        print(f"Preferência criada com sucesso! ID: {preference_id}")
+        print(f"Preferência: {preference_id}")
 
         # Se for requisição AJAX, retornar JSON
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -419,6 +287,13 @@ def pagar_mensalidade(request, mensalidade_id):
 
         return render(request, 'financeiro/mensalidades.html', context)
         
+    except GatewayIndisponivel:
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({
+                "error": "Pagamento indisponível no momento. Tente novamente em alguns minutos."
+            }, status=503)
+        messages.error(request, "Pagamento indisponível no momento. Tente novamente em alguns minutos.")
+        return redirect('paginas:financeiro_mensalidades')
     except Exception as e:
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({
@@ -430,55 +305,24 @@ def pagar_mensalidade(request, mensalidade_id):
 
 @csrf_exempt
 def webhook_mercadopago(request):
-    """Webhook para receber notificações do Mercado Pago"""
-    if request.method == 'POST':
-        try:
-            data = json.loads(request.body)
-            
-            # Log para debug
-            print(f"Webhook recebido: {data}")
-            
-            # Verificar se é notificação de pagamento
-            if data.get('type') == 'payment':
-                payment_id = data.get('data', {}).get('id')
-                
-                if payment_id:
-                    # Buscar informações do pagamento
-                    sdk = mercadopago.SDK(settings.MP_ACCESS_TOKEN)
-                    payment_info = sdk.payment().get(payment_id)
-                    
-                    if payment_info['status'] == 200:
-                        payment_data = payment_info['response']
-                        
-                        # Obter ID da mensalidade do metadata
-                        mensalidade_id = payment_data.get('metadata', {}).get('mensalidade_id')
-                        
-                        if mensalidade_id:
-                            mensalidade = Mensalidade.objects.get(id=mensalidade_id)
-                            
-                            # Atualizar status conforme o status do pagamento
-                            if payment_data['status'] == 'approved':
-                                mensalidade.status = 'PAGO'
-                                mensalidade.data_pagamento = timezone.now()
-                                mensalidade.save()
-                                
-                                # Criar notificação para o aluno
-                                Notificacao.objects.create(
-                                    usuario=mensalidade.aluno.usuario,
-                                    tipo='PAGAMENTO',
-                                    titulo='Pagamento Aprovado',
-                                    mensagem=f'Sua mensalidade de {mensalidade.mes_referencia.strftime("%m/%Y")} foi aprovada!'
-                                )
-                            elif payment_data['status'] == 'pending':
-                                mensalidade.observacoes = 'Pagamento pendente'
-                                mensalidade.save()
-            
-            return JsonResponse({'status': 'ok'})
-        except Exception as e:
-            print(f"Erro no webhook: {str(e)}")
-            return JsonResponse({'error': str(e)}, status=500)
+    """
+    Webhook para receber notificações do Mercado Pago.
+    Só grava o evento e confirma na hora; a consulta ao pagamento e a baixa
+    da mensalidade ficam com o comando processar_webhooks (paginas.pagamentos).
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método não permitido'}, status=405)
+    
+    try:
+        tipo, recurso_id, corpo = extrair_notificacao(request)
+    except ValueError:
+        return JsonResponse({'error': 'JSON inválido'}, status=400)
     
-    return JsonResponse({'error': 'Método não permitido'}, status=405)
+    if not recurso_id:
+        return JsonResponse({'status': 'ignorado'})
+    
+    registrar_evento(tipo, recurso_id, corpo)
+    return JsonResponse({'status': 'ok'})
 
 
 @csrf_exempt
@@ -496,9 +340,6 @@ def processar_pagamento(request):
             
         mensalidade = Mensalidade.objects.get(id=mensalidade_id)
         
-        # Inicializar SDK do Mercado Pago
-        sdk = mercadopago.SDK(settings.MP_ACCESS_TOKEN)
-        
         # Preparar dados do pagamento
         payment_data = {
             "transaction_amount": float(data.get('transaction_amount')),
@@ -523,25 +364,20 @@ def processar_pagamento(request):
         print(f"Enviando pagamento para Mercado Pago: {payment_data}")
         
         # Processar pagamento
-        payment_response = sdk.payment().create(payment_data)
+        # O token do cartão é de uso único: a mesma chave em uma repetição
+        # devolve o pagamento já criado em vez de cobrar de novo
+        payment_response = obter_cliente().criar_pagamento(
+            payment_data, chave_idempotencia=f"MENS-{mensalidade.id}-{data.get('token')}"
+        )
         payment = payment_response["response"]
         
         print(f"Resposta do Mercado Pago: {payment}")
         
-        # Atualizar mensalidade baseado no status
+        # Atualizar mensalidade baseado no status (idempotente: o webhook do
+        # mesmo pagamento não baixa nem notifica de novo)
+        aplicar_pagamento(payment)
+        
         if payment.get('status') == 'approved':
-            mensalidade.status = 'PAGO'
-            mensalidade.data_pagamento = timezone.now()
-            mensalidade.save()
-            
-            # Criar notificação
-            Notificacao.objects.create(
-                usuario=mensalidade.aluno.usuario,
-                tipo='PAGAMENTO',
-                titulo='Pagamento Aprovado',
-                mensagem=f'Sua mensalidade de {mensalidade.mes_referencia.strftime("%m/%Y")} foi aprovada!'
-            )
-            
             return JsonResponse({
                 'success': True,
                 'payment_id': payment.get('id'),
@@ -549,9 +385,6 @@ def processar_pagamento(request):
                 'status_detail': payment.get('status_detail')
             })
         elif payment.get('status') == 'pending':
-            mensalidade.observacoes = f"Pagamento pendente - {payment.get('status_detail')}"
-            mensalidade.save()
-            
             return JsonResponse({
                 'success': True,
                 'payment_id': payment.get('id'),
@@ -568,65 +401,14 @@ def processar_pagamento(request):
             
     except Mensalidade.DoesNotExist:
         return JsonResponse({'error': 'Mensalidade não encontrada'}, status=404)
+    except GatewayIndisponivel:
+        return JsonResponse({'error': 'Pagamento indisponível no momento. Tente novamente em alguns minutos.'}, status=503)
     except Exception as e:
         print(f"Erro ao processar pagamento: {str(e)}")
         import traceback
         traceback.print_exc()
         return JsonResponse({'error': str(e)}, status=500)
 
-@csrf_exempt
-def webhook_mercadopago_old(request):
-    """Webhook para receber notificações do Mercado Pago"""
-    if request.method == 'POST':
-        try:
-            data = json.loads(request.body)
-            
-            # Log para debug
-            print(f"Webhook recebido: {data}")
-            
-            # Verificar se é notificação de pagamento
-            if data.get('type') == 'payment':
-                payment_id = data.get('data', {}).get('id')
-                
-                if payment_id:
-                    # Buscar informações do pagamento
-                    sdk = mercadopago.SDK(settings.MP_ACCESS_TOKEN)
-                    payment_info = sdk.payment().get(payment_id)
-                    
-                    if payment_info['status'] == 200:
-                        payment_data = payment_info['response']
-                        
-                        # Obter ID da mensalidade do metadata
-                        mensalidade_id = payment_data.get('metadata', {}).get('mensalidade_id')
-                        
-                        if mensalidade_id:
-                            mensalidade = Mensalidade.objects.get(id=mensalidade_id)
-                            
-                            # Atualizar status conforme o status do pagamento
-                            if payment_data['status'] == 'approved':
-                                mensalidade.status = 'PAGO'
-                                mensalidade.data_pagamento = timezone.now()
-                                mensalidade.save()
-                                
-                                # Criar notificação para o aluno
-                                Notificacao.objects.create(
-                                    usuario=mensalidade.aluno.usuario,
-                                    tipo='PAGAMENTO',
-                                    titulo='Pagamento Aprovado',
-                                    mensagem=f'Sua mensalidade de {mensalidade.mes_referencia.strftime("%m/%Y")} foi aprovada!'
-                                )
-                            elif payment_data['status'] == 'pending':
-                                mensalidade.observacoes = 'Pagamento pendente'
-                                mensalidade.save()
-                                
-            return JsonResponse({'status': 'ok'})
-            
-        except Exception as e:
-            print(f"Erro no webhook: {str(e)}")
-            return JsonResponse({'error': str(e)}, status=500)
-    
-    return JsonResponse({'error': 'Method not allowed'}, status=405)
-
 @login_required
 def financeiro_extrato(request):
     """Exibir extrato financeiro do aluno"""
@@ -964,65 +746,231 @@ def enviar_mensagem(request):
             'error': f'Erro interno: {str(e)}'
         }, status=500)
 
+@login_required
+@require_http_methods(["GET", "POST"])
+def frequencias_aula(request, aula_id):
+    """
+    Chamada da aula para o tablet do professor.
+    GET devolve os alunos da turma com o status atual; POST grava a turma
+    inteira em uma requisição:
+        {"frequencias": [{"aluno_id": 1, "status": "PRESENTE", "justificativa": ""}, ...]}
+    """
+    aula = get_object_or_404(Aula.objects.select_related('turma'), id=aula_id)
+    if not (request.user.is_staff or aula.turma.professor_id == request.user.id):
+        return JsonResponse({'success': False, 'error': 'Sem permissão para esta aula.'}, status=403)
+    
+    if request.method == 'GET':
+        status_atual = dict(Frequencia.objects.filter(aula=aula).values_list('aluno_id', 'status'))
+        alunos = aula.turma.alunos.select_related('usuario').order_by('usuario__first_name')
+        return JsonResponse({
+            'aula_id': aula.id,
+            'alunos': [
+                {
+                    'aluno_id': aluno.id,
+                    'nome': aluno.usuario.get_full_name() or aluno.usuario.username,
+                    'status': status_atual.get(aluno.id),
+                }
+                for aluno in alunos
+            ],
+        })
+    
+    try:
+        itens = json.loads(request.body).get('frequencias')
+        if not isinstance(itens, list) or not itens:
+            raise ValueError
+        status_por_aluno = {int(item['aluno_id']): item.get('status', 'PRESENTE') for item in itens}
+        # null vira texto vazio; outro tipo (número, lista) é erro do cliente
+        justificativas = {
+            int(item['aluno_id']): item['justificativa'] or '' for item in itens if 'justificativa' in item
+        }
+        if not all(isinstance(texto, str) for texto in justificativas.values()):
+            raise TypeError
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return JsonResponse({
+            'success': False,
+            'error': 'Envie {"frequencias": [{"aluno_id": ..., "status": ...}]}.'
+        }, status=400)
+    
+    try:
+        registradas = registrar_frequencias(aula, status_por_aluno, justificativas or None)
+    except FrequenciaInvalida as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    
+    return JsonResponse({'success': True, 'aula_id': aula.id, 'registradas': registradas})
+
+def _resposta_feed_ical(request, tipo, pk, nome, turma_ids):
+    """StreamingHttpResponse do feed, ou 304 se o calendário já tem esta versão"""
+    inicio = ical.inicio_da_janela()
+    versao = ical.versoes(turma_ids)
+    etag = ical.etag_feed(tipo, pk, versao, inicio)
+    
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = StreamingHttpResponse(
+            ical.gerar_feed(nome, versao, inicio), content_type='text/calendar; charset=utf-8'
+        )
+        response['Content-Disposition'] = f'inline; filename="{tipo}-{pk}.ics"'
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+@require_http_methods(["GET", "HEAD"])
+def feed_ical_aluno(request, aluno_id, token):
+    """Feed .ics das turmas ativas do aluno (URL assinada, sem login)"""
+    if not ical.token_valido('aluno', aluno_id, token):
+        return HttpResponse(status=404)
+    
+    turma_ids = list(Turma.objects.filter(alunos=aluno_id, ativa=True).values_list('pk', flat=True))
+    if not turma_ids and not Aluno.objects.filter(pk=aluno_id).exists():
+        return HttpResponse(status=404)
+    return _resposta_feed_ical(request, 'aluno', aluno_id, 'Giro Dance - Minhas aulas', turma_ids)
+
+@require_http_methods(["GET", "HEAD"])
+def feed_ical_turma(request, turma_id, token):
+    """Feed .ics de uma turma (URL assinada, sem login)"""
+    if not ical.token_valido('turma', turma_id, token):
+        return HttpResponse(status=404)
+    
+    # A grade compilada vem do cache: o 304 não consulta o banco
+    grade_turma = grade.grade_da_turma(turma_id)
+    if grade_turma is None:
+        return HttpResponse(status=404)
+    return _resposta_feed_ical(request, 'turma', turma_id, f"Giro Dance - {grade_turma['nome']}", [turma_id])
+
+def _pode_ver_aula(user, aula):
+    """Equipe, professor da turma ou aluno matriculado na turma da aula"""
+    if user.is_staff or aula.turma.professor_id == user.id:
+        return True
+    return Aluno.objects.filter(usuario=user, turmas=aula.turma_id).exists()
+
+@login_required
+@require_http_methods(["GET", "HEAD"])
+def video_aula(request, aula_id, versao='original'):
+    """
+    Vídeo da aula com controle de acesso e suporte a Range (206).
+    `versao` é 'original', 'poster' ou o nome de uma VersaoVideo ('web', '480p'...).
+    """
+    aula = get_object_or_404(Aula.objects.select_related('turma'), id=aula_id)
+    if not _pode_ver_aula(request.user, aula):
+        raise PermissionDenied
+    
+    if versao == 'original':
+        arquivo = aula.video
+    elif versao == 'poster':
+        arquivo = aula.video_poster
+    else:
+        arquivo = get_object_or_404(VersaoVideo, aula=aula, nome=versao).arquivo
+    if not arquivo:
+        return HttpResponse(status=404)
+    if versao != 'poster':
+        retencao.registrar_visualizacao(aula.pk)
+    
+    return streaming.resposta_arquivo(
+        request, arquivo.path, arquivo.name, download=request.GET.get('download') == '1'
+    )
+
+def _estado_upload(upload, status=200):
+    response = JsonResponse({
+        'success': True,
+        'upload_id': str(upload.pk),
+        'status': upload.status,
+        'recebido': upload.recebido,
+        'tamanho': upload.tamanho,
+        'tamanho_parte': uploads.tamanho_maximo_parte(),
+    }, status=status)
+    response['Upload-Offset'] = str(upload.recebido)
+    return response
+
+@login_required
+@require_http_methods(["POST"])
+def iniciar_upload_video(request, aula_id):
+    """
+    Abre um upload em partes do vídeo da aula (professor da turma ou equipe).
+    Corpo: {"nome": "ensaio.mp4", "tamanho": 12345678}
+    """
+    aula = get_object_or_404(Aula.objects.select_related('turma'), id=aula_id)
+    if not (request.user.is_staff or aula.turma.professor_id == request.user.id):
+        return JsonResponse({'success': False, 'error': 'Sem permissão para esta aula.'}, status=403)
+    
+    try:
+        dados = json.loads(request.body)
+        nome, tamanho = str(dados['nome']), int(dados['tamanho'])
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'Envie {"nome": ..., "tamanho": ...}.'}, status=400)
+    
+    try:
+        upload = uploads.iniciar(aula, request.user, nome, tamanho)
+    except ValidationError as e:
+        return JsonResponse({'success': False, 'error': ' '.join(e.messages)}, status=400)
+    return _estado_upload(upload, status=201)
+
+@login_required
+@require_http_methods(["GET", "PATCH", "DELETE"])
+def parte_upload_video(request, upload_id):
+    """
+    GET: quanto já chegou (para retomar). PATCH: próxima parte no corpo, com
+    o cabeçalho Upload-Offset. DELETE: cancela o upload.
+    """
+    upload = get_object_or_404(UploadVideo, pk=upload_id)
+    if not (request.user.is_staff or upload.usuario_id == request.user.id):
+        return JsonResponse({'success': False, 'error': 'Sem permissão para este upload.'}, status=403)
+    
+    if request.method == 'GET':
+        uploads.recebido(upload)
+        return _estado_upload(upload)
+    if request.method == 'DELETE':
+        uploads.cancelar(upload)
+        return _estado_upload(upload)
+    
+    try:
+        offset = int(request.headers['Upload-Offset'])
+        tamanho_parte = int(request.META.get('CONTENT_LENGTH') or 0)
+    except (KeyError, ValueError):
+        return JsonResponse({'success': False, 'error': 'Informe o cabeçalho Upload-Offset.'}, status=400)
+    if tamanho_parte > uploads.tamanho_maximo_parte():
+        return JsonResponse({'success': False, 'error': 'Parte grande demais.'}, status=413)
+    
+    try:
+        # request.read() em blocos: o corpo não é carregado inteiro na memória
+        uploads.receber_parte(upload, offset, request, tamanho_parte)
+    except uploads.ConflitoOffset as e:
+        upload.recebido = e.recebido
+        return _estado_upload(upload, status=409)
+    except ValidationError as e:
+        return JsonResponse({'success': False, 'error': ' '.join(e.messages)}, status=400)
+    return _estado_upload(upload)
+
 @login_required
 def grafico_frequencia(request):
-    """Retorna dados para gráfico de frequência"""
+    """
+    Retorna dados para gráfico de frequência.
+
+    ?meses=6|12|24 define a janela e ?por_turma=1 inclui a quebra por turma.
+    A resposta leva ETag/Last-Modified: o polling do gráfico recebe 304
+    enquanto nenhuma frequência do aluno mudar.
+    """
     try:
         aluno = Aluno.objects.get(usuario=request.user)
-        
-        # Buscar frequências dos últimos 6 meses
+        meses = interpretar_janela(request.GET.get('meses'))
+        por_turma = request.GET.get('por_turma') in ('1', 'true', 'True')
         hoje = timezone.now().date()
-        data_inicio = hoje - timedelta(days=180)
-        
-        frequencias = Frequencia.objects.filter(
-            aluno=aluno,
-            aula__data__gte=data_inicio
-        ).select_related('aula')
-        
-        
-        dados_mensais = {}
-        for freq in frequencias:
-            mes_ano = freq.aula.data.strftime('%Y-%m')
-            if mes_ano not in dados_mensais:
-                dados_mensais[mes_ano] = {
-                    'presencas': 0,
-                    'faltas': 0,
-                    'faltas_justificadas': 0,
-                    'total': 0
-                }
-            
-            dados_mensais[mes_ano]['total'] += 1
-            if freq.status == 'PRESENTE':
-                dados_mensais[mes_ano]['presencas'] += 1
-            elif freq.status == 'FALTA':
-                dados_mensais[mes_ano]['faltas'] += 1
-            elif freq.status in ['FALTA_JUSTIFICADA', 'ATESTADO']:
-                dados_mensais[mes_ano]['faltas_justificadas'] += 1
-        
-        # Formatar para o gráfico
-        labels = []
-        presencas = []
-        faltas = []
-        
-        for mes_ano in sorted(dados_mensais.keys()):
-            # Converter string para date para formatação
-            ano, mes = mes_ano.split('-')
-            # Nomes de meses em português
-            meses_pt = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 
-                       'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
-            labels.append(f"{meses_pt[int(mes)-1]}/{ano[2:]}")
-            
-            total = dados_mensais[mes_ano]['total']
-            presencas.append(round((dados_mensais[mes_ano]['presencas'] / total) * 100, 1) if total > 0 else 0)
-            faltas.append(round((dados_mensais[mes_ano]['faltas'] / total) * 100, 1) if total > 0 else 0)
         
-        return JsonResponse({
-            'success': True,
-            'labels': labels,
-            'presencas': presencas,
-            'faltas': faltas,
-            'aluno' : aluno,
-        })
+        versao, ultima = versao_serie(aluno, meses, hoje)
+        etag = quote_etag(f"{versao}{'-t' if por_turma else ''}")
+        ultima = int(ultima.timestamp()) if ultima else None
+        
+        response = get_conditional_response(request, etag=etag, last_modified=ultima)
+        if response is None:
+            response = JsonResponse({
+                'success': True,
+                **serie_frequencia(aluno, meses, por_turma=por_turma, hoje=hoje),
+            })
+        response['ETag'] = etag
+        if ultima:
+            response['Last-Modified'] = http_date(ultima)
+        # O navegador guarda a resposta, mas sempre revalida
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
         
     except Aluno.DoesNotExist:
         return JsonResponse({
@@ -1191,7 +1139,7 @@ def minhas_vendas(request):
     """Histórico completo de vendas do usuário"""
     vendas = VendaIngresso.objects.filter(
         vendedor=request.user
-    ).select_related('evento').order_by('-data_venda')
+    ).select_related('evento')
     
     # Estatísticas gerais
     stats = vendas.aggregate(
@@ -1209,7 +1157,7 @@ def minhas_vendas(request):
     ).order_by('-total_ingressos')
     
     context = {
-        'vendas': vendas,
+        'vendas': paginar_keyset(request, vendas, ['-data_venda', '-id'], por_pagina=50),
         'stats': stats,
         'por_evento': por_evento,
     }
@@ -1348,6 +1296,9 @@ def resultados_financeiros(request):
     Acesso restrito a administradores (staff).
     Exibe resumo com gráfico e tabela de todos os meses.
     """
+    # Meses marcados como alterados são recalculados antes da leitura
+    processar_meses_pendentes()
+    
     # Filtro de mês específico (opcional)
     mes_filtro = request.GET.get('mes', None)
     
@@ -1641,13 +1592,12 @@ def despesas_administrativas(request):
     despesas_pagas = despesas.filter(status='PAGO').aggregate(Sum('valor_total'))['valor_total__sum'] or 0
     despesas_atrasadas = despesas.filter(status='ATRASADO').aggregate(Sum('valor_total'))['valor_total__sum'] or 0
     
-    # Despesas por categoria (para gráfico)
+    # Despesas por categoria (para gráfico), somadas no banco
+    nomes_categorias = dict(DespesaAdministrativa.CATEGORIA_CHOICES)
     despesas_por_categoria = {}
-    for despesa in despesas:
-        cat = despesa.categoria_display()
-        if cat not in despesas_por_categoria:
-            despesas_por_categoria[cat] = 0
-        despesas_por_categoria[cat] += float(despesa.valor_total)
+    for linha in despesas.values('categoria').annotate(total=Sum('valor_total')).order_by('categoria'):
+        cat = nomes_categorias.get(linha['categoria'], linha['categoria'])
+        despesas_por_categoria[cat] = float(linha['total'] or 0)
     
     # Preparar dados para gráfico de categorias
     categorias_labels = list(despesas_por_categoria.keys())
@@ -1676,7 +1626,7 @@ def despesas_administrativas(request):
     top_despesas = despesas.order_by('-valor_total')[:5]
     
     context = {
-        'despesas': despesas.order_by('-data_vencimento'),
+        'despesas': paginar_keyset(request, despesas, ['-data_vencimento', '-id'], por_pagina=50),
         'total_despesas': total_despesas,
         'total_pago': total_pago,
         'total_pendente': total_pendente,